@@ -1,40 +1,61 @@
+import time
+START = time.perf_counter()  # Referencia para --profile-startup
+
+import argparse
 import os
+import sys
+import threading
 import tkinter as tk
-from tkinter import messagebox, simpledialog, colorchooser, Menu
-import yaml
-from modules.database import load_notes, save_notes
-
-# Función para cargar la configuración desde un archivo YAML
-def load_config():
-    config_path = os.path.join("data", "config.yaml")
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"No se encuentra el archivo de configuración: {config_path}")
-    
-    with open(config_path, 'r') as file:
-        return yaml.safe_load(file)
-
-# Función para guardar la configuración en un archivo YAML
-def save_config(config):
-    config_path = os.path.join("data", "config.yaml")
-    with open(config_path, 'w') as file:
-        yaml.safe_dump(config, file)
+from tkinter import messagebox, simpledialog, ttk, Menu
+from modules.aggregates import format_stats
+from modules.config import load_config, save_config
+from modules.database import data_dir
+from modules.folderview import DEFAULT_SETTINGS, FolderView, settings_key
+from modules.history import History
+from modules.listview import VirtualListbox
+from modules.metrics import log, metrics, setup_logging
+from modules.profiling import StartupProfile
+from modules.revisions import format_time, revision_diff
+from modules.store import open_store
+from modules.watcher import FileWatcher
+
+# Cada cuánto se mira si el vigilante vio cambios de otro proceso
+SYNC_POLL_MS = 300
 
 class Pynote:
-    def __init__(self, root, config):
+    def __init__(self, root, config, profile=None):
         self.root = root
         self.config = config
+        self.profile = profile
         self.apply_theme(self.config['window']['theme'])  # Aplicar el tema desde la configuración
         self.root.title(self.config['window']['title'])  # Configurar el título de la ventana
         self.root.geometry(self.config['window']['size'])  # Configurar el tamaño de la ventana
         try:
             self.root.iconbitmap("icon.ico")  # Intentar cargar el ícono
         except tk.TclError as e:
-            print("Error al cargar el icono:", e)
-
-        self.notes = load_notes()  # Cargar las notas desde la base de datos
+            log.warning("Error al cargar el icono: %s", e)
+
+        # Abrir el almacén de notas configurado (data.json con diario o SQLite);
+        # las notas se cargan en segundo plano una vez que la ventana está visible
+        self.store = open_store(self.config.get('storage', {}))
+        # Los cambios de la ventana pasan por el historial para poder deshacerlos
+        history = self.config.get('history', {})
+        self.history = History(self.store, self.store.history_file(), history.get('depth', 100),
+                               history.get('max_bytes', 64 * 1024 * 1024))
+        self.loader = None
+        self.load_error = None
+        self.load_seconds = None
+        self.watcher = None  # Avisa de cambios de otras ventanas o scripts en los ficheros
         self.current_note_index = None
         self.current_folder = None
         self.folder_stack = []  # Pila para gestionar la navegación por carpetas
+        self.search_results = None  # Resultados mostrados mientras hay una búsqueda o una vista activa
+        self.results_source = None  # Función que vuelve a pedir esos resultados al almacén
+        self.clipboard = None  # (id, cortado) de lo último que se cortó o copió para pegarlo
+        self.folder_view = None  # Orden y filtro de la carpeta actual (FolderView)
+        self.folder_items = []  # Lo que muestra la lista de la carpeta actual
+        self.filter_text = ""  # Texto de la caja de búsqueda que filtra la carpeta actual
+        self.ready = False
 
         # Crear la barra de menú
         self.menu_bar = Menu(self.root)
@@ -47,11 +68,49 @@ class Pynote:
         self.file_menu.add_separator()
         self.file_menu.add_command(label="Exit", command=self.on_closing)
 
+        # Menú de edición: deshacer y rehacer los cambios, también tras reiniciar
+        self.undo_menu = Menu(self.menu_bar, tearoff=0, postcommand=self.update_undo_menu)
+        self.menu_bar.add_cascade(label="Edit", menu=self.undo_menu)
+        self.undo_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo)
+        self.undo_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo)
+        self.undo_menu.add_separator()
+        self.undo_menu.add_command(label="Paste", accelerator="Ctrl+V", command=self.paste_item)
+        self.root.bind("<Control-z>", self.undo)
+        self.root.bind("<Control-y>", self.redo)
+
         # Menú de configuración
         self.edit_menu = Menu(self.menu_bar, tearoff=0)
         self.menu_bar.add_cascade(label="Config", menu=self.edit_menu)
         self.edit_menu.add_command(label="Change Theme", command=self.change_theme)
         self.edit_menu.add_command(label="Clear all", command=self.clear_all_notes)
+        self.edit_menu.add_command(label="Storage Stats", command=self.show_storage_stats)
+
+        # Vistas de todo el árbol, servidas por los índices del almacén
+        self.view_menu = Menu(self.menu_bar, tearoff=0, postcommand=self.update_view_menu)
+        self.menu_bar.add_cascade(label="View", menu=self.view_menu)
+        self.view_menu.add_command(label="Favourites", command=self.show_favourites)
+        self.color_menu = Menu(self.view_menu, tearoff=0, postcommand=self.update_color_menu)
+        self.view_menu.add_cascade(label="By Color", menu=self.color_menu)
+
+        # Orden y filtro de la carpeta actual; cada carpeta recuerda los suyos en config.yaml
+        self.sort_var = tk.StringVar(value=DEFAULT_SETTINGS['sort'])
+        self.reverse_var = tk.BooleanVar(value=DEFAULT_SETTINGS['reverse'])
+        self.show_var = tk.StringVar(value=DEFAULT_SETTINGS['show'])
+        self.view_menu.add_separator()
+        sort_menu = Menu(self.view_menu, tearoff=0)
+        self.view_menu.add_cascade(label="Sort Folder By", menu=sort_menu)
+        for label, value in (("Manual Order", "manual"), ("Title", "title"), ("Color", "color"),
+                             ("Favourites First", "favourite"), ("Size", "size"), ("Last Modified", "modified")):
+            sort_menu.add_radiobutton(label=label, value=value, variable=self.sort_var,
+                                      command=self.change_folder_view)
+        sort_menu.add_separator()
+        sort_menu.add_checkbutton(label="Reverse", variable=self.reverse_var, command=self.change_folder_view)
+        show_menu = Menu(self.view_menu, tearoff=0)
+        self.view_menu.add_cascade(label="Show in Folder", menu=show_menu)
+        for label, value in (("Everything", "all"), ("Notes Only", "notes"), ("Folders Only", "folders"),
+                             ("Favourites Only", "favourites")):
+            show_menu.add_radiobutton(label=label, value=value, variable=self.show_var,
+                                      command=self.change_folder_view)
 
         # Crear el marco para la lista de notas
         self.notes_list_frame = tk.Frame(root)
@@ -66,14 +125,32 @@ class Pynote:
         self.back_button.pack(fill=tk.X)
         self.back_button.pack_forget()  # Ocultar el botón al inicio
 
-        # Lista de notas y carpetas
-        self.notes_listbox = tk.Listbox(self.notes_list_frame)
+        # Caja de búsqueda: al teclear filtra la carpeta actual por título y
+        # con Enter busca en todas las notas y carpetas
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(self.notes_list_frame, textvariable=self.search_var)
+        self.search_entry.pack(fill=tk.X)
+        self.search_entry.bind("<KeyRelease>", self.filter_folder)
+        self.search_entry.bind("<Return>", self.run_search)
+        self.search_entry.bind("<Escape>", self.clear_search)
+
+        # Lista de notas y carpetas (solo se dibujan las filas visibles)
+        self.notes_listbox = VirtualListbox(self.notes_list_frame)
         self.notes_listbox.pack(fill=tk.BOTH, expand=True)
         self.notes_listbox.bind("<<ListboxSelect>>", self.update_context_menu)
         self.notes_listbox.bind("<Double-1>", self.open_note_or_folder)
         self.notes_listbox.bind("<Button-3>", self.show_context_menu)
-
-        self.load_notes_list()  # Cargar la lista de notas inicial
+        self.notes_listbox.bind("<Control-x>", lambda event: self.cut_item())
+        self.notes_listbox.bind("<Control-c>", lambda event: self.copy_item())
+        self.notes_listbox.bind("<Control-v>", lambda event: self.paste_item())
+        # Arrastrar para reordenar, soltar sobre una carpeta para meterlo dentro
+        # o sobre Back para sacarlo a la carpeta de arriba; con Control se copia
+        self.notes_listbox.enable_drag(self.drop_item, lambda item: item.get('is_folder', False),
+                                       self.drop_outside)
+
+        # Indicador de carga mientras se leen las notas
+        self.loading_label = tk.Label(self.notes_list_frame, text="Loading notes...")
+        self.loading_bar = ttk.Progressbar(self.notes_list_frame, mode="indeterminate")
 
         # Menú contextual para las notas
         self.context_menu = Menu(self.root, tearoff=0)
@@ -81,9 +158,103 @@ class Pynote:
         self.fav_command_index = self.context_menu.index("end") + 1
         self.context_menu.add_command(label="Favourite", command=self.fav_note)
         self.context_menu.add_command(label="Change Color", command=self.change_color)
+        self.context_menu.add_command(label="Cut", command=self.cut_item)
+        self.context_menu.add_command(label="Copy", command=self.copy_item)
         self.context_menu.add_command(label="Delete", command=self.delete_note_or_folder)
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)  # Confirmar al cerrar la ventana
+        self.start_loading()
+
+    def set_ready(self, ready):
+        """Habilitar o deshabilitar las acciones que necesitan las notas cargadas."""
+        state = tk.NORMAL if ready else tk.DISABLED
+        self.add_button.config(state=state)
+        self.search_entry.config(state=state)
+        self.file_menu.entryconfig("New Folder", state=state)
+        self.edit_menu.entryconfig("Clear all", state=state)
+        self.edit_menu.entryconfig("Storage Stats", state=state)
+        self.menu_bar.entryconfig("View", state=state)
+        self.menu_bar.entryconfig("Edit", state=state)
+        self.ready = ready
+
+    def start_loading(self):
+        """Cargar las notas en un hilo y mostrar la lista cuando terminen."""
+        self.set_ready(False)
+        self.loading_label.pack(fill=tk.X, before=self.notes_listbox)
+        self.loading_bar.pack(fill=tk.X, before=self.notes_listbox)
+        self.loading_bar.start(10)
+        self.loader = threading.Thread(target=self.load_store, daemon=True)
+        self.loader.start()
+        self.root.after(20, self.check_loading)
+
+    def load_store(self):
+        start = time.perf_counter()
+        try:
+            self.store.load()
+            self.history.load()
+        except Exception as e:
+            # Se muestra desde el hilo de la interfaz
+            self.load_error = e
+        self.load_seconds = time.perf_counter() - start
+        metrics.record('load', self.load_seconds)
+
+    def check_loading(self):
+        if self.loader.is_alive():
+            self.root.after(20, self.check_loading)
+            return
+        self.loading_bar.stop()
+        self.loading_bar.pack_forget()
+        self.loading_label.pack_forget()
+        if self.load_error is not None:
+            messagebox.showerror("Error", f"Could not load notes: {self.load_error}")
+            return
+        self.set_ready(True)
+        self.load_notes_list()  # Cargar la lista de notas inicial
+        self.start_watching()
+        if self.store.recovered is not None:
+            messagebox.showwarning("Notes recovered",
+                                   "The notes file was damaged and has been restored from the backup of "
+                                   f"{format_time(self.store.recovered['time'])}. The damaged file was kept "
+                                   "next to it with the extension .corrupt.")
+        if self.profile is not None:
+            self.profile.add("load notes", self.load_seconds)
+            self.root.update_idletasks()
+            self.profile.mark("notes shown")
+            print(self.profile.report())
+            # Se cierra como al pulsar la X, sin lanzar la copia de seguridad en paralelo con el cierre
+            self.on_closing()
+            return
+        # Los datos se acaban de leer bien: es buen momento para la copia de seguridad, si toca
+        threading.Thread(target=self.store.backup, daemon=True).start()
+
+    def start_watching(self):
+        """Vigilar los ficheros del almacén por si otra ventana o un script los cambia."""
+        interval = self.config.get('storage', {}).get('watch_interval', 1.0)
+        self.watcher = FileWatcher(self.store.watch_paths(), interval)
+        self.root.after(SYNC_POLL_MS, self.check_external_changes)
+
+    def check_external_changes(self):
+        if self.watcher is None:
+            return
+        if self.watcher.changed():
+            with metrics.timer('sync'):
+                changed = self.store.sync()
+            if changed:
+                self.refresh_external()
+        self.root.after(SYNC_POLL_MS, self.check_external_changes)
+
+    def refresh_external(self):
+        """Volver a mostrar la carpeta actual con lo que cambió otro proceso."""
+        folder = self.current_folder
+        if folder is not None:
+            # El almacén puede haber vuelto a crear los objetos: se buscan por identificador
+            folder = self.store.get(folder['id'])
+        self.folder_stack = [None] + self.store.ancestors(folder) if folder is not None else []
+        if self.search_results is not None:
+            self.current_folder = folder
+            self.show_results(self.results_source)
+        else:
+            self.load_notes_list(folder)
 
     def apply_theme(self, theme):
         """Aplica el tema a la ventana principal."""
@@ -94,36 +265,194 @@ class Pynote:
 
     def load_notes_list(self, folder=None):
         """Carga la lista de notas y carpetas en el Listbox."""
-        self.notes_listbox.delete(0, tk.END)
+        previous = self.current_folder
+        if (folder is None) != (previous is None) or (folder is not None and folder['id'] != previous['id']):
+            # El filtro por texto es de la carpeta en la que se escribió
+            self.search_var.set("")
+        self.filter_text = self.search_var.get().strip()
         self.current_folder = folder
-
-        if folder is None:
-            items = self.notes
+        self.search_results = None
+
+        with metrics.timer('render'):
+            # Solo se leen los hijos de la carpeta que se muestra
+            settings = self.folder_settings(folder)
+            self.folder_view = FolderView(self.store, folder, settings['sort'], settings['reverse'], settings['show'])
+            self.folder_items = self.folder_view.items(self.filter_text)
+            self.update_back_button()
+
+            # La lista pide el texto de cada fila solo cuando la va a mostrar
+            self.notes_listbox.set_items(self.folder_items, self.format_item)
+        # Los títulos para filtrar se preparan cuando la ventana queda libre
+        self.root.after_idle(self.folder_view.unfiltered)
+
+    def update_back_button(self):
+        if self.current_folder is None and self.search_results is None:
             self.back_button.pack_forget()
         else:
-            items = folder.get('contents', [])
             self.back_button.pack(fill=tk.X)
 
-        for i, item in enumerate(items):
-            display_name = f"{i+1}. {item['title']}"
-            if item.get('is_folder', False):
-                display_name = f"[Folder] {item['title']}"
-            if item.get('favourite', False):
-                display_name += " ⭐"  # Añadir el emoji de estrella a las notas favoritas
-            self.notes_listbox.insert(tk.END, display_name)
-            self.notes_listbox.itemconfig(i, {'bg': item.get('color', 'white')})
+    def show_folder(self):
+        """Volver a mostrar la carpeta tras un cambio, sin moverse en la lista."""
+        self.folder_items = self.folder_view.items(self.filter_text)
+        self.notes_listbox.update_items(self.folder_items)
+
+    def select_item(self, item):
+        """Seleccionar en la lista un elemento, que puede haber cambiado de sitio."""
+        index = next((i for i, shown in enumerate(self.current_items()) if shown is item), None)
+        if index is None:
+            self.notes_listbox.selection_clear()
+        else:
+            self.notes_listbox.selection_set(index)
+            self.notes_listbox.see(index)
+
+    def item_changed(self, item, index=None):
+        """Volver a colocar en la lista lo que cambió (o la carpeta de la lista que lo contiene)."""
+        if self.search_results is not None:
+            if index is None:
+                self.notes_listbox.refresh()
+            else:
+                self.notes_listbox.update_row(index)
+            return
+        chain = self.store.ancestors(item) + [item]
+        depth = 0 if self.current_folder is None else next(
+            (i + 1 for i, folder in enumerate(chain) if folder['id'] == self.current_folder['id']), len(chain))
+        if depth < len(chain):
+            # Un cambio dentro de una subcarpeta cambia sus totales, y con ellos su sitio
+            self.folder_view.update(chain[depth])
+        self.show_folder()
+        if depth == len(chain) - 1:
+            self.select_item(item)
+
+    def folder_settings(self, folder):
+        """Orden y filtro guardados para una carpeta en config.yaml."""
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(self.config.get('folders', {}).get(settings_key(folder), {}))
+        return settings
+
+    def update_view_menu(self):
+        """Marcar en el menú el orden y el filtro de la carpeta actual."""
+        settings = self.folder_settings(self.current_folder)
+        self.sort_var.set(settings['sort'])
+        self.reverse_var.set(settings['reverse'])
+        self.show_var.set(settings['show'])
+
+    def change_folder_view(self):
+        """Guardar el orden o filtro elegido para la carpeta actual y volver a mostrarla."""
+        settings = {'sort': self.sort_var.get(), 'reverse': self.reverse_var.get(), 'show': self.show_var.get()}
+        folders = self.config.setdefault('folders', {})
+        key = settings_key(self.current_folder)
+        if settings == DEFAULT_SETTINGS:
+            folders.pop(key, None)
+        else:
+            folders[key] = settings
+        save_config(self.config)
+        self.load_notes_list(self.current_folder)
+
+    def filter_folder(self, event=None):
+        """Filtrar la carpeta actual por título mientras se escribe."""
+        text = self.search_var.get().strip()
+        if text == self.filter_text or not self.ready:
+            return
+        self.filter_text = text
+        self.search_results = None
+        with metrics.timer('filter'):
+            self.folder_items = self.folder_view.items(text)
+            self.notes_listbox.set_items(self.folder_items, self.format_item)
+            self.update_back_button()
+
+    def format_item(self, i, item):
+        """Texto y color de fondo de una fila de la lista."""
+        metrics.count('rows_rendered')
+        display_name = f"{i+1}. {item['title']}"
+        if item.get('is_folder', False):
+            # Los totales se mantienen al día con cada cambio: no hay que recorrer la carpeta
+            display_name = f"[Folder] {item['title']}  ({format_stats(self.store.folder_stats(item))})"
+        if item.get('favourite', False):
+            display_name += " ⭐"  # Añadir el emoji de estrella a las notas favoritas
+        return display_name, item.get('color', 'white')
+
+    def format_search_result(self, i, item):
+        """Texto de un resultado de búsqueda, con la ruta de su carpeta."""
+        display_name, color = self.format_item(i, item)
+        path = "/".join(folder['title'] for folder in self.store.ancestors(item))
+        return f"{display_name}  ({path or '/'})", color
+
+    def current_items(self):
+        """Elementos de la carpeta (o de la búsqueda) que se está mostrando."""
+        if self.search_results is not None:
+            return self.search_results
+        return self.folder_items
+
+    def run_search(self, event=None):
+        """Buscar en todas las notas y carpetas y mostrar los resultados."""
+        query = self.search_var.get().strip()
+        if not query:
+            self.clear_search()
+            return
+        with metrics.timer('search'):
+            self.show_results(lambda: self.store.search(query))
+
+    def show_results(self, source):
+        """Mostrar elementos de cualquier carpeta (una búsqueda o una vista) con su ruta."""
+        self.results_source = source
+        self.search_results = source()
+        self.notes_listbox.set_items(self.search_results, self.format_search_result)
+        self.update_back_button()
+
+    def show_favourites(self):
+        """Mostrar todas las notas y carpetas favoritas."""
+        self.search_var.set("")
+        with metrics.timer('view'):
+            self.show_results(self.store.favourites)
+
+    def show_color(self, color):
+        """Mostrar todas las notas y carpetas de un color."""
+        self.search_var.set("")
+        with metrics.timer('view'):
+            self.show_results(lambda: self.store.by_color(color))
+
+    def update_color_menu(self):
+        """Rehacer el submenú de colores con los que están en uso al abrirlo."""
+        self.color_menu.delete(0, "end")
+        colors = sorted(self.store.colors().items(), key=lambda pair: (-pair[1], pair[0]))
+        for color, count in colors:
+            command = lambda color=color: self.show_color(color)
+            try:
+                self.color_menu.add_command(label=f"{color} ({count})", background=color, command=command)
+            except tk.TclError:
+                # Un color que Tk no entiende (escrito por otro programa) se muestra sin muestra
+                self.color_menu.add_command(label=f"{color} ({count})", command=command)
+        if not colors:
+            self.color_menu.add_command(label="No colors yet", state=tk.DISABLED)
+
+    def clear_search(self, event=None):
+        """Salir de la búsqueda y volver a la carpeta actual."""
+        self.search_var.set("")
+        self.load_notes_list(self.current_folder)
+
+    def refresh_after_delete(self, item):
+        """Quitar de la vista lo eliminado, repitiendo la búsqueda si la hay."""
+        if self.search_results is None:
+            self.folder_view.remove(item)
+            self.show_folder()
+        else:
+            self.show_results(self.results_source)
+
+    def refresh_after_add(self, item):
+        """Mostrar el elemento recién creado, saliendo de la búsqueda o del filtro si los hay."""
+        if self.search_results is None and not self.filter_text:
+            if item is not None:
+                self.folder_view.add(item)
+            self.show_folder()
+        else:
+            self.clear_search()
 
     def add_note(self):
         """Agregar una nueva nota."""
         title = simpledialog.askstring("New Note", "Enter note title:")
         if title:
             new_note = {"title": title, "content": "", "color": "white", "favourite": False}
-            if self.current_folder is None:
-                self.notes.append(new_note)
-            else:
-                self.current_folder['contents'].append(new_note)
-            self.load_notes_list(self.current_folder)
-            save_notes(self.notes)
+            self.refresh_after_add(self.history.add(self.current_folder, new_note))
 
     def rename_note(self):
         """Renombrar una nota existente."""
@@ -132,16 +461,12 @@ class Pynote:
             return
 
         index = selection[0]
-        if self.current_folder is None:
-            item = self.notes[index]
-        else:
-            item = self.current_folder['contents'][index]
+        item = self.current_items()[index]
 
         new_title = simpledialog.askstring("Rename Note", "Enter new title:", initialvalue=item['title'])
         if new_title:
-            item['title'] = new_title
-            self.load_notes_list(self.current_folder)
-            save_notes(self.notes)
+            self.history.update(item, title=new_title)
+            self.item_changed(item, index)
 
     def fav_note(self):
         """Marcar o desmarcar una nota como favorita."""
@@ -150,15 +475,11 @@ class Pynote:
             return
 
         index = selection[0]
-        if self.current_folder is None:
-            item = self.notes[index]
-        else:
-            item = self.current_folder['contents'][index]
+        item = self.current_items()[index]
 
         # Marca o desmarca la nota como favorita
-        item['favourite'] = not item.get('favourite', False)
-        self.load_notes_list(self.current_folder)
-        save_notes(self.notes)
+        self.history.update(item, favourite=not item.get('favourite', False))
+        self.item_changed(item, index)
         self.update_context_menu()
 
     def update_context_menu(self, event=None):
@@ -168,10 +489,7 @@ class Pynote:
             return
 
         index = selection[0]
-        if self.current_folder is None:
-            item = self.notes[index]
-        else:
-            item = self.current_folder['contents'][index]
+        item = self.current_items()[index]
 
         fav_label = "Unfavourite" if item.get('favourite', False) else "Favourite"
         self.context_menu.entryconfig(self.fav_command_index, label=fav_label)
@@ -183,16 +501,99 @@ class Pynote:
             return
 
         index = selection[0]
-        if self.current_folder is None:
-            item = self.notes[index]
-        else:
-            item = self.current_folder['contents'][index]
+        item = self.current_items()[index]
 
+        from tkinter import colorchooser  # Se importa al usarlo por primera vez
         color = colorchooser.askcolor()[1]
         if color:
-            item['color'] = color
-            self.load_notes_list(self.current_folder)
-            save_notes(self.notes)
+            self.history.update(item, color=color)
+            self.item_changed(item, index)
+
+    def selected_item(self):
+        selection = self.notes_listbox.curselection()
+        return self.current_items()[selection[0]] if selection else None
+
+    def cut_item(self):
+        """Recordar el elemento seleccionado para moverlo al pegar en otra carpeta."""
+        item = self.selected_item()
+        if item is not None:
+            self.clipboard = (item['id'], True)
+
+    def copy_item(self):
+        """Recordar el elemento seleccionado para pegar una copia."""
+        item = self.selected_item()
+        if item is not None:
+            self.clipboard = (item['id'], False)
+
+    def paste_item(self):
+        """Mover o copiar al final de la carpeta actual lo que se cortó o copió."""
+        if not self.ready or self.clipboard is None:
+            return
+        item_id, cut = self.clipboard
+        item = self.store.get(item_id)
+        if item is None:
+            # Se borró desde que se cortó
+            self.clipboard = None
+            return
+        if self.search_results is not None:
+            self.clear_search()
+        if self.transfer(item, self.current_folder, None, copy=not cut) and cut:
+            self.clipboard = None
+
+    def drop_item(self, source, index, into, copy):
+        """Soltar una fila arrastrada en otra posición o dentro de una carpeta."""
+        if not self.ready:
+            return
+        items = self.current_items()
+        item = items[source]
+        if into:
+            folder, index = items[index], None
+        elif self.search_results is not None or self.filter_text or not self.folder_view.manual():
+            # Los resultados mezclan carpetas y una carpeta ordenada o filtrada
+            # no muestra su orden: solo se puede reordenar la lista tal cual
+            return
+        else:
+            folder = self.current_folder
+        self.transfer(item, folder, index, copy)
+
+    def drop_outside(self, source, widget, copy):
+        """Soltar una fila sobre Back la saca a la carpeta que contiene a la actual."""
+        if not self.ready or widget is not self.back_button:
+            return
+        if self.search_results is not None or self.current_folder is None:
+            return
+        ancestors = self.store.ancestors(self.current_folder)
+        self.transfer(self.current_items()[source], ancestors[-1] if ancestors else None, None, copy)
+
+    def transfer(self, item, folder, index, copy=False):
+        """Mover (o copiar) un elemento a una carpeta; devuelve False si no se pudo."""
+        try:
+            if copy:
+                item = self.history.copy(item, folder, index)
+            else:
+                self.history.move(item, folder, index)
+        except ValueError:
+            messagebox.showerror("Move", "A folder cannot be moved or copied into itself")
+            return False
+        # Solo cambian la carpeta de origen y la de destino; la pila de
+        # navegación se recalcula por si se movió una carpeta que la contiene
+        current = self.current_folder
+        self.folder_stack = [None] + self.store.ancestors(current) if current is not None else []
+        if self.search_results is not None:
+            self.show_results(self.results_source)
+            return True
+        if not copy:
+            self.folder_view.remove(item)
+        if item is not None and folder is current:
+            self.folder_view.add(item)
+        if folder is not None:
+            # Los totales de la carpeta destino cambiaron (si está en la lista)
+            self.folder_view.update(folder)
+        self.notes_listbox.selection_clear()
+        self.show_folder()
+        if item is not None and folder is current:
+            self.select_item(item)
+        return True
 
     def open_note_or_folder(self, event=None):
         """Abrir una nota o carpeta al hacer doble clic."""
@@ -201,60 +602,125 @@ class Pynote:
             return
 
         index = selection[0]
-        if self.current_folder is None:
-            item = self.notes[index]
-        else:
-            item = self.current_folder['contents'][index]
+        item = self.current_items()[index]
 
         if item.get('is_folder', False):
-            self.folder_stack.append(self.current_folder)
+            if self.search_results is not None:
+                # Desde una búsqueda se entra con la pila de carpetas completa
+                self.folder_stack = [None] + self.store.ancestors(item)
+                self.search_var.set("")
+            else:
+                self.folder_stack.append(self.current_folder)
             self.load_notes_list(item)
         else:
-            self.open_note_editor(index, item)
+            self.open_note_editor(item)
 
     def go_back(self):
         """Volver a la carpeta anterior en la pila."""
-        if self.folder_stack:
+        if self.search_results is not None:
+            self.clear_search()
+        elif self.folder_stack:
             self.load_notes_list(self.folder_stack.pop())
 
-    def open_note_editor(self, index, note):
+    def open_note_editor(self, note):
         """Abrir el editor para una nota específica."""
+        # La nota se vuelve a buscar por su id al guardar, por si se borró mientras tanto
+        note_id = note["id"]
+        start = time.perf_counter()
         editor_window = tk.Toplevel(self.root)
         editor_window.title(note["title"])
         editor_window.geometry(self.config['editor']['size'])
         self.apply_theme_to_editor(editor_window, self.config['window']['theme'])
 
+        title = note["title"]
+        color = note.get("color", "white")
         note_text = tk.Text(editor_window, wrap=tk.WORD, font=self.config['editor']['font'])
-        note_text.grid(row=0, column=0, columnspan=3, sticky="nsew", padx=5, pady=5)
-        note_text.insert(tk.END, note["content"])
-        note_text.configure(bg=note.get("color", "white"))
+        note_text.grid(row=0, column=0, columnspan=4, sticky="nsew", padx=5, pady=5)
+        note_text.configure(bg=color)
 
         editor_window.grid_rowconfigure(0, weight=1)
         editor_window.grid_columnconfigure(0, weight=1)
 
+        # Las notas grandes se insertan por trozos para que la ventana no se congele
+        content = self.store.content(note)
+        chunk_chars = self.config['editor'].get('chunk_chars', 65536)
+        loader = {'job': None, 'content': content}
+
+        def finish_loading():
+            loader['job'] = loader['content'] = None
+            note_text.configure(state=tk.NORMAL)
+            # A partir de aquí el indicador de modificación solo refleja lo que teclea el usuario
+            note_text.edit_modified(False)
+            editor_window.title(title)
+            metrics.record('editor_loaded', time.perf_counter() - start)
+
+        def load_chunk(position):
+            text = loader['content']
+            note_text.configure(state=tk.NORMAL)
+            note_text.insert(tk.END, text[position:position + chunk_chars])
+            note_text.configure(state=tk.DISABLED)
+            position += chunk_chars
+            if position < len(text):
+                loader['job'] = editor_window.after(1, load_chunk, position)
+            else:
+                finish_loading()
+
+        if len(content) > self.config['editor'].get('large_note_chars', 262144):
+            editor_window.title(f"{title} (loading...)")
+            note_text.configure(state=tk.DISABLED)
+            loader['job'] = editor_window.after(1, load_chunk, 0)
+        else:
+            note_text.insert(tk.END, content)
+            finish_loading()
+        metrics.record('editor_open', time.perf_counter() - start)
+
+        def on_modified(event=None):
+            if loader['job'] is None and note_text.edit_modified():
+                editor_window.title(f"*{title}")
+
+        note_text.bind("<<Modified>>", on_modified)
+
+        def close_editor():
+            if loader['job'] is not None:
+                editor_window.after_cancel(loader['job'])
+                loader['job'] = None
+            editor_window.destroy()
+
         def save_note():
             """Guardar los cambios realizados en la nota."""
-            note["content"] = note_text.get(1.0, tk.END).strip()
-            note["color"] = note_text.cget("bg")
-            save_notes(self.notes)
-            self.load_notes_list(self.current_folder)
-            editor_window.destroy()
+            fields = {}
+            # Sin cambios (o cerrado a medio cargar) no se copia ni se vuelve a guardar el texto
+            if loader['job'] is None and note_text.edit_modified():
+                fields['content'] = note_text.get(1.0, "end-1c").strip()
+            if note_text.cget("bg") != color:
+                fields['color'] = note_text.cget("bg")
+            if not fields:
+                close_editor()
+                return
+            note = self.store.get(note_id)
+            if note is None:
+                close_editor()
+                messagebox.showwarning("Warning", "This note no longer exists")
+                return
+            with metrics.timer('editor_save'):
+                self.history.update(note, **fields)
+            self.item_changed(note)
+            close_editor()
             messagebox.showinfo("Success", "Note saved successfully")
 
         def delete_note():
             """Eliminar la nota actual."""
             if messagebox.askyesno("Delete Note", "Are you sure you want to delete this note?"):
-                if self.current_folder is None:
-                    del self.notes[index]
-                else:
-                    del self.current_folder['contents'][index]
-                self.load_notes_list(self.current_folder)
-                save_notes(self.notes)
-                editor_window.destroy()
+                note = self.store.get(note_id)
+                if note is not None:
+                    self.history.delete(note)
+                    self.refresh_after_delete(note)
+                close_editor()
                 messagebox.showinfo("Success", "Note deleted successfully")
 
         def choose_color():
             """Elegir un nuevo color de fondo para la nota."""
+            from tkinter import colorchooser
             color = colorchooser.askcolor()[1]
             if color:
                 note_text.configure(bg=color)
@@ -269,8 +735,89 @@ class Pynote:
         color_button = tk.Button(editor_window, text="Choose Color", command=choose_color)
         color_button.grid(row=1, column=2, sticky="ew", padx=5, pady=5)
 
+        def show_revisions():
+            if loader['job'] is None:
+                self.open_revisions(editor_window, note_id, note_text)
+
+        history_button = tk.Button(editor_window, text="History", command=show_revisions,
+                                   state=tk.NORMAL if self.store.revisions is not None else tk.DISABLED)
+        history_button.grid(row=1, column=3, sticky="ew", padx=5, pady=5)
+
         editor_window.protocol("WM_DELETE_WINDOW", save_note)  # Guardar la nota al cerrar el editor
 
+    def open_revisions(self, editor_window, note_id, note_text):
+        """Ventana con las versiones anteriores de la nota del editor para compararlas y recuperarlas."""
+        note = self.store.get(note_id)
+        if note is None:
+            return
+        revisions = self.store.revisions
+        with metrics.timer('revisions_open'):
+            versions = revisions.versions(note_id)
+            texts = revisions.texts(note_id, versions) if versions else []
+        window = tk.Toplevel(editor_window)
+        window.title(f"History of '{note['title']}'")
+        window.geometry("600x400")
+        window.grid_rowconfigure(0, weight=1)
+        window.grid_columnconfigure(1, weight=1)
+
+        version_list = tk.Listbox(window, exportselection=False, width=24)
+        version_list.grid(row=0, column=0, sticky="ns", padx=5, pady=5)
+        diff_text = tk.Text(window, wrap=tk.NONE, font=self.config['editor']['font'])
+        diff_text.grid(row=0, column=1, columnspan=2, sticky="nsew", padx=5, pady=5)
+        diff_text.tag_configure("added", foreground="#008000")
+        diff_text.tag_configure("removed", foreground="#c00000")
+        compare_current = tk.BooleanVar(value=False)
+
+        # La más nueva arriba
+        for version in reversed(versions):
+            version_list.insert(tk.END, f"{format_time(version.time)}  ({version.chars} chars)")
+        if not versions:
+            diff_text.insert(tk.END, "This note has no earlier versions yet.")
+
+        def selected():
+            selection = version_list.curselection()
+            return len(versions) - 1 - selection[0] if selection else None
+
+        def show_diff(event=None):
+            number = selected()
+            if number is None:
+                return
+            # Lo que cambió esa versión, o lo que la separa del texto del editor
+            if compare_current.get():
+                old, new = texts[number], note_text.get(1.0, "end-1c")
+                labels = (f"version {number}", "editor")
+            else:
+                old, new = texts[number - 1] if number else "", texts[number]
+                labels = (f"version {number - 1}" if number else "empty", f"version {number}")
+            diff_text.configure(state=tk.NORMAL)
+            diff_text.delete(1.0, tk.END)
+            lines = revision_diff(old, new, *labels)
+            for line in lines:
+                tag = "added" if line.startswith('+') else "removed" if line.startswith('-') else ()
+                diff_text.insert(tk.END, line, tag)
+            if not lines:
+                diff_text.insert(tk.END, "No differences.")
+            diff_text.configure(state=tk.DISABLED)
+
+        def restore():
+            number = selected()
+            if number is None:
+                return
+            # Se lleva al editor sin guardar: al guardar queda como una versión más
+            note_text.delete(1.0, tk.END)
+            note_text.insert(tk.END, texts[number])
+            note_text.edit_modified(True)
+            window.destroy()
+
+        version_list.bind("<<ListboxSelect>>", show_diff)
+        tk.Checkbutton(window, text="Compare with editor", variable=compare_current,
+                       command=show_diff).grid(row=1, column=0, sticky="w", padx=5, pady=5)
+        tk.Button(window, text="Restore", command=restore).grid(row=1, column=1, sticky="e", padx=5, pady=5)
+        tk.Button(window, text="Close", command=window.destroy).grid(row=1, column=2, sticky="ew", padx=5, pady=5)
+        if versions:
+            version_list.selection_set(0)
+            show_diff()
+
     def apply_theme_to_editor(self, window, theme):
         """Aplicar el tema al editor de notas."""
         if theme == "dark":
@@ -294,12 +841,7 @@ class Pynote:
         folder_name = simpledialog.askstring("New Folder", "Enter folder name:")
         if folder_name:
             new_folder = {"title": folder_name, "is_folder": True, "contents": [], "color": "white"}
-            if self.current_folder is None:
-                self.notes.append(new_folder)
-            else:
-                self.current_folder['contents'].append(new_folder)
-            self.load_notes_list(self.current_folder)
-            save_notes(self.notes)
+            self.refresh_after_add(self.history.add(self.current_folder, new_folder))
 
     def delete_note_or_folder(self):
         """Eliminar la nota o carpeta seleccionada."""
@@ -308,23 +850,70 @@ class Pynote:
             return
 
         index = selection[0]
-        if self.current_folder is None:
-            item_list = self.notes
-        else:
-            item_list = self.current_folder['contents']
+        item = self.current_items()[index]
 
-        if messagebox.askyesno("Delete", f"Are you sure you want to delete '{item_list[index]['title']}'?"):
-            del item_list[index]
-            self.load_notes_list(self.current_folder)
-            save_notes(self.notes)
+        if messagebox.askyesno("Delete", f"Are you sure you want to delete '{item['title']}'?"):
+            self.history.delete(item)
+            self.notes_listbox.selection_clear()
+            self.refresh_after_delete(item)
 
     def clear_all_notes(self):
         """Eliminar todas las notas y carpetas."""
         if messagebox.askyesno("Delete All", "Are you sure you want to delete all notes and folders?"):
-            self.notes.clear()
+            self.history.clear()
+            self.folder_stack = []
+            self.search_var.set("")
             self.load_notes_list()
-            save_notes(self.notes)
-            messagebox.showinfo("Success", "All notes and folders have been deleted")
+            messagebox.showinfo("Success", "All notes and folders have been deleted (Edit > Undo restores them)")
+
+    def undo(self, event=None):
+        """Deshacer el último cambio."""
+        self.step_history(self.history.undo, "Undo")
+
+    def redo(self, event=None):
+        """Rehacer el último cambio deshecho."""
+        self.step_history(self.history.redo, "Redo")
+
+    def step_history(self, step, title):
+        if not self.ready:
+            return
+        result = step()
+        if result is None:
+            return
+        label, skipped = result
+        # Lo deshecho puede estar en cualquier carpeta: se vuelve a pedir todo por identificador
+        self.refresh_external()
+        if skipped:
+            messagebox.showwarning(title, f"Part of \"{label}\" could not be applied because "
+                                          "the notes it refers to were changed elsewhere")
+
+    def update_undo_menu(self):
+        """Poner en el menú qué cambio se deshace o rehace y si hay algo que pegar."""
+        for index, label, title in ((0, self.history.label(True), "Undo"), (1, self.history.label(False), "Redo")):
+            if label is None:
+                self.undo_menu.entryconfig(index, label=title, state=tk.DISABLED)
+            else:
+                self.undo_menu.entryconfig(index, label=f"{title} {label}", state=tk.NORMAL)
+        self.undo_menu.entryconfig("Paste", state=tk.DISABLED if self.clipboard is None else tk.NORMAL)
+
+    def show_storage_stats(self):
+        """Mostrar las métricas del almacén y los tiempos de las operaciones."""
+        stats = self.store.stats()
+        lines = [f"{key}: {value}" for key, value in stats.items()]
+        timings = metrics.report()
+        if timings:
+            lines += [""] + timings
+        messagebox.showinfo("Storage Stats", "\n".join(lines) or "No stats available")
+
+    def export_metrics(self):
+        """Guardar las métricas en el fichero indicado en la configuración, si lo hay."""
+        path = self.config.get('logging', {}).get('metrics_file')
+        if not path:
+            return
+        try:
+            metrics.export(os.path.join(data_dir, os.path.expanduser(path)))
+        except (IOError, OSError) as e:
+            log.error("No se pudieron guardar las métricas: %s", e)
 
     def show_context_menu(self, event):
         """Mostrar el menú contextual al hacer clic derecho."""
@@ -337,15 +926,46 @@ class Pynote:
 
     def on_closing(self):
         """Guardar las notas y cerrar la aplicación."""
-        save_notes(self.notes)
+        if self.loader is not None and self.loader.is_alive():
+            # No se puede cerrar el almacén a medio cargar
+            self.root.after(50, self.on_closing)
+            return
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        self.store.close()
+        self.export_metrics()
         self.root.destroy()
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Pynote")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each startup phase takes and exit")
+    parser.add_argument("--startup-budget", type=float, metavar="MS",
+                        help="with --profile-startup, exit with status 1 if startup takes longer")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    profile = StartupProfile(START) if args.profile_startup else None
+    if profile is not None:
+        profile.mark("imports")
     try:
         config = load_config()  # Cargar la configuración al iniciar
+        setup_logging(config.get('logging', {}), data_dir)
+        if profile is not None:
+            profile.mark("config")
         root = tk.Tk()
-        app = Pynote(root, config)
+        if profile is not None:
+            profile.mark("tk init")
+        app = Pynote(root, config, profile)
+        if profile is not None:
+            profile.mark("build ui")
+            root.after_idle(profile.mark, "window shown")
         root.mainloop()  # Iniciar el bucle principal de la aplicación
     except FileNotFoundError as e:
-        print(e)
-        messagebox.showerror("Error", f"Error: {e}")
\ No newline at end of file
+        log.error("%s", e)
+        messagebox.showerror("Error", f"Error: {e}")
+    if profile is not None and args.startup_budget is not None and profile.total() * 1000 > args.startup_budget:
+        print(f"Arranque por encima del presupuesto de {args.startup_budget:.0f} ms")
+        sys.exit(1)
\ No newline at end of file
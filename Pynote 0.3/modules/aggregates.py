@@ -0,0 +1,75 @@
+import time
+from collections import namedtuple
+
+# Totales de una carpeta, con todo lo que contiene a cualquier profundidad:
+# notas, bytes de contenido en UTF-8, elementos favoritos (notas o carpetas)
+# y fecha del último cambio (segundos desde 1970, 0 si no se sabe). Cada
+# carpeta los guarda en su campo 'stats' como lista; el árbol los mantiene
+# al aplicar cada cambio, así que nunca hace falta recorrerlo para saberlos.
+FolderStats = namedtuple('FolderStats', 'notes bytes favourites modified')
+EMPTY = FolderStats(0, 0, 0, 0)
+
+
+def now():
+    """Marca de tiempo que se guarda en 'modified' y en los registros del diario."""
+    return int(time.time())
+
+
+def timestamp(item):
+    value = item.get('modified')
+    return value if type(value) in (int, float) else 0
+
+
+def note_size(item):
+    """Bytes del texto de una nota, sin leerlo de disco si aún no está cargado."""
+    content = item.get('content')
+    if type(content) is str:
+        return len(content) if content.isascii() else len(content.encode('utf-8'))
+    body = item.get('body')
+    if not body:
+        return 0
+    # Una referencia comprimida lleva al final el tamaño sin comprimir (modules.codec)
+    return body[3] if len(body) > 3 else body[1]
+
+
+def folder_stats(folder):
+    stats = folder.get('stats')
+    return FolderStats(*stats) if stats else EMPTY
+
+
+def item_stats(item):
+    """Lo que un elemento suma a los totales de las carpetas que lo contienen."""
+    favourite = 1 if item.get('favourite', False) is True else 0
+    if item.get('is_folder', False):
+        notes, size, favourites, modified = folder_stats(item)
+        return FolderStats(notes, size, favourites + favourite, max(modified, timestamp(item)))
+    return FolderStats(1, note_size(item), favourite, timestamp(item))
+
+
+def total(stats):
+    """Suma una secuencia de totales."""
+    notes = size = favourites = modified = 0
+    for item in stats:
+        notes += item.notes
+        size += item.bytes
+        favourites += item.favourites
+        modified = max(modified, item.modified)
+    return FolderStats(notes, size, favourites, modified)
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def format_stats(stats):
+    """Resumen de una carpeta para la lista: "12 notes, 4.1 KB, 2 ⭐, 2024-05-01"."""
+    parts = [f"{stats.notes} note" if stats.notes == 1 else f"{stats.notes} notes", format_size(stats.bytes)]
+    if stats.favourites:
+        parts.append(f"{stats.favourites} ⭐")
+    if stats.modified:
+        parts.append(time.strftime("%Y-%m-%d", time.localtime(stats.modified)))
+    return ", ".join(parts)
@@ -0,0 +1,210 @@
+from modules.aggregates import FolderStats
+from modules.config import load_config
+from modules.store import open_store
+
+
+# Las notas y carpetas se indican con la ruta de títulos desde la raíz,
+# separados por '/' ('Work/Projects/Q3'); '' es la raíz. Con títulos
+# repetidos gana el primero, así que para no depender de eso se puede usar
+# 'id:<identificador>'.
+SORT_KEYS = ('title',) + FolderStats._fields
+
+
+def find(store, path):
+    """Elemento con esa ruta (None es la raíz)."""
+    if path.startswith('id:'):
+        item = store.get(path[3:])
+        if item is None:
+            raise ValueError(f"No existe: {path}")
+        return item
+    item = None
+    for title in split_path(path):
+        if item is not None and not item.get('is_folder', False):
+            raise ValueError(f"No es una carpeta: {item['title']}")
+        item = next((child for child in store.children(item) if child['title'] == title), None)
+        if item is None:
+            raise ValueError(f"No existe: {path}")
+    return item
+
+
+def find_folder(store, path, create=False):
+    """Carpeta con esa ruta; con `create` se crean las que falten."""
+    if not create or path.startswith('id:'):
+        folder = find(store, path)
+        if folder is not None and not folder.get('is_folder', False):
+            raise ValueError(f"No es una carpeta: {path}")
+        return folder
+    folder = None
+    for title in split_path(path):
+        match = next((item for item in store.children(folder)
+                      if item.get('is_folder', False) and item['title'] == title), None)
+        if match is None:
+            match = store.add(folder, {'title': title, 'is_folder': True, 'contents': []})
+        folder = match
+    return folder
+
+
+def split_path(path):
+    return [part for part in path.split('/') if part]
+
+
+def path_of(store, item):
+    return '/'.join([folder['title'] for folder in store.ancestors(item)] + [item['title']])
+
+
+class Notes:
+    """Acceso a las notas sin interfaz gráfica, para scripts y la orden pynote.
+
+    Abre el almacén de la configuración (o el que se le pase ya cargado) y
+    ofrece las mismas operaciones que la ventana sobre rutas de títulos.
+    Los cambios se guardan como en la aplicación; con batch() muchos
+    cambios seguidos se escriben de una vez. Se usa como gestor de
+    contexto para cerrar el almacén al terminar:
+
+        with Notes() as notes:
+            for note in notes.list('Work'):
+                notes.color('Work/' + note['title'], 'yellow')
+    """
+
+    def __init__(self, store=None):
+        if store is None:
+            store = open_store(load_config().get('storage', {}))
+            store.load()
+        self.store = store
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.store.close()
+
+    def batch(self):
+        return self.store.batch()
+
+    def find(self, path):
+        item = find(self.store, path)
+        if item is None:
+            raise ValueError("La raíz no es una nota ni una carpeta")
+        return item
+
+    def path(self, item):
+        return path_of(self.store, item)
+
+    def list(self, path='', sort=None, reverse=False):
+        """Notas y carpetas de una carpeta.
+
+        `sort` ordena por 'title' o por uno de los totales de FolderStats
+        ('notes', 'bytes', 'favourites', 'modified'); una nota cuenta como
+        una carpeta con solo ella dentro.
+        """
+        folder = find_folder(self.store, path)
+        items = list(self.store.children(folder))
+        if sort is None:
+            return items[::-1] if reverse else items
+        if sort not in SORT_KEYS:
+            raise ValueError(f"No se puede ordenar por {sort}")
+        if sort == 'title':
+            keys = [item['title'].lower() for item in items]
+        else:
+            keys = [getattr(stats, sort) for stats in self.store.children_stats(folder)]
+        order = sorted(range(len(items)), key=keys.__getitem__, reverse=reverse)
+        return [items[i] for i in order]
+
+    def stats(self, path=''):
+        """Totales (FolderStats) de una carpeta, o lo que suma una nota."""
+        item = find(self.store, path)
+        if item is None or item.get('is_folder', False):
+            return self.store.folder_stats(item)
+        return self.store.item_stats(item)
+
+    def content(self, path):
+        return self.store.content(self.find(path))
+
+    def add(self, path, title, content='', folder=False, color=None):
+        """Crea una nota (o una carpeta) dentro de la carpeta `path` y la devuelve."""
+        item = {'title': title, 'is_folder': True, 'contents': []} if folder else {'title': title, 'content': content}
+        if color is not None:
+            item['color'] = color
+        return self.store.add(find_folder(self.store, path), item)
+
+    def rename(self, path, title):
+        self.store.update(self.find(path), title=title)
+
+    def edit(self, path, content):
+        item = self.find(path)
+        if item.get('is_folder', False):
+            raise ValueError(f"Es una carpeta: {path}")
+        self.store.update(item, content=content)
+
+    def revisions(self, path):
+        """Versiones anteriores del texto de una nota (Revision), de la más antigua a la más nueva."""
+        item = self.find(path)
+        if self.store.revisions is None:
+            return []
+        return self.store.revisions.versions(item['id'])
+
+    def revision(self, path, number):
+        """Texto de la versión `number` (contando desde 0, como revisions())."""
+        item = self.find(path)
+        versions = self.revisions(path)
+        if not 0 <= number < len(versions):
+            raise ValueError(f"No existe la versión {number} de {path}")
+        return self.store.revisions.text(item['id'], number)
+
+    def restore(self, path, number):
+        """Vuelve al texto de una versión; el texto actual queda como una versión más."""
+        self.edit(path, self.revision(path, number))
+
+    def move(self, path, destination, index=None):
+        self.store.move(self.find(path), find_folder(self.store, destination), index)
+
+    def copy(self, path, destination, index=None):
+        """Copia una nota o una carpeta entera en `destination` y devuelve la copia."""
+        return self.store.copy(self.find(path), find_folder(self.store, destination), index)
+
+    def reorder(self, path, index):
+        """Cambia la posición de un elemento dentro de su carpeta."""
+        item = self.find(path)
+        ancestors = self.store.ancestors(item)
+        self.store.move(item, ancestors[-1] if ancestors else None, index)
+
+    def favourite(self, path, value=True):
+        self.store.update(self.find(path), favourite=value)
+
+    def color(self, path, color):
+        self.store.update(self.find(path), color=color)
+
+    def delete(self, path):
+        self.store.delete(self.find(path))
+
+    def search(self, query, limit=50):
+        return self.store.search(query, limit)
+
+    def favourites(self):
+        """Todas las notas y carpetas favoritas, por título."""
+        return self.store.favourites()
+
+    def colors(self):
+        """Colores usados (salvo el blanco por defecto) y cuántos elementos tiene cada uno."""
+        return self.store.colors()
+
+    def by_color(self, color):
+        return self.store.by_color(color)
+
+    def backup(self):
+        """Hace ya una copia de seguridad de los datos y devuelve su ruta (None si están desactivadas)."""
+        return self.store.backup(force=True)
+
+    def backups(self):
+        """(ruta, información, está entera) de cada copia de seguridad, de la más reciente a la más antigua."""
+        backups = self.store.backups
+        if backups is None:
+            return []
+        return [(path, info, backups.verify(path, info)) for path, info in backups.backups(self.store.backup_name())]
+
+    def storage(self):
+        """Métricas del almacén: caché, escritura y cuánto ocupa el texto en disco y en memoria."""
+        return self.store.stats()
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+
+from modules.metrics import log, metrics
+
+
+class SaveScheduler:
+    """Guarda en segundo plano agrupando ráfagas de cambios.
+
+    Cada cambio solo marca el almacén como sucio. Un hilo de trabajo espera a
+    que pasen `delay` segundos sin cambios (o como mucho `max_delay` desde el
+    primer cambio pendiente) y entonces serializa y escribe una sola vez.
+    """
+
+    def __init__(self, save, delay=1.0, max_delay=10.0):
+        self.save = save  # Función que serializa y escribe el almacén
+        self.delay = delay
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        self.pending = 0  # Cambios marcados desde la última escritura
+        self.first_mark = None
+        self.last_mark = None
+        self.writing = False
+        self.forced = False
+        self.closed = False
+        self.flushes = 0
+        self.error = None  # Fallo de la última escritura, si falló
+        self.latencies = deque(maxlen=100)  # Duración de las últimas escrituras, en ms
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def mark_dirty(self):
+        with self.condition:
+            now = time.monotonic()
+            if self.pending == 0:
+                self.first_mark = now
+            self.last_mark = now
+            self.pending += 1
+            self.condition.notify_all()
+
+    def wait_time(self):
+        """Segundos que faltan para escribir, o None si no hay nada pendiente."""
+        if self.pending == 0:
+            return None
+        if self.forced or self.closed:
+            return 0
+        now = time.monotonic()
+        return max(0, min(self.last_mark + self.delay, self.first_mark + self.max_delay) - now)
+
+    def run(self):
+        while True:
+            with self.condition:
+                timeout = self.wait_time()
+                while timeout is None or timeout > 0:
+                    if timeout is None and self.closed:
+                        return
+                    self.condition.wait(timeout)
+                    timeout = self.wait_time()
+                batch = self.pending
+                self.pending = 0
+                self.forced = False
+                self.writing = True
+
+            start = time.perf_counter()
+            try:
+                self.save()
+            except Exception as e:
+                # Cualquier fallo (de disco o al codificar) deja el lote pendiente y el hilo vivo
+                log.exception("Error al guardar notas: %s", e)
+                with self.condition:
+                    self.error = e
+                    if self.pending == 0:
+                        self.first_mark = time.monotonic()
+                    self.last_mark = time.monotonic()
+                    self.pending += batch
+                    if self.closed:
+                        # Al cerrar no se reintenta sin fin: close() no volvería nunca
+                        log.error("Se cierra sin guardar %d cambios", self.pending)
+                        self.writing = False
+                        self.condition.notify_all()
+                        return
+                    # Se reintenta tras el siguiente periodo de espera
+            else:
+                seconds = time.perf_counter() - start
+                metrics.record('save', seconds)
+                with self.condition:
+                    self.error = None
+                    self.flushes += 1
+                    self.latencies.append(seconds * 1000)
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+    def flush(self):
+        """Escribe ya los cambios pendientes y espera a que terminen.
+
+        Si la escritura falla (o el hilo de guardado ya no está) se lanza el
+        error en vez de esperar: los cambios siguen pendientes.
+        """
+        with self.condition:
+            if self.pending:
+                self.forced = True
+                self.condition.notify_all()
+            while (self.pending and self.forced) or self.writing:
+                if not self.worker.is_alive():
+                    break
+                # Con espera limitada, por si el hilo termina sin avisar
+                self.condition.wait(0.5)
+            if self.pending and (self.error is not None or not self.worker.is_alive()):
+                raise IOError(f"No se pudieron guardar {self.pending} cambios: {self.error}")
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.worker.join()
+
+    def stats(self):
+        """Profundidad de la cola y latencias de escritura para diagnóstico."""
+        with self.condition:
+            latencies = list(self.latencies)
+            return {
+                'pending': self.pending,
+                'writing': self.writing,
+                'flushes': self.flushes,
+                'last_flush_ms': round(latencies[-1], 2) if latencies else None,
+                'avg_flush_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+                'max_flush_ms': round(max(latencies), 2) if latencies else None,
+            }
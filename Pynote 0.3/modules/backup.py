@@ -0,0 +1,157 @@
+import glob
+import hashlib
+import json
+import os
+import time
+import zlib
+
+from modules.database import atomic_write, data_dir, replace_file
+from modules.locking import FileLock
+from modules.metrics import log, metrics
+
+BACKUP_DIR = os.path.join(data_dir, 'backups')
+CHUNK = 1024 * 1024
+
+
+# Cada copia es el fichero de datos comprimido en gzip (se abre con
+# cualquier descompresor) con nombre <datos>.<marca de tiempo>.gz, más un
+# <copia>.sum con su tamaño y su huella BLAKE2. La huella es la del fichero
+# comprimido, así que comprobar una copia es leerla de disco, sin
+# descomprimirla ni interpretarla. La copia se escribe antes que su .sum:
+# una copia sin .sum no terminó de escribirse y no cuenta.
+def sum_file(path):
+    return path + '.sum'
+
+
+def file_digest(path):
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Backups:
+    """Copias de seguridad comprimidas y rotativas de los ficheros de datos.
+
+    Se hace una copia como mucho cada `interval` segundos (el diario copia
+    además cada instantánea que compacta) y se conservan las `keep` más
+    recientes de cada fichero (data.json, data.pnb o data.db). Si al
+    arrancar la instantánea no se puede leer, restore() la sustituye por la
+    copia más reciente cuya huella coincide.
+    """
+
+    def __init__(self, directory=BACKUP_DIR, keep=10, interval=3600, level=6):
+        self.directory = directory
+        self.keep = keep
+        self.interval = interval
+        self.level = level
+
+    def lock(self, name):
+        os.makedirs(self.directory, exist_ok=True)
+        return FileLock(os.path.join(self.directory, name + '.lock'))
+
+    def backups(self, name):
+        """(ruta, información) de las copias terminadas de `name`, de la más reciente a la más antigua."""
+        found = []
+        for path in glob.glob(os.path.join(glob.escape(self.directory), glob.escape(name) + '.*.gz')):
+            try:
+                with open(sum_file(path), 'r') as file:
+                    info = json.load(file)
+            except (IOError, ValueError):
+                continue
+            found.append((path, info))
+        found.sort(key=lambda pair: pair[1].get('time', 0), reverse=True)
+        return found
+
+    def due(self, name):
+        if self.keep <= 0:
+            return False
+        found = self.backups(name)
+        return not found or found[0][1].get('time', 0) <= time.time() - self.interval
+
+    def save(self, name, source):
+        """Comprime el fichero abierto `source` como nueva copia de `name` y devuelve su ruta."""
+        path = os.path.join(self.directory, f"{name}.{time.time_ns()}.gz")
+        tmp_file = path + '.tmp'
+        size = 0
+        with metrics.timer('backup'), self.lock(name):
+            try:
+                with open(tmp_file, 'wb') as out:
+                    # wbits 31: formato gzip
+                    compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+                    for chunk in iter(lambda: source.read(CHUNK), b''):
+                        size += len(chunk)
+                        out.write(compressor.compress(chunk))
+                    out.write(compressor.flush())
+                    out.flush()
+                    os.fsync(out.fileno())
+            except BaseException:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                raise
+            replace_file(tmp_file, path)
+            info = {'name': name, 'time': time.time(), 'size': size, 'bytes': os.path.getsize(path),
+                    'blake2b': file_digest(path)}
+            atomic_write(sum_file(path), json.dumps(info))
+            self.prune(name)
+        metrics.count('backup_bytes', info['bytes'])
+        log.info("Copia de seguridad de %s: %s (%d bytes)", name, path, info['bytes'])
+        return path
+
+    def prune(self, name):
+        """Borra las copias que sobran y las que quedaron a medio escribir; se llama con el cerrojo."""
+        found = self.backups(name)
+        kept = {path for path, info in found[:self.keep]}
+        pattern = os.path.join(glob.escape(self.directory), glob.escape(name) + '.*.gz')
+        for path in glob.glob(pattern) + glob.glob(pattern + '.tmp'):
+            if path not in kept:
+                for stale in (path, sum_file(path)):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+
+    def verify(self, path, info):
+        """True si la copia está entera: mismo tamaño y misma huella que al escribirla."""
+        try:
+            return os.path.getsize(path) == info.get('bytes') and file_digest(path) == info.get('blake2b')
+        except OSError:
+            return False
+
+    def latest(self, name):
+        """(ruta, información) de la copia válida más reciente de `name`, o None."""
+        for path, info in self.backups(name):
+            if self.verify(path, info):
+                return path, info
+            log.warning("Copia de seguridad dañada, se descarta: %s", path)
+        return None
+
+    def extract(self, path, target):
+        """Descomprime una copia en `target`, sustituyéndolo de una vez."""
+        tmp_file = target + '.tmp'
+        with open(path, 'rb') as source, open(tmp_file, 'wb') as out:
+            decompressor = zlib.decompressobj(31)
+            for chunk in iter(lambda: source.read(CHUNK), b''):
+                out.write(decompressor.decompress(chunk))
+            out.write(decompressor.flush())
+            out.flush()
+            os.fsync(out.fileno())
+        replace_file(tmp_file, target)
+
+    def restore(self, name, target, broken=None):
+        """Sustituye `broken` (por defecto `target`) por la copia válida más reciente en `target`.
+
+        El fichero dañado se conserva como <fichero>.corrupt. Devuelve la
+        información de la copia, o None si no hay ninguna válida.
+        """
+        broken = target if broken is None else broken
+        with self.lock(name):
+            found = self.latest(name)
+            if found is None:
+                log.error("No hay copias de seguridad válidas de %s", name)
+                return None
+            path, info = found
+            if os.path.exists(broken):
+                replace_file(broken, broken + '.corrupt')
+            self.extract(path, target)
+        log.error("%s estaba dañado; recuperado de la copia de seguridad %s", name, path)
+        return info
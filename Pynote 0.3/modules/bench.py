@@ -0,0 +1,566 @@
+"""Banco de pruebas de las rutas de datos de Pynote.
+
+Genera árboles de notas sintéticos, los guarda en un directorio temporal y
+mide la carga, el guardado y las acciones de la ventana principal sobre un
+Pynote sin pantalla (con widgets simulados) o sobre Tk real con --tk, por
+ejemplo bajo `xvfb-run`. Los resultados se guardan en JSON para comparar
+versiones:
+
+    python -m modules.bench --notes 1000,100000 --depth 2 --fanout 10
+    python -m modules.bench --compare ~/FastNotes/benchmarks/anterior.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from modules import database
+from modules.database import data_dir
+from modules.metrics import metrics
+from modules.search import walk
+from modules.tree import new_id
+
+RESULTS_DIR = os.path.join(data_dir, 'benchmarks')
+OPERATIONS = ('load', 'save', 'save_edit', 'load_notes', 'save_notes', 'render', 'navigate',
+              'search', 'filter', 'rename', 'favourite', 'delete')
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua nota carpeta lista texto").split()
+COLORS = ("white", "white", "white", "#ffcccc", "#ccffcc", "#ccccff")
+
+
+def generate_tree(notes, depth=2, fanout=10, body_size=1024, seed=0):
+    """Árbol de `notes` notas repartidas entre las carpetas del último nivel.
+
+    Cada nivel tiene `fanout` subcarpetas por carpeta; con depth 0 todas las
+    notas quedan en la raíz. Los textos salen de un pequeño conjunto de
+    cuerpos de `body_size` caracteres para que generar millones sea rápido.
+    """
+    rng = random.Random(seed)
+    bodies = []
+    for i in range(64):
+        words = []
+        size = 0
+        while size < body_size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        bodies.append(" ".join(words)[:body_size])
+
+    root = []
+    leaves = [root]
+    for level in range(depth):
+        next_leaves = []
+        for contents in leaves:
+            for i in range(fanout):
+                folder = {"title": f"Folder {level}.{len(next_leaves)}", "is_folder": True,
+                          "contents": [], "color": "white", "id": new_id()}
+                contents.append(folder)
+                next_leaves.append(folder['contents'])
+        leaves = next_leaves
+
+    for n in range(notes):
+        leaves[n % len(leaves)].append({
+            "title": f"Note {n}", "content": f"{n} {bodies[n % len(bodies)]}",
+            "color": rng.choice(COLORS), "favourite": rng.random() < 0.1, "id": new_id()})
+    return root
+
+
+def peak_rss():
+    """Memoria residente máxima del proceso en MiB (None si no se puede medir)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux da kilobytes y macOS bytes
+    return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def summarize(samples, items=None):
+    """Percentiles de latencia (ms), operaciones por segundo y memoria máxima."""
+    if not samples:
+        raise ValueError("Ninguna medida: la operación no llegó a ejecutarse")
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    total = sum(ordered)
+    result = {
+        'count': len(ordered),
+        'mean_ms': total / len(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p90_ms': percentile(90),
+        'p99_ms': percentile(99),
+        'max_ms': ordered[-1] * 1000,
+        'ops_per_s': len(ordered) / total if total else None,
+        'peak_rss_mb': peak_rss(),
+    }
+    if items is not None:
+        result['items_per_s'] = items / (ordered[len(ordered) // 2] or 1e-9)
+    return result
+
+
+class Stub:
+    """Widget simulado: acepta cualquier llamada y no hace nada."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class StubVar:
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class HeadlessListbox:
+    """Versión sin Tk de VirtualListbox con el mismo coste de formato.
+
+    Igual que la lista real, pide a `formatter` el texto de las filas visibles
+    más el margen de overscan cada vez que se muestra una lista o se refresca.
+    """
+
+    def __init__(self, rows=30, overscan=5):
+        self.visible = rows + overscan
+        self.items = []
+        self.formatter = lambda index, item: (str(item), "white")
+        self.selected = None
+        self.rows = {}
+
+    def set_items(self, items, formatter=None):
+        self.items = items
+        if formatter is not None:
+            self.formatter = formatter
+        self.selected = None
+        self.refresh()
+
+    def update_items(self, items):
+        self.items = items
+        self.refresh()
+
+    def refresh(self):
+        if self.selected is not None and self.selected >= len(self.items):
+            self.selected = None
+        self.rows = {index: self.formatter(index, self.items[index])
+                     for index in range(min(len(self.items), self.visible))}
+
+    def update_row(self, index):
+        if index in self.rows:
+            self.rows[index] = self.formatter(index, self.items[index])
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def selection_clear(self, first=0, last=None):
+        self.selected = None
+
+    def selection_set(self, index):
+        if 0 <= index < len(self.items):
+            self.selected = index
+
+    def see(self, index):
+        pass
+
+
+def make_store(directory, backend='json', snapshot='json', journal=True):
+    """Almacén sobre los ficheros del directorio de la prueba."""
+    if backend == 'sqlite':
+        from modules.sqlite_store import SqliteStore
+        return SqliteStore(db_file=os.path.join(directory, 'data.db'))
+    from modules.store import JsonStore
+    return JsonStore(data_file=os.path.join(directory, 'data.json'),
+                     journal_file=os.path.join(directory, 'data.journal'),
+                     index_file=os.path.join(directory, 'search_index.json'),
+                     journal=journal, snapshot=snapshot)
+
+
+def prepare(directory, notes, options):
+    """Escribe el árbol como data.json y lo pasa al formato del almacén."""
+    with open(os.path.join(directory, 'data.json'), 'w') as file:
+        json.dump(notes, file)
+    if options.backend == 'sqlite':
+        from modules.sqlite_store import migrate_json
+        migrate_json(os.path.join(directory, 'data.json'), os.path.join(directory, 'data.journal'),
+                     os.path.join(directory, 'data.db'))
+        return
+    # Una primera carga y guardado dejan la instantánea como la deja la aplicación
+    store = make_store(directory, options.backend, options.snapshot, options.journal)
+    store.load()
+    store.save_snapshot()
+    store.close()
+
+
+def headless_app(store):
+    """Pynote con widgets simulados, sin crear la ventana."""
+    from app import Pynote
+    from modules.history import History
+    app = Pynote.__new__(Pynote)
+    app.root = Stub()
+    app.config = {}
+    app.profile = None
+    app.store = store
+    # Los cambios de la ventana pasan por el historial, así que se mide con él
+    app.history = History(store, store.history_file())
+    app.history.load()
+    app.ready = True
+    app.loader = None
+    app.current_note_index = None
+    app.current_folder = None
+    app.folder_stack = []
+    app.search_results = None
+    app.folder_view = None
+    app.folder_items = []
+    app.filter_text = ""
+    app.back_button = Stub()
+    app.search_var = StubVar()
+    app.notes_listbox = HeadlessListbox()
+    app.context_menu = Stub()
+    app.fav_command_index = 1
+    return app
+
+
+def tk_app(store):
+    """Pynote con Tk real; necesita pantalla (por ejemplo `xvfb-run`)."""
+    import tkinter as tk
+    import app as app_module
+    config = {'window': {'theme': 'light', 'title': 'Pynote benchmark', 'size': '400x600'}}
+    root = tk.Tk()
+    app_module.open_store = lambda storage: store
+    app = app_module.Pynote(root, config)
+    while app.loader.is_alive():
+        root.update()
+        time.sleep(0.005)
+    app.check_loading()
+    root.update()
+    return app
+
+
+class Dialogs:
+    """Respuestas fijas para los diálogos que abren las acciones."""
+
+    def __init__(self):
+        self.answer = None
+
+    def askstring(self, *args, **kwargs):
+        return self.answer
+
+    def askyesno(self, *args, **kwargs):
+        return True
+
+
+def store_folders(store):
+    """Ids de todas las carpetas tal como los guarda el almacén.
+
+    No sirven los del árbol generado: al migrar a SQLite cada elemento
+    recibe un id nuevo.
+    """
+    folders = []
+    parents = [None]
+    while parents:
+        for item in store.children(parents.pop()):
+            if item.get('is_folder', False):
+                folders.append(item['id'])
+                parents.append(item)
+    return folders
+
+
+class Benchmark:
+    """Ejecuta las operaciones sobre un árbol y acumula los tiempos."""
+
+    def __init__(self, directory, notes, options):
+        self.directory = directory
+        self.notes = notes
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self.count = sum(1 for item in walk(notes))
+        self.folder_ids = []
+        self.results = {}
+
+    def timed(self, name, action, repeat, items=None):
+        samples = []
+        for i in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            action()
+            samples.append(time.perf_counter() - start)
+        self.results[name] = summarize(samples, items)
+
+    def run(self):
+        options = self.options
+        self.bench_legacy()
+        prepare(self.directory, self.notes, options)
+
+        samples = []
+        for i in range(options.repeat):
+            gc.collect()
+            store = make_store(self.directory, options.backend, options.snapshot, options.journal)
+            start = time.perf_counter()
+            store.load()
+            samples.append(time.perf_counter() - start)
+            store.close()
+        self.results['load'] = summarize(samples, self.count)
+
+        store = make_store(self.directory, options.backend, options.snapshot, options.journal)
+        if options.tk:
+            # La ventana real carga el almacén en su propio hilo
+            self.app = tk_app(store)
+        else:
+            store.load()
+            self.app = headless_app(store)
+        try:
+            self.folder_ids = store_folders(store)
+            self.bench_app()
+            if hasattr(store, 'save_snapshot'):
+                self.bench_save(store)
+        finally:
+            store.close()
+            if options.tk:
+                self.app.root.destroy()
+        return self.results
+
+    def bench_save(self, store):
+        """Guardado de todo el árbol frente al de un solo cambio, que debe costar mucho menos."""
+        def save_all():
+            store.tree.touch_all()
+            store.save_snapshot()
+
+        def save_edit():
+            store.update(item, title=f"Edit {self.rng.random():.6f}")
+            store.save_snapshot()
+
+        self.timed('save', save_all, self.options.repeat, self.count)
+        item = (store.children(self.random_folder()) or store.children(None))[0]
+        self.timed('save_edit', save_edit, self.options.repeat, 1)
+
+    def bench_legacy(self):
+        """load_notes/save_notes de modules.database sobre un data.json plano."""
+        legacy_file = os.path.join(self.directory, 'legacy.json')
+        saved = database.DATA_FILE
+        database.DATA_FILE = legacy_file
+        try:
+            self.timed('save_notes', lambda: database.save_notes(self.notes), self.options.repeat, self.count)
+            self.timed('load_notes', database.load_notes, self.options.repeat, self.count)
+        finally:
+            database.DATA_FILE = saved
+            os.remove(legacy_file)
+
+    def step(self, action):
+        """Ejecuta una acción de la ventana y devuelve cuánto tardó."""
+        start = time.perf_counter()
+        action()
+        if self.options.tk:
+            self.app.root.update_idletasks()
+        return time.perf_counter() - start
+
+    def select(self, predicate):
+        """Selecciona un elemento al azar de la lista mostrada que cumpla la condición."""
+        items = self.app.current_items()
+        candidates = [i for i, item in enumerate(items) if predicate(item)]
+        if not candidates:
+            return None
+        index = self.rng.choice(candidates)
+        self.app.notes_listbox.selection_set(index)
+        return index
+
+    def random_folder(self):
+        """Una carpeta al azar del almacén, o None (la raíz) si no hay carpetas."""
+        if not self.folder_ids:
+            return None
+        folder_id = self.rng.choice(self.folder_ids)
+        folder = self.app.store.get(folder_id)
+        if folder is None:
+            raise ValueError(f"La carpeta {folder_id} no está en el almacén")
+        return folder
+
+    def show_random_folder(self):
+        folder = self.random_folder()
+        self.app.folder_stack = []
+        self.app.load_notes_list(folder)
+
+    def bench_app(self):
+        import app as app_module
+        app = self.app
+        ops = self.options.ops
+        dialogs = Dialogs()
+        saved = app_module.simpledialog, app_module.messagebox
+        app_module.simpledialog = app_module.messagebox = dialogs
+        try:
+            samples = []
+            for i in range(ops):
+                folder = self.random_folder()
+                samples.append(self.step(lambda: app.load_notes_list(folder)))
+            self.results['render'] = summarize(samples)
+
+            # Bajar por carpetas al azar hasta el fondo y volver a la raíz
+            samples = []
+            app.load_notes_list(None)
+            while len(samples) < ops:
+                if self.select(lambda item: item.get('is_folder', False)) is not None:
+                    samples.append(self.step(app.open_note_or_folder))
+                else:
+                    while app.folder_stack and len(samples) < ops:
+                        samples.append(self.step(app.go_back))
+                    if not self.folder_ids:
+                        samples.append(self.step(lambda: app.load_notes_list(None)))
+            self.results['navigate'] = summarize(samples)
+
+            samples = []
+            for i in range(max(1, ops // 10)):
+                app.search_var.set(self.rng.choice(WORDS) + " " + str(self.rng.randrange(self.count)))
+                samples.append(self.step(app.run_search))
+            self.results['search'] = summarize(samples)
+
+            # Escribir en la caja de búsqueda letra a letra filtra la carpeta mostrada
+            samples = []
+            for i in range(max(1, ops // 5)):
+                self.show_random_folder()
+                word = self.rng.choice(WORDS)
+                for end in range(1, len(word) + 1):
+                    app.search_var.set(word[:end])
+                    samples.append(self.step(app.filter_folder))
+                app.search_var.set("")
+                app.filter_folder()
+            self.results['filter'] = summarize(samples)
+
+            for name, action in (('rename', app.rename_note), ('favourite', app.fav_note),
+                                 ('delete', app.delete_note_or_folder)):
+                samples = []
+                for i in range(ops):
+                    self.show_random_folder()
+                    if self.select(lambda item: not item.get('is_folder', False)) is None:
+                        continue
+                    dialogs.answer = f"Renamed {i}"
+                    samples.append(self.step(action))
+                try:
+                    self.results[name] = summarize(samples)
+                except ValueError:
+                    raise ValueError(f"Ninguna medida de {name}: no se encontraron notas en las carpetas") from None
+            app.store.flush()
+        finally:
+            app_module.simpledialog, app_module.messagebox = saved
+
+
+def run(options):
+    """Ejecuta el banco de pruebas para cada tamaño y devuelve el informe."""
+    report = {
+        'version': 1,
+        'label': options.label,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {key: getattr(options, key) for key in
+                   ('depth', 'fanout', 'body_size', 'backend', 'snapshot', 'journal', 'repeat', 'ops', 'seed', 'tk')},
+        'runs': [],
+    }
+    for count in options.notes:
+        notes = generate_tree(count, options.depth, options.fanout, options.body_size, options.seed)
+        directory = tempfile.mkdtemp(prefix='pynote-bench-')
+        metrics.reset()
+        try:
+            results = Benchmark(directory, notes, options).run()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        del notes
+        # Bytes escritos, filas dibujadas... durante toda la ejecución
+        report['runs'].append({'notes': count, 'results': results, 'counters': metrics.snapshot()['counters']})
+    return report
+
+
+def by_operation(report):
+    """Resultados de un informe indexados por (número de notas, operación)."""
+    return {(entry['notes'], name): result
+            for entry in report.get('runs', []) for name, result in entry['results'].items()}
+
+
+def format_report(report, previous=None):
+    """Tabla de resultados; con `previous` añade la variación de p50 frente a él."""
+    baseline = by_operation(previous) if previous is not None else {}
+    lines = []
+    for entry in report['runs']:
+        lines.append(f"{entry['notes']} notas:")
+        for name in OPERATIONS:
+            result = entry['results'].get(name)
+            if result is None:
+                continue
+            line = (f"  {name:<11} p50 {result['p50_ms']:9.2f} ms  p90 {result['p90_ms']:9.2f} ms  "
+                    f"p99 {result['p99_ms']:9.2f} ms  {result['ops_per_s'] or 0:10.1f} op/s")
+            if result['peak_rss_mb'] is not None:
+                line += f"  {result['peak_rss_mb']:7.1f} MiB"
+            old = baseline.get((entry['notes'], name))
+            if old is not None and old['p50_ms']:
+                line += f"  ({result['p50_ms'] / old['p50_ms'] - 1:+.0%})"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def regressions(report, previous, threshold):
+    """Operaciones cuyo p50 empeora más de `threshold` (0.2 = 20 %) frente a `previous`."""
+    baseline = by_operation(previous)
+    return [key for key, result in by_operation(report).items()
+            if key in baseline and baseline[key]['p50_ms']
+            and result['p50_ms'] > baseline[key]['p50_ms'] * (1 + threshold)]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Pynote benchmark")
+    parser.add_argument("--notes", default="1000,10000",
+                        type=lambda value: [int(count) for count in value.split(",")],
+                        help="comma separated tree sizes (number of notes)")
+    parser.add_argument("--depth", type=int, default=2, help="folder levels above the notes")
+    parser.add_argument("--fanout", type=int, default=10, help="subfolders per folder")
+    parser.add_argument("--body-size", type=int, default=1024, help="characters per note body")
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--snapshot", choices=("json", "binary"), default="json")
+    parser.add_argument("--no-journal", dest="journal", action="store_false",
+                        help="use autosave instead of the change journal")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of load and save")
+    parser.add_argument("--ops", type=int, default=200, help="repetitions of each window action")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tk", action="store_true", help="drive a real Tk window (needs a display, e.g. xvfb-run)")
+    parser.add_argument("--label", help="name stored with the results, e.g. the release")
+    parser.add_argument("--output", help="results file (default: a new file in ~/FastNotes/benchmarks)")
+    parser.add_argument("--compare", metavar="FILE", help="previous results to compare against")
+    parser.add_argument("--max-regression", type=float, metavar="PCT",
+                        help="with --compare, exit with status 1 if any p50 is this much slower")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    options = parse_args(sys.argv[1:])
+    previous = None
+    if options.compare:
+        with open(options.compare, 'r') as file:
+            previous = json.load(file)
+
+    report = run(options)
+    print(format_report(report, previous))
+
+    output = options.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Resultados guardados en {output}")
+
+    if previous is not None and options.max_regression is not None:
+        slower = regressions(report, previous, options.max_regression / 100)
+        if slower:
+            for count, name in slower:
+                print(f"Regresión en {name} con {count} notas")
+            sys.exit(1)
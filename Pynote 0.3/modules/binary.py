@@ -0,0 +1,472 @@
+import glob
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from modules.codec import RAW, BodyCodec, decode
+from modules.database import DATA_FILE, replace_file
+from modules.metrics import metrics
+from modules.node import FAVOURITE, FOLDER, HAS_FAVOURITE, HAS_FOLDER, Node
+from modules.snapshot import commit_meta, freeze, read_meta, read_snapshot, write_snapshot
+
+# Formato binario de la instantánea (little endian):
+#
+#   cabecera   HEADER
+#   registros  los hijos de cada carpeta van seguidos; cada registro es su
+#              longitud (u32), RECORD y las cadenas presentes (id, título,
+#              color, claves extra en JSON), cada una como u32 + UTF-8
+#   carpetas   FOLDER por carpeta (la 0 es la raíz): primer hijo, número de
+#              hijos, registro de la propia carpeta y carpeta que la contiene
+#   ids        ID_ENTRY por elemento con identificador, ordenados por id
+#   contenidos textos de las notas en UTF-8, referenciados por los registros;
+#              los grandes van comprimidos y los repetidos una sola vez
+#              (modules.codec)
+#
+# Cada instantánea es una generación inmutable (data.pnb.<n>) que se lee con
+# mmap: al arrancar solo se decodifican los registros de la raíz y el resto
+# de carpetas se leen la primera vez que se abren.
+MAGIC = b'PYNOTEB\x00'
+VERSION = 3
+# Magic, versión, carpetas, elementos, ids, offsets de carpetas, ids y contenidos y último cambio en la raíz
+HEADER = struct.Struct('<8sIIIIQQQd')
+# Cabecera de las versiones 1 y 2, sin el último cambio en la raíz; se sigue leyendo
+HEADER_V2 = struct.Struct('<8sIIIIQQQ')
+# Flags del Node, campos presentes, carpeta, offset, longitud, compresión y tamaño sin comprimir del contenido
+RECORD = struct.Struct('<BBIQIBI')
+# Registro de la versión 1, sin compresión; se sigue leyendo
+RECORD_V1 = struct.Struct('<BBIQI')
+FOLDER_ENTRY = struct.Struct('<QIQI')
+ID_ENTRY = struct.Struct('<QI')
+LENGTH = struct.Struct('<I')
+
+ROOT = 0
+NO_PARENT = 0xFFFFFFFF
+
+# Campos presentes en un registro
+P_TITLE = 1
+P_COLOR = 2
+P_ID = 4
+P_BODY = 8
+P_CONTENTS = 16
+P_EXTRA = 32
+
+FLAG_MASK = FOLDER | FAVOURITE | HAS_FOLDER | HAS_FAVOURITE
+
+
+def binary_file(data_file):
+    """Ruta base de las instantáneas binarias junto a data.json (data.pnb)."""
+    return os.path.splitext(data_file)[0] + '.pnb'
+
+
+def generations(base):
+    """Generaciones confirmadas, de la más antigua a la más reciente."""
+    paths = []
+    for path in glob.glob(glob.escape(base) + '.*'):
+        suffix = path[len(base) + 1:]
+        if suffix.isdigit():
+            paths.append((int(suffix), path))
+    return [path for number, path in sorted(paths)]
+
+
+def current_generation(base):
+    paths = generations(base)
+    return paths[-1] if paths else None
+
+
+def is_newer(path, other):
+    """Indica si `path` existe y es más reciente que `other` (o este no existe)."""
+    if path is None or not os.path.exists(path):
+        return False
+    if other is None or not os.path.exists(other):
+        return True
+    return os.stat(path).st_mtime_ns > os.stat(other).st_mtime_ns
+
+
+def encode_item(item, text, folder_no):
+    """Codifica un elemento; devuelve sus flags, los campos presentes y las cadenas."""
+    flags = present = 0
+    strings = []
+    for key, bit in (('id', P_ID), ('title', P_TITLE), ('color', P_COLOR)):
+        if type(item.get(key)) is str:
+            present |= bit
+            strings.append(item[key])
+    for key, bit, present_bit in (('is_folder', FOLDER, HAS_FOLDER), ('favourite', FAVOURITE, HAS_FAVOURITE)):
+        if type(item.get(key)) is bool:
+            flags |= present_bit | (bit if item[key] else 0)
+    if text is not None:
+        present |= P_BODY
+    if folder_no is not None:
+        present |= P_CONTENTS
+
+    # Lo que no encaja en los campos fijos se guarda como JSON
+    extra = {}
+    for key, value in item.items():
+        if key in ('id', 'title', 'color', 'content') and type(value) is str:
+            continue
+        if key in ('is_folder', 'favourite') and type(value) is bool:
+            continue
+        if key in ('body', 'contents'):
+            continue
+        extra[key] = value
+    if extra:
+        present |= P_EXTRA
+        strings.append(json.dumps(extra, ensure_ascii=False))
+    return flags, present, strings
+
+
+def write_binary(notes, path, read_body=None, children_of=None, codec=None, modified=0):
+    """Escribe una instantánea binaria completa en `path`.
+
+    `children_of(item)` devuelve los hijos de una carpeta (o None si el
+    elemento no tiene 'contents'); permite escribir carpetas que aún no se
+    han leído de la generación anterior. `codec` (un BodyCodec) decide cómo
+    se guardan los textos y `modified` es el último cambio en la raíz
+    (TreeIndex.root_modified).
+    """
+    children_of = children_of or (lambda item: item.get('contents'))
+    folders = []
+    ids = []
+    items_count = 0
+    try:
+        with open(path + '.tmp', 'wb') as out, tempfile.TemporaryFile() as bodies_file:
+            bodies = (codec or BodyCodec()).writer(bodies_file)
+            out.write(bytes(HEADER.size))
+            # Recorrido en anchura: los hijos de cada carpeta quedan contiguos
+            queue = deque([(notes, 0, NO_PARENT)])
+            next_folder = 1
+            while queue:
+                items, record_offset, parent_no = queue.popleft()
+                folder_no = len(folders)
+                first = out.tell()
+                for item in items:
+                    offset = out.tell()
+                    contents = children_of(item)
+                    child_no = None
+                    if contents is not None:
+                        child_no = next_folder
+                        next_folder += 1
+                        queue.append((contents, offset, folder_no))
+
+                    if 'content' in item and type(item['content']) is str:
+                        text = item['content']
+                    elif 'body' in item and 'content' not in item:
+                        text = read_body(item['body'])
+                    else:
+                        text = None
+                    flags, present, strings = encode_item(item, text, child_no)
+                    ref = [0, 0]
+                    if text is not None:
+                        ref = bodies.add(text)
+                    body_codec = ref[2] if len(ref) > 2 else RAW
+                    record = bytearray(RECORD.pack(flags, present, child_no or 0, ref[0], ref[1], body_codec,
+                                                   ref[3] if len(ref) > 3 else ref[1]))
+                    for string in strings:
+                        data = string.encode('utf-8')
+                        record += LENGTH.pack(len(data)) + data
+                    out.write(LENGTH.pack(len(record)) + record)
+                    if present & P_ID:
+                        ids.append((strings[0].encode('utf-8'), offset, folder_no))
+                    items_count += 1
+                folders.append((first, len(items), record_offset, parent_no))
+
+            folders_offset = out.tell()
+            for entry in folders:
+                out.write(FOLDER_ENTRY.pack(*entry))
+            ids.sort()
+            ids_offset = out.tell()
+            for item_id, offset, parent_no in ids:
+                out.write(ID_ENTRY.pack(offset, parent_no))
+            bodies_offset = out.tell()
+            bodies_file.seek(0)
+            shutil.copyfileobj(bodies_file, out)
+            metrics.count('bytes_written', out.tell())
+            metrics.count('bodies_deduplicated', bodies.deduplicated)
+
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, VERSION, len(folders), items_count, len(ids),
+                                  folders_offset, ids_offset, bodies_offset, modified))
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        # Disco lleno o cualquier fallo a medias: la generación anterior sigue en su sitio
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+        raise
+    replace_file(path + '.tmp', path)
+
+
+class BinarySnapshot:
+    """Lectura de una generación binaria a través de mmap.
+
+    Hace también de fichero de contenidos: read() recibe la referencia
+    [offset, longitud] que llevan las notas en 'body'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"Instantánea binaria vacía: {path}")
+        if len(self.map) < HEADER_V2.size:
+            self.close()
+            raise ValueError(f"Instantánea binaria truncada: {path}")
+        (magic, version, self.folder_count, self.item_count, self.id_count,
+         self.folders_offset, self.ids_offset, self.bodies_offset) = HEADER_V2.unpack_from(self.map, 0)
+        if magic != MAGIC or version not in (1, 2, VERSION):
+            self.close()
+            raise ValueError(f"Formato de instantánea desconocido: {path}")
+        self.modified = 0
+        if version == VERSION:
+            if len(self.map) < HEADER.size:
+                self.close()
+                raise ValueError(f"Instantánea binaria truncada: {path}")
+            self.modified = HEADER.unpack_from(self.map, 0)[-1]
+        self.record = RECORD if version >= 2 else RECORD_V1
+
+    def string(self, offset):
+        length, = LENGTH.unpack_from(self.map, offset)
+        start = offset + LENGTH.size
+        return self.map[start:start + length].decode('utf-8'), start + length
+
+    def parse(self, offset, content=False):
+        """Decodifica el registro en `offset`; devuelve el Node, su carpeta y el siguiente offset."""
+        length, = LENGTH.unpack_from(self.map, offset)
+        end = offset + LENGTH.size + length
+        fields = self.record.unpack_from(self.map, offset + LENGTH.size)
+        flags, present, folder_no, body_offset, body_length = fields[:5]
+        position = offset + LENGTH.size + self.record.size
+        node = Node()
+        node.flags = flags & FLAG_MASK
+        if present & P_ID:
+            node.id, position = self.string(position)
+        if present & P_TITLE:
+            node.title, position = self.string(position)
+        if present & P_COLOR:
+            color, position = self.string(position)
+            node.color = sys.intern(color)
+        if present & P_EXTRA:
+            extra, position = self.string(position)
+            for key, value in json.loads(extra).items():
+                node[key] = value
+        if present & P_BODY:
+            # Como en modules.codec: la referencia solo lleva compresión y tamaño si está comprimido
+            ref = (body_offset, body_length) if len(fields) < 7 or fields[5] == RAW else \
+                (body_offset, body_length, fields[5], fields[6])
+            if content:
+                node.content = self.read(ref)
+            else:
+                node.body = ref
+        return node, (folder_no if present & P_CONTENTS else None), end
+
+    def folder(self, folder_no):
+        return FOLDER_ENTRY.unpack_from(self.map, self.folders_offset + folder_no * FOLDER_ENTRY.size)
+
+    def children(self, folder_no):
+        """Hijos de una carpeta y número de las subcarpetas que quedan sin leer.
+
+        Las subcarpetas sin identificador no se podrían volver a encontrar,
+        así que esas se leen completas.
+        """
+        offset, count, record_offset, parent_no = self.folder(folder_no)
+        items = []
+        pending = {}
+        for i in range(count):
+            node, child_no, offset = self.parse(offset)
+            if child_no is not None:
+                if 'id' in node:
+                    pending[node['id']] = child_no
+                else:
+                    node['contents'] = self.subtree(child_no)
+            items.append(node)
+        return items, pending
+
+    def subtree(self, folder_no, content=False):
+        """Hijos de una carpeta con todas sus subcarpetas ya leídas."""
+        root = []
+        stack = [(folder_no, root)]
+        while stack:
+            folder_no, items = stack.pop()
+            offset, count, record_offset, parent_no = self.folder(folder_no)
+            for i in range(count):
+                node, child_no, offset = self.parse(offset, content)
+                if child_no is not None:
+                    node['contents'] = []
+                    stack.append((child_no, node['contents']))
+                items.append(node)
+        return root
+
+    def read_all(self, content=False):
+        return self.subtree(ROOT, content)
+
+    def locate(self, item_id):
+        """Carpeta en la que está guardado un identificador, o None."""
+        target = item_id.encode('utf-8')
+        low, high = 0, self.id_count
+        while low < high:
+            middle = (low + high) // 2
+            offset, parent_no = ID_ENTRY.unpack_from(self.map, self.ids_offset + middle * ID_ENTRY.size)
+            # El id es la primera cadena del registro
+            length, = LENGTH.unpack_from(self.map, offset + LENGTH.size + self.record.size)
+            start = offset + 2 * LENGTH.size + self.record.size
+            found = self.map[start:start + length]
+            if found == target:
+                return parent_no
+            if found < target:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def folder_id(self, folder_no):
+        offset, count, record_offset, parent_no = self.folder(folder_no)
+        node, child_no, end = self.parse(record_offset)
+        return node.get('id')
+
+    def read(self, ref):
+        start = self.bodies_offset + ref[0]
+        return decode(self.map[start:start + ref[1]], ref)
+
+    def close(self):
+        if getattr(self, 'map', None) is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+class BinaryFormat:
+    """Instantánea binaria por generaciones (data.pnb.<n>) para Journal."""
+
+    inline_texts = False
+
+    def __init__(self, data_file, codec=None):
+        self.data_file = data_file
+        self.base = binary_file(data_file)
+        self.codec = codec or BodyCodec()
+        self.root_modified = 0  # Último cambio en la raíz según la generación cargada
+
+    def current_file(self):
+        return current_generation(self.base)
+
+    def backup_name(self):
+        return os.path.basename(self.base)
+
+    def restore_target(self):
+        # Una generación nueva, que pasa a ser la más reciente
+        return f"{self.base}.{time.time_ns()}"
+
+    def recover(self, rotated_file):
+        """Confirma una generación que quedó como .next tras borrar el diario rotado."""
+        for path in sorted(glob.glob(glob.escape(self.base) + '.*.next')):
+            if os.path.exists(rotated_file):
+                os.remove(rotated_file)
+            os.replace(path, path[:-len('.next')])
+
+    def load(self):
+        path = self.current_file()
+        if is_newer(self.data_file, path):
+            # Primera vez con el formato binario (o se vuelve de JSON): se convierte data.json
+            path = json_to_binary(self.data_file, self.base, self.codec)
+        if path is None:
+            return [], None, {}
+        remove_generations(self.base, keep=(os.path.basename(path),))
+        snapshot = BinarySnapshot(path)
+        self.root_modified = snapshot.modified
+        if snapshot.id_count < snapshot.item_count:
+            # Hay elementos sin identificador (datos de versiones anteriores):
+            # se lee todo para asignárselos en el mismo orden que con data.json
+            return snapshot.read_all(), snapshot, {}
+        notes, pending = snapshot.children(ROOT)
+        return notes, snapshot, pending
+
+    def read(self):
+        path = self.current_file()
+        if path is None:
+            return []
+        snapshot = BinarySnapshot(path)
+        try:
+            return snapshot.read_all(content=True)
+        finally:
+            snapshot.close()
+
+    def freeze(self, notes, dirty=None):
+        # Cada registro se escribe de nuevo, así que se copia todo el árbol
+        return freeze(notes)
+
+    def write(self, notes, read_body=None, keep=(), rotated_file=None, children_of=None, dirty=None, lock=None,
+              modified=0):
+        # Cada registro se escribe sin codificar JSON, así que `dirty` no se usa
+        path = f"{self.base}.{time.time_ns()}"
+        if rotated_file is None:
+            write_binary(notes, path, read_body, children_of, self.codec, modified)
+        else:
+            write_binary(notes, path + '.next', read_body, children_of, self.codec, modified)
+            with lock or nullcontext():
+                os.remove(rotated_file)
+                replace_file(path + '.next', path)
+        remove_generations(self.base, keep=(os.path.basename(path),) + tuple(keep))
+
+    def close(self):
+        pass
+
+    def disk_files(self):
+        return glob.glob(glob.escape(self.base) + '.*')
+
+    def needs_index(self, bodies):
+        return False
+
+    def build_index(self, lock=None):
+        pass
+
+
+def remove_generations(base, keep):
+    for path in generations(base):
+        if os.path.basename(path) not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                # En Windows no se puede borrar mientras otro proceso la tenga abierta
+                pass
+
+
+def json_to_binary(data_file=DATA_FILE, base=None, codec=None):
+    """Convierte data.json en una generación binaria y devuelve su ruta."""
+    base = base or binary_file(data_file)
+    path = f"{base}.{time.time_ns()}"
+    # El último cambio en la raíz solo está en el índice de metadatos
+    meta = read_meta(data_file)
+    write_binary(read_snapshot(data_file), path, codec=codec, modified=meta.get('modified', 0) if meta else 0)
+    return path
+
+
+def binary_to_json(base, data_file=DATA_FILE, codec=None):
+    """Escribe data.json (y su índice de metadatos) desde la última generación binaria."""
+    snapshot = BinarySnapshot(current_generation(base))
+    try:
+        layout = write_snapshot(snapshot.read_all(), data_file, snapshot.read, codec=codec,
+                                modified=snapshot.modified)
+    finally:
+        snapshot.close()
+    commit_meta(layout, data_file)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('to-binary', 'to-json'):
+        print("Uso: python -m modules.binary to-binary|to-json [data.json]")
+        sys.exit(2)
+    data_file = sys.argv[2] if len(sys.argv) > 2 else DATA_FILE
+    if sys.argv[1] == 'to-binary':
+        print(f"Instantánea binaria escrita en {json_to_binary(data_file)}")
+    else:
+        binary_to_json(binary_file(data_file), data_file)
+        print(f"Notas escritas en {data_file}")
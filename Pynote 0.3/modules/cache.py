@@ -0,0 +1,55 @@
+import sys
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Caché LRU limitada por el tamaño en bytes de los valores guardados."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # Clave -> (valor, tamaño)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        self.pop(key)
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            # Un valor mayor que toda la caché no desplaza al resto
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            old_key, (old_value, old_size) = self.entries.popitem(last=False)
+            self.size -= old_size
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            'cache_entries': len(self.entries),
+            'cache_bytes': self.size,
+            'cache_max_bytes': self.max_bytes,
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'cache_evictions': self.evictions,
+        }
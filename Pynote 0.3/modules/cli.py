@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import shlex
+import sys
+
+from modules.aggregates import format_size, format_stats
+from modules.api import SORT_KEYS, Notes
+from modules.revisions import format_time, revision_diff
+
+
+class BatchParser(argparse.ArgumentParser):
+    """En modo lote un error de una línea no debe terminar el proceso."""
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def build_parser(parser_class=argparse.ArgumentParser):
+    parser = parser_class(prog="pynote", description="Command-line access to Pynote notes. "
+                          "Paths are folder and note titles separated by '/', or id:<id>.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('list', help="list a folder")
+    command.add_argument('path', nargs='?', default='', help="folder (default: root)")
+    command.add_argument('--sort', choices=SORT_KEYS, help="order by title or by folder totals")
+    command.add_argument('--reverse', action='store_true', help="reverse the order")
+    command.add_argument('--json', action='store_true', help="print JSON")
+
+    command = commands.add_parser('get', help="print a note")
+    command.add_argument('path')
+    command.add_argument('--json', action='store_true', help="print JSON with all the fields")
+
+    command = commands.add_parser('add', help="create a note or folder")
+    command.add_argument('folder', help="folder to create it in ('' for the root)")
+    command.add_argument('title')
+    command.add_argument('--content', default='', help="note text ('-' reads standard input)")
+    command.add_argument('--folder', dest='is_folder', action='store_true', help="create a folder")
+    command.add_argument('--color')
+
+    command = commands.add_parser('edit', help="replace the text of a note")
+    command.add_argument('path')
+    command.add_argument('content', help="new text ('-' reads standard input)")
+
+    command = commands.add_parser('revisions', help="list the earlier versions of a note")
+    command.add_argument('path')
+    command.add_argument('--show', type=int, metavar='N', help="print version N instead")
+    command.add_argument('--diff', type=int, metavar='N', help="print what changed from version N to the current text")
+    command.add_argument('--json', action='store_true', help="print JSON")
+
+    command = commands.add_parser('restore', help="bring back an earlier version of a note")
+    command.add_argument('path')
+    command.add_argument('number', type=int, help="version number as shown by 'revisions'")
+
+    command = commands.add_parser('rename', help="rename a note or folder")
+    command.add_argument('path')
+    command.add_argument('title')
+
+    command = commands.add_parser('move', help="move a note or folder to another folder")
+    command.add_argument('path')
+    command.add_argument('destination', help="destination folder ('' for the root)")
+    command.add_argument('--index', type=int, help="position in the destination (default: last)")
+
+    command = commands.add_parser('copy', help="copy a note or a whole folder to another folder")
+    command.add_argument('path')
+    command.add_argument('destination', help="destination folder ('' for the root)")
+    command.add_argument('--index', type=int, help="position in the destination (default: last)")
+
+    command = commands.add_parser('reorder', help="change the position of a note or folder in its folder")
+    command.add_argument('path')
+    command.add_argument('index', type=int, help="new position, starting at 0")
+
+    command = commands.add_parser('stats', help="print the totals of a folder (default: root) or note")
+    command.add_argument('path', nargs='?', default='')
+    command.add_argument('--json', action='store_true', help="print JSON")
+
+    command = commands.add_parser('favourite', help="mark or unmark as favourite")
+    command.add_argument('path')
+    command.add_argument('--off', action='store_true', help="unmark instead")
+
+    command = commands.add_parser('color', help="change the color of a note or folder")
+    command.add_argument('path')
+    command.add_argument('color')
+
+    command = commands.add_parser('delete', help="delete a note or folder")
+    command.add_argument('path')
+
+    command = commands.add_parser('search', help="search all notes and folders")
+    command.add_argument('query')
+    command.add_argument('--limit', type=int, default=50)
+    command.add_argument('--json', action='store_true', help="print JSON")
+
+    command = commands.add_parser('favourites', help="list every favourite note and folder")
+    command.add_argument('--json', action='store_true', help="print JSON")
+
+    command = commands.add_parser('colors', help="list the colors in use and how many items have each")
+    command.add_argument('--json', action='store_true', help="print JSON")
+
+    command = commands.add_parser('by-color', help="list every note and folder of a color")
+    command.add_argument('color')
+    command.add_argument('--json', action='store_true', help="print JSON")
+
+    command = commands.add_parser('backup', help="make a compressed backup of the notes now")
+    command.add_argument('--list', action='store_true', help="list the backups and check them instead")
+
+    command = commands.add_parser('storage', help="print disk use, text sizes and any compression or dedup savings")
+    command.add_argument('--json', action='store_true', help="print JSON")
+
+    if parser_class is argparse.ArgumentParser:
+        command = commands.add_parser('batch', help="run one command per line in a single load/save cycle")
+        command.add_argument('file', nargs='?', default='-', help="file with the commands (default: stdin)")
+        command.add_argument('--keep-going', action='store_true', help="continue after a failing line")
+    return parser
+
+
+def describe(notes, item, content=False):
+    """Campos de un elemento para la salida JSON."""
+    data = {key: value for key, value in item.items() if key not in ('contents', 'content', 'body', 'stats')}
+    data['path'] = notes.path(item)
+    if item.get('is_folder', False):
+        data['stats'] = notes.store.folder_stats(item)._asdict()
+    if content and not item.get('is_folder', False):
+        data['content'] = notes.store.content(item)
+    return data
+
+
+def line(notes, item):
+    """Igual que en la lista de la ventana, sin la numeración."""
+    if item.get('is_folder', False):
+        text = f"[Folder] {item['title']}  ({format_stats(notes.store.folder_stats(item))})"
+    else:
+        text = item['title']
+    if item.get('favourite', False):
+        text += " ⭐"
+    return text
+
+
+def storage_value(key, value):
+    """Los tamaños del texto y del disco se muestran legibles; el resto tal cual."""
+    if key.startswith(('text_', 'disk_')) and ('bytes' in key or 'saved' in key):
+        return format_size(value)
+    return value
+
+
+def text_argument(value, stdin):
+    return stdin.read() if value == '-' else value
+
+
+def run(notes, args, out, stdin=sys.stdin):
+    """Ejecuta una orden ya interpretada sobre las notas."""
+    command = args.command
+    if command == 'list':
+        items = notes.list(args.path, args.sort, args.reverse)
+        if args.json:
+            out.write(json.dumps([describe(notes, item) for item in items], ensure_ascii=False, indent=2) + '\n')
+        else:
+            out.writelines(line(notes, item) + '\n' for item in items)
+    elif command == 'get':
+        item = notes.find(args.path)
+        if args.json:
+            out.write(json.dumps(describe(notes, item, content=True), ensure_ascii=False, indent=2) + '\n')
+        elif item.get('is_folder', False):
+            out.writelines(line(notes, child) + '\n' for child in notes.store.children(item))
+        else:
+            text = notes.store.content(item)
+            out.write(text if text.endswith('\n') else text + '\n')
+    elif command == 'stats':
+        stats = notes.stats(args.path)
+        out.write(json.dumps(stats._asdict()) + '\n' if args.json else format_stats(stats) + '\n')
+    elif command == 'add':
+        item = notes.add(args.folder, args.title, text_argument(args.content, stdin), args.is_folder, args.color)
+        if item is None:
+            raise ValueError(f"No se pudo crear {args.title}")
+        out.write(f"id:{item['id']}\n")
+    elif command == 'edit':
+        notes.edit(args.path, text_argument(args.content, stdin))
+    elif command == 'revisions':
+        if args.show is not None:
+            text = notes.revision(args.path, args.show)
+            out.write(text if text.endswith('\n') else text + '\n')
+        elif args.diff is not None:
+            out.writelines(revision_diff(notes.revision(args.path, args.diff), notes.content(args.path),
+                                         f"version {args.diff}", "current"))
+        else:
+            versions = notes.revisions(args.path)
+            if args.json:
+                data = [{'number': number, 'time': version.time, 'chars': version.chars}
+                        for number, version in enumerate(versions)]
+                out.write(json.dumps(data) + '\n')
+            else:
+                out.writelines(f"{number}\t{format_time(version.time)}\t{version.chars} chars\n"
+                               for number, version in enumerate(versions))
+    elif command == 'restore':
+        notes.restore(args.path, args.number)
+    elif command == 'rename':
+        notes.rename(args.path, args.title)
+    elif command == 'move':
+        notes.move(args.path, args.destination, args.index)
+    elif command == 'copy':
+        item = notes.copy(args.path, args.destination, args.index)
+        if item is None:
+            raise ValueError(f"No se pudo copiar {args.path}")
+        out.write(f"id:{item['id']}\n")
+    elif command == 'reorder':
+        notes.reorder(args.path, args.index)
+    elif command == 'favourite':
+        notes.favourite(args.path, not args.off)
+    elif command == 'color':
+        notes.color(args.path, args.color)
+    elif command == 'delete':
+        notes.delete(args.path)
+    elif command in ('search', 'favourites', 'by-color'):
+        if command == 'search':
+            items = notes.search(args.query, args.limit)
+        elif command == 'favourites':
+            items = notes.favourites()
+        else:
+            items = notes.by_color(args.color)
+        if args.json:
+            out.write(json.dumps([describe(notes, item) for item in items], ensure_ascii=False, indent=2) + '\n')
+        else:
+            out.writelines(notes.path(item) + '\n' for item in items)
+    elif command == 'backup':
+        if args.list:
+            out.writelines(f"{format_time(info['time'])}\t{format_size(info['bytes'])}\t"
+                           f"{'ok' if valid else 'DAMAGED'}\t{path}\n" for path, info, valid in notes.backups())
+        else:
+            path = notes.backup()
+            if path is None:
+                raise ValueError("No se pudo hacer la copia de seguridad")
+            out.write(path + '\n')
+    elif command == 'storage':
+        stats = notes.storage()
+        if args.json:
+            out.write(json.dumps(stats) + '\n')
+        else:
+            out.writelines(f"{key}\t{storage_value(key, value)}\n" for key, value in stats.items())
+    elif command == 'colors':
+        counts = sorted(notes.colors().items(), key=lambda pair: (-pair[1], pair[0]))
+        if args.json:
+            out.write(json.dumps(dict(counts)) + '\n')
+        else:
+            out.writelines(f"{color}\t{count}\n" for color, count in counts)
+
+
+def run_batch(notes, file, out, keep_going=False):
+    """Ejecuta una orden por línea ('#' comenta) dentro de un único lote del almacén."""
+    parser = build_parser(BatchParser)
+    failures = 0
+    with notes.batch():
+        for number, text in enumerate(file, 1):
+            try:
+                argv = shlex.split(text, comments=True)
+                if argv:
+                    run(notes, parser.parse_args(argv), out)
+            except ValueError as e:
+                print(f"Línea {number}: {e}", file=sys.stderr)
+                failures += 1
+                if not keep_going:
+                    break
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        with Notes() as notes:
+            if args.command != 'batch':
+                run(notes, args, sys.stdout)
+                return 0
+            if args.file == '-':
+                return run_batch(notes, sys.stdin, sys.stdout, args.keep_going)
+            with open(args.file, 'r', encoding='utf-8') as file:
+                return run_batch(notes, file, sys.stdout, args.keep_going)
+    except BrokenPipeError:
+        # La salida se cerró antes de tiempo (pynote list | head): no es un error
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (ValueError, IOError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
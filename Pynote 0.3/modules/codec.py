@@ -0,0 +1,146 @@
+import hashlib
+import zlib
+
+# Cómo se guarda el texto de cada nota en los ficheros de contenidos (las
+# generaciones data.json.bodies.<n> y la zona de contenidos de data.pnb.<n>).
+# Una referencia 'body' es [desplazamiento, longitud] si el texto está tal
+# cual en UTF-8, o [desplazamiento, longitud, codec, tamaño] si está
+# comprimido, con el tamaño del texto sin comprimir: así los totales y la
+# lista nunca tienen que descomprimir nada. El texto se descomprime solo
+# cuando alguien lo lee (al abrir la nota, buscar o exportar).
+RAW = 0
+ZLIB = 1
+LZMA = 2
+METHODS = {'none': RAW, 'zlib': ZLIB, 'lzma': LZMA}
+
+# Si comprimido no baja de esta fracción se guarda tal cual (ya estaba comprimido)
+MIN_RATIO = 0.9
+# Por debajo de este tamaño no compensa buscar duplicados
+DEDUP_MIN = 256
+
+
+def body_size(ref):
+    """Bytes del texto sin comprimir de una referencia."""
+    return ref[3] if len(ref) > 3 else ref[1]
+
+
+def decode(data, ref):
+    """Texto de los bytes guardados para una referencia."""
+    codec = ref[2] if len(ref) > 2 else RAW
+    if codec == ZLIB:
+        data = zlib.decompress(data)
+    elif codec == LZMA:
+        import lzma  # Solo si alguien eligió lzma
+        data = lzma.decompress(data)
+    elif codec != RAW:
+        raise ValueError(f"Compresión desconocida: {codec}")
+    return data.decode('utf-8')
+
+
+class BodyCodec:
+    """Compresión de los textos a partir de `threshold` bytes y búsqueda de duplicados.
+
+    `method` es 'zlib', 'lzma' o 'none'. Los textos idénticos (por su huella
+    BLAKE2) se guardan una sola vez en cada generación y sus notas comparten
+    la referencia, y con ella la entrada de la caché al leerlos.
+    """
+
+    def __init__(self, method='zlib', threshold=4096, dedup=True):
+        if method not in METHODS:
+            raise ValueError(f"Compresión desconocida: {method}")
+        self.codec = METHODS[method]
+        self.threshold = threshold
+        self.dedup = dedup
+
+    def compress(self, data):
+        """Devuelve los bytes que se guardan y el codec con que se guardan."""
+        if self.codec == RAW or len(data) < self.threshold:
+            return data, RAW
+        if self.codec == ZLIB:
+            packed = zlib.compress(data, 6)
+        else:
+            import lzma
+            packed = lzma.compress(data)
+        if len(packed) >= len(data) * MIN_RATIO:
+            return data, RAW
+        return packed, self.codec
+
+    def writer(self, file, seen=None):
+        return BodyWriter(file, self, seen)
+
+
+class BodyWriter:
+    """Escribe los textos de una generación y devuelve su referencia.
+
+    Tiene tell() y write() como el fichero. Al añadir textos a una
+    generación existente, `seen` trae las huellas de los que ya tiene.
+    """
+
+    def __init__(self, file, codec, seen=None):
+        self.file = file
+        self.codec = codec
+        self.seen = {} if seen is None else seen  # Huella -> referencia ya escrita en esta generación
+        self.deduplicated = 0
+
+    def tell(self):
+        return self.file.tell()
+
+    def write(self, data):
+        self.file.write(data)
+
+    def add(self, text):
+        data = text.encode('utf-8')
+        key = None
+        if self.codec.dedup and len(data) >= DEDUP_MIN:
+            key = hashlib.blake2b(data, digest_size=16).hexdigest()
+            ref = self.seen.get(key)
+            if ref is not None:
+                self.deduplicated += 1
+                return list(ref)
+        stored, codec = self.codec.compress(data)
+        offset = self.file.tell()
+        self.file.write(stored)
+        ref = [offset, len(stored)] if codec == RAW else [offset, len(stored), codec, len(data)]
+        if key is not None:
+            self.seen[key] = ref
+        return list(ref)
+
+
+def body_report(items, cache_bytes=0, inline=False):
+    """Cuánto ocupa el texto de las notas en disco y en memoria, y cuánto se ahorra.
+
+    `items` recorre todas las notas. Las que tienen el texto cargado (aún
+    no pasado a una generación) cuentan tal cual en disco y en memoria.
+    Con `inline` los textos están además tal cual en otro fichero (data.json
+    lleva su propia copia): la generación no ahorra nada, así que solo se
+    cuentan los textos y lo que ocupan en memoria.
+    """
+    notes = loaded = referenced = 0
+    bodies = {}  # Posición en la generación -> (bytes guardados, bytes de texto)
+    for item in items:
+        if item.get('is_folder', False):
+            continue
+        notes += 1
+        content = item.get('content')
+        if type(content) is str:
+            loaded += len(content) if content.isascii() else len(content.encode('utf-8'))
+            continue
+        ref = item.get('body')
+        if ref:
+            referenced += body_size(ref)
+            bodies[ref[0]] = (ref[1], body_size(ref))
+    unique = sum(size for length, size in bodies.values())
+    stored = sum(length for length, size in bodies.values())
+    report = {
+        'text_notes': notes,
+        'text_bytes': loaded + referenced,
+        'text_unique_bodies': len(bodies),
+        'text_in_memory_bytes': loaded + cache_bytes,
+    }
+    if not inline:
+        report.update({
+            'text_on_disk_bytes': loaded + stored,
+            'text_saved_by_compression': unique - stored,
+            'text_saved_by_dedup': referenced - unique,
+        })
+    return report
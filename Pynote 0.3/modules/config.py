@@ -0,0 +1,52 @@
+import json
+import os
+
+from modules.database import atomic_write, data_dir
+from modules.metrics import log
+
+# Configuración de la aplicación (data/config.yaml). La usan la ventana y
+# las herramientas de línea de órdenes, así que aquí no se importa tkinter.
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = os.path.join(APP_DIR, "data", "config.yaml")
+# Copia ya interpretada de config.yaml, para no importar yaml en cada arranque
+CONFIG_CACHE = os.path.join(data_dir, "config.cache.json")
+
+
+def config_stamp():
+    info = os.stat(CONFIG_PATH)
+    return [info.st_size, info.st_mtime_ns]
+
+
+def write_config_cache(config):
+    try:
+        atomic_write(CONFIG_CACHE, json.dumps({'stamp': config_stamp(), 'config': config}))
+    except (IOError, TypeError, ValueError) as e:
+        log.warning("No se pudo guardar la caché de configuración: %s", e)
+
+
+# Función para cargar la configuración desde un archivo YAML
+def load_config():
+    if not os.path.exists(CONFIG_PATH):
+        raise FileNotFoundError(f"No se encuentra el archivo de configuración: {CONFIG_PATH}")
+
+    try:
+        with open(CONFIG_CACHE, 'r') as file:
+            cached = json.load(file)
+        if cached.get('stamp') == config_stamp():
+            return cached['config']
+    except (IOError, ValueError, AttributeError):
+        pass
+
+    import yaml  # Solo hace falta cuando config.yaml ha cambiado
+    with open(CONFIG_PATH, 'r') as file:
+        config = yaml.safe_load(file)
+    write_config_cache(config)
+    return config
+
+
+# Función para guardar la configuración en un archivo YAML
+def save_config(config):
+    import yaml
+    with open(CONFIG_PATH, 'w') as file:
+        yaml.safe_dump(config, file)
+    write_config_cache(config)
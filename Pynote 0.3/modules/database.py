@@ -1,30 +1,70 @@
 import json
 import os
 
+from modules.metrics import log, metrics
+
 user_dir = os.path.expanduser("~")
 data_dir = os.path.join(user_dir, "FastNotes")
 os.makedirs(data_dir, exist_ok=True)
 
 DATA_FILE = os.path.join(data_dir, 'data.json')
 
+def fsync_dir(path):
+    """Fuerza a disco el directorio de `path`, para que un os.replace() sobreviva a un corte de luz."""
+    if os.name == 'nt':
+        # En Windows no se pueden abrir directorios; NTFS ya registra el renombrado
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def replace_file(tmp_file, path):
+    """os.replace() que queda en disco aunque se corte la luz justo después."""
+    os.replace(tmp_file, path)
+    fsync_dir(path)
+
+def atomic_write(path, text):
+    # Escribir en un temporal, forzarlo a disco y sustituir el fichero de una vez;
+    # si falla a medias (disco lleno) el fichero anterior sigue intacto
+    tmp_file = path + '.tmp'
+    try:
+        with open(tmp_file, 'w') as file:
+            file.write(text)
+            metrics.count('bytes_written', file.tell())
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    replace_file(tmp_file, path)
+
 def load_notes():
     if not os.path.exists(DATA_FILE):
-        print("El archivo de datos no existe.")
+        log.info("El archivo de datos no existe: %s", DATA_FILE)
         return []
 
     try:
+        with metrics.timer('load_notes'), open(DATA_FILE, 'r') as file:
+            notes = json.load(file)
+    except (json.JSONDecodeError, IOError, ValueError) as e:
+        # Un data.json ilegible no se trata como vacío: se vuelve a la última copia válida
+        log.error("Error al cargar notas: %s", e)
+        from modules.backup import Backups
+        if Backups().restore(os.path.basename(DATA_FILE), DATA_FILE) is None:
+            raise
         with open(DATA_FILE, 'r') as file:
             notes = json.load(file)
-            print(f"Notas cargadas: {notes}")
-            return notes
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"Error al cargar notas: {e}")
-        return []
+    # Solo el tamaño: el contenido de las notas nunca va al registro
+    log.info("Notas cargadas: %d elementos en la raíz", len(notes))
+    return notes
 
 def save_notes(notes):
     try:
-        with open(DATA_FILE, 'w') as file:
-            json.dump(notes, file, indent=4)
-            print(f"Notas guardadas: {notes}")  # Asegúrate de que esta línea se ejecute
+        with metrics.timer('save_notes'):
+            atomic_write(DATA_FILE, json.dumps(notes, indent=4))
+        log.info("Notas guardadas: %d elementos en la raíz", len(notes))
     except IOError as e:
-        print(f"Error al guardar notas: {e}")
\ No newline at end of file
+        log.error("Error al guardar notas: %s", e)
\ No newline at end of file
@@ -0,0 +1,197 @@
+from bisect import bisect_left, bisect_right
+from itertools import compress
+
+from modules.views import DEFAULT_COLOR
+
+# Órdenes de una carpeta; 'manual' es el de la propia carpeta (el que se
+# cambia arrastrando). Las claves terminan en el título para desempatar.
+SORTS = ('manual', 'title', 'color', 'favourite', 'size', 'modified')
+# Qué elementos de la carpeta se muestran
+SHOWS = ('all', 'notes', 'folders', 'favourites')
+DEFAULT_SETTINGS = {'sort': 'manual', 'reverse': False, 'show': 'all'}
+
+
+def settings_key(folder):
+    """Clave de una carpeta en la sección 'folders' de config.yaml (None es la raíz)."""
+    return 'root' if folder is None else str(folder['id'])
+
+
+def shown(item, show):
+    if show == 'notes':
+        return not item.get('is_folder', False)
+    if show == 'folders':
+        return item.get('is_folder', False)
+    if show == 'favourites':
+        return item.get('favourite', False) is True
+    return True
+
+
+class FolderView:
+    """Elementos de una carpeta ordenados y filtrados para la lista.
+
+    La clave de orden de cada elemento se calcula una vez y se guarda por
+    identificador; quien cambia la carpeta avisa con add(), remove() o
+    update() y el elemento se coloca con bisect en vez de volver a
+    ordenar. Los totales de las carpetas (para 'size' y 'modified') se
+    piden al almacén de una vez al abrir la carpeta.
+
+    Junto a la lista ordenada se guarda el título en minúsculas de cada
+    elemento, así filtrar por texto es un único recorrido sin tocar los
+    elementos. Si el texto alarga el anterior (se está tecleando) solo se
+    recorre el resultado anterior.
+    """
+
+    def __init__(self, store, folder, sort='manual', reverse=False, show='all'):
+        self.store = store
+        self.folder = folder
+        self.sort = sort if sort in SORTS else 'manual'
+        self.reverse = reverse
+        self.show = show if show in SHOWS else 'all'
+        self.titles = {}  # Identificador -> título en minúsculas
+        self.version = 0  # Cambia con cada cambio de la carpeta
+        self.aligned = None  # (versión, elementos, títulos) de lo que se muestra sin filtrar
+        self.last = None  # (versión, texto, elementos, títulos) del último filtrado
+        self.rebuild()
+
+    def rebuild(self):
+        self.keys = []
+        self.ordered = []
+        self.folded = []  # Título en minúsculas de cada elemento de `ordered`
+        self.cached = {}  # Identificador -> clave de orden
+        self.members = set()  # Identificadores de todos los hijos, se muestren o no
+        self.version += 1
+        if self.sort == 'manual':
+            return
+        children = self.store.children(self.folder)
+        stats = self.store.children_stats(self.folder) if self.sort in ('size', 'modified') else None
+        self.members = {item['id'] for item in children}
+        if self.show != 'all':
+            keep = [shown(item, self.show) for item in children]
+            children = list(compress(children, keep))
+            stats = list(compress(stats, keep)) if stats is not None else None
+        # Las claves se calculan por columnas: es lo que cuesta al abrir una carpeta grande
+        ids = [item['id'] for item in children]
+        titles = [item['title'].casefold() for item in children]
+        if self.sort == 'title':
+            keys = titles
+        elif self.sort == 'color':
+            keys = list(zip([item.get('color', DEFAULT_COLOR) for item in children], titles))
+        elif self.sort == 'favourite':
+            keys = list(zip([item.get('favourite', False) is not True for item in children], titles))
+        elif self.sort == 'size':
+            keys = list(zip([entry.bytes for entry in stats], titles))
+        else:
+            keys = list(zip([entry.modified for entry in stats], titles))
+        self.titles = dict(zip(ids, titles))
+        self.cached = dict(zip(ids, keys))
+        # sorted() es estable: los empates quedan en el orden de la carpeta
+        positions = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in positions]
+        self.ordered = [children[i] for i in positions]
+        self.folded = [titles[i] for i in positions]
+
+    def key(self, item, stats=None):
+        title = self.title(item)
+        if self.sort == 'title':
+            return title
+        if self.sort == 'color':
+            return (item.get('color', DEFAULT_COLOR), title)
+        if self.sort == 'favourite':
+            return (item.get('favourite', False) is not True, title)
+        if stats is None:
+            stats = self.store.item_stats(item)
+        return (stats.bytes if self.sort == 'size' else stats.modified, title)
+
+    def title(self, item):
+        item_id = item['id']
+        title = self.titles.get(item_id)
+        if title is None:
+            title = self.titles[item_id] = item['title'].casefold()
+        return title
+
+    # Cambios en la carpeta
+    def add(self, item):
+        self.version += 1
+        if self.sort == 'manual':
+            return
+        self.members.add(item['id'])
+        if not shown(item, self.show):
+            return
+        key = self.cached[item['id']] = self.key(item)
+        index = bisect_right(self.keys, key)
+        self.keys.insert(index, key)
+        self.ordered.insert(index, item)
+        self.folded.insert(index, self.title(item))
+
+    def remove(self, item):
+        self.version += 1
+        self.titles.pop(item['id'], None)
+        self.members.discard(item['id'])
+        key = self.cached.pop(item['id'], None)
+        if key is None:
+            return
+        index = bisect_left(self.keys, key)
+        while self.ordered[index] is not item:
+            index += 1
+        del self.keys[index]
+        del self.ordered[index]
+        del self.folded[index]
+
+    def update(self, item):
+        """El elemento cambió (título, color, favorito, tamaño o posición) y puede cambiar de sitio."""
+        if self.sort != 'manual' and item['id'] not in self.members:
+            # No es de esta carpeta
+            self.version += 1
+            return
+        self.remove(item)
+        self.add(item)
+
+    def manual(self):
+        """True si se muestra la carpeta tal cual, en su orden y sin ocultar nada."""
+        return self.sort == 'manual' and self.show == 'all' and not self.reverse
+
+    # Lo que se muestra
+    def visible(self):
+        """Elementos a mostrar sin filtrar por texto, en orden."""
+        if self.sort != 'manual':
+            items = self.ordered
+        elif self.show == 'all':
+            # Sin orden ni filtro se muestra la lista de la carpeta tal cual
+            items = self.store.children(self.folder)
+        else:
+            items = [item for item in self.store.children(self.folder) if shown(item, self.show)]
+        return items[::-1] if self.reverse else items
+
+    def items(self, text=''):
+        """Elementos a mostrar; con `text` solo los que lo tienen en el título."""
+        text = text.casefold()
+        if not text:
+            self.last = None
+            return self.visible()
+        last = self.last
+        if last is not None and last[0] == self.version and text.startswith(last[1]):
+            items, folded = last[2], last[3]
+        else:
+            items, folded = self.unfiltered()
+        matches = [text in title for title in folded]
+        items = list(compress(items, matches))
+        self.last = (self.version, text, items, list(compress(folded, matches)))
+        return items
+
+    def unfiltered(self):
+        """visible() junto con el título de cada elemento, calculados una vez por versión.
+
+        Se puede llamar por adelantado (al quedar la ventana libre) para que
+        la primera tecla del filtro no tenga que calcular los títulos.
+        """
+        aligned = self.aligned
+        if aligned is None or aligned[0] != self.version:
+            if self.sort != 'manual':
+                items, folded = self.ordered, self.folded
+                if self.reverse:
+                    items, folded = items[::-1], folded[::-1]
+            else:
+                items = self.visible()
+                folded = [item['title'].casefold() for item in items]
+            aligned = self.aligned = (self.version, items, folded)
+        return aligned[1], aligned[2]
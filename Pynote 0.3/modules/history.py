@@ -0,0 +1,338 @@
+import json
+import os
+from collections import namedtuple
+from itertools import chain
+
+from modules.locking import FileLock, file_stamp
+from modules.metrics import log, metrics
+from modules.views import DEFAULT_COLOR
+
+# Cabecera de cada entrada. Los números van a ancho fijo para escribirla
+# antes que los registros y completarla al terminar sin mover nada; una
+# cabecera que se quedó con -1 es una entrada a medio escribir.
+HEADER = '{"bytes":%15d,"undo":%15d,"label":%s}\n'
+UNDONE = b'{"mark":"undo"}\n'
+REDONE = b'{"mark":"redo"}\n'
+# Basura tolerada en el fichero antes de reescribirlo con solo lo vivo
+COMPACT_SLACK = 1024 * 1024
+COPY_CHUNK = 1024 * 1024
+# Campos que los registros de alta no llevan: se recalculan al añadir
+SKIP_KEYS = ('contents', 'content', 'body', 'stats')
+DEFAULTS = {'color': DEFAULT_COLOR, 'favourite': False}
+
+# Entrada del historial: dónde empiezan sus registros en el fichero, cuántos
+# bytes son los de deshacer (después van los de rehacer), el total y el texto
+Entry = namedtuple('Entry', 'offset undo size label')
+
+
+def header(size, undo, label):
+    return (HEADER % (size, undo, json.dumps(label, ensure_ascii=False))).encode('utf-8')
+
+
+def encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=dict).encode('utf-8') + b'\n'
+
+
+def apply_op(store, op):
+    """Aplica un registro del historial; devuelve False si ya no tiene sentido.
+
+    Pasa cuando otro proceso (o la orden pynote) borró o volvió a crear el
+    elemento al que se refiere: el registro se salta en vez de duplicarlo.
+    """
+    kind = op['op']
+    if kind == 'clear':
+        store.clear()
+        return True
+    parent = None
+    if op.get('parent') is not None:
+        parent = store.get(op['parent'])
+        if parent is None:
+            return False
+    if kind == 'add':
+        if store.get(op['item']['id']) is not None:
+            return False
+        return store.add(parent, op['item'], op.get('index')) is not None
+    item = store.get(op['id'])
+    if item is None:
+        return False
+    if kind == 'update':
+        store.update(item, **op['fields'])
+    elif kind == 'delete':
+        store.delete(item)
+    elif kind == 'move':
+        try:
+            store.move(item, parent, op.get('index'))
+        except ValueError:
+            return False
+    else:
+        raise ValueError(f"Operación desconocida en el historial: {kind}")
+    return True
+
+
+class History:
+    """Historial de deshacer y rehacer de un almacén.
+
+    Cada cambio guarda en disco los registros que lo deshacen y los que lo
+    rehacen, con el mismo formato que el diario (add/update/delete/move/
+    clear por identificador). Un borrado se deshace volviendo a añadir el
+    elemento y lo que contiene, de uno en uno y con sus identificadores,
+    así que ni al borrar ni al deshacer se copia el árbol en memoria: en
+    memoria solo queda dónde empieza cada entrada en el fichero.
+
+    El historial se limita a `depth` entradas y `max_bytes` de fichero,
+    descartando las más antiguas (la última se conserva aunque sola supere
+    el límite). Como vive junto a los datos sobrevive a un reinicio, y
+    varias ventanas comparten el mismo: cada operación toma el cerrojo y
+    vuelve a leer el fichero si otro proceso lo cambió.
+    """
+
+    def __init__(self, store, path, depth=100, max_bytes=64 * 1024 * 1024):
+        self.store = store
+        self.path = path
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.lock = FileLock(path + '.lock') if path is not None else None
+        self.undo_stack = []
+        self.redo_stack = []
+        self.stamp = None  # Fichero tal como se leyó o escribió aquí
+
+    @property
+    def enabled(self):
+        return self.path is not None and self.depth > 0
+
+    def load(self):
+        if self.enabled:
+            with self.lock:
+                self.refresh()
+
+    def refresh(self):
+        """Vuelve a leer las cabeceras si el fichero cambió; se llama con el cerrojo."""
+        stamp = file_stamp(self.path)
+        if stamp == self.stamp:
+            return
+        self.undo_stack = []
+        self.redo_stack = []
+        if stamp is not None:
+            self.scan()
+        self.compact_if_needed()
+        self.stamp = file_stamp(self.path)
+
+    def scan(self):
+        with metrics.timer('history_load'), open(self.path, 'r+b') as file:
+            size = os.fstat(file.fileno()).st_size
+            while True:
+                start = file.tell()
+                line = file.readline()
+                if not line:
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if isinstance(entry, dict) and 'mark' in entry:
+                    source, target = ((self.undo_stack, self.redo_stack) if entry['mark'] == 'undo'
+                                      else (self.redo_stack, self.undo_stack))
+                    if source:
+                        target.append(source.pop())
+                    continue
+                if not isinstance(entry, dict) or entry.get('bytes', -1) < 0 or file.tell() + entry['bytes'] > size:
+                    # Entrada a medio escribir por un cierre inesperado: se descarta
+                    log.warning("Historial truncado en el byte %d de %s", start, self.path)
+                    file.truncate(start)
+                    break
+                # Los registros no se leen al arrancar, solo se saltan
+                self.push(Entry(file.tell(), entry['undo'], entry['bytes'], entry['label']))
+                file.seek(entry['bytes'], os.SEEK_CUR)
+
+    def push(self, entry):
+        self.redo_stack.clear()
+        self.undo_stack.append(entry)
+        while len(self.undo_stack) > 1 and (len(self.undo_stack) > self.depth or
+                                            self.live_bytes() > self.max_bytes):
+            self.undo_stack.pop(0)
+
+    def live_bytes(self):
+        return sum(entry.size for entry in chain(self.undo_stack, self.redo_stack))
+
+    def compact_if_needed(self):
+        stamp = file_stamp(self.path)
+        if stamp is None or stamp[0] <= 2 * self.live_bytes() + COMPACT_SLACK:
+            return
+        tmp_file = self.path + '.tmp'
+        # Lo que queda por rehacer se escribe como entradas seguidas de marcas de deshecho
+        entries = self.undo_stack + self.redo_stack[::-1]
+        moved = []
+        with metrics.timer('history_compact'), open(self.path, 'rb') as source, open(tmp_file, 'wb') as target:
+            for entry in entries:
+                target.write(header(entry.size, entry.undo, entry.label))
+                moved.append(entry._replace(offset=target.tell()))
+                source.seek(entry.offset)
+                remaining = entry.size
+                while remaining:
+                    chunk = source.read(min(remaining, COPY_CHUNK))
+                    target.write(chunk)
+                    remaining -= len(chunk)
+            target.write(UNDONE * len(self.redo_stack))
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(tmp_file, self.path)
+        count = len(self.undo_stack)
+        self.undo_stack = moved[:count]
+        self.redo_stack = moved[count:][::-1]
+
+    def record(self, label, undo, redo):
+        """Guarda una entrada; `undo` y `redo` son iterables de registros que se escriben según llegan.
+
+        Devuelve False si no se pudo escribir: el cambio se hace igualmente,
+        pero no se podrá deshacer.
+        """
+        if not self.enabled:
+            return False
+        with self.lock:
+            try:
+                self.refresh()
+                with open(self.path, 'r+b' if os.path.exists(self.path) else 'w+b') as file:
+                    start = file.seek(0, os.SEEK_END)
+                    try:
+                        file.write(header(-1, -1, label))
+                        offset = file.tell()
+                        file.writelines(encode(record) for record in undo)
+                        split = file.tell() - offset
+                        file.writelines(encode(record) for record in redo)
+                        size = file.tell() - offset
+                        file.seek(start)
+                        file.write(header(size, split, label))
+                    except BaseException:
+                        file.truncate(start)
+                        raise
+                metrics.count('history_bytes', size)
+                self.push(Entry(offset, split, size, label))
+                self.compact_if_needed()
+                self.stamp = file_stamp(self.path)
+            except (IOError, OSError) as e:
+                log.error("No se pudo guardar el historial de deshacer: %s", e)
+                return False
+        return True
+
+    def replay(self, offset, size):
+        """Aplica los registros de ese tramo del fichero; devuelve cuántos se saltaron."""
+        skipped = 0
+        with open(self.path, 'rb') as file, self.store.batch():
+            file.seek(offset)
+            while size > 0:
+                line = file.readline()
+                size -= len(line)
+                if not apply_op(self.store, json.loads(line)):
+                    skipped += 1
+        return skipped
+
+    def undo(self):
+        """Deshace el último cambio; devuelve (texto, registros saltados) o None si no hay nada."""
+        return self.step(undoing=True)
+
+    def redo(self):
+        return self.step(undoing=False)
+
+    def step(self, undoing):
+        if not self.enabled:
+            return None
+        with self.lock:
+            self.refresh()
+            source, target = (self.undo_stack, self.redo_stack) if undoing else (self.redo_stack, self.undo_stack)
+            if not source:
+                return None
+            entry = source[-1]
+            with metrics.timer('undo' if undoing else 'redo'):
+                if undoing:
+                    skipped = self.replay(entry.offset, entry.undo)
+                else:
+                    skipped = self.replay(entry.offset + entry.undo, entry.size - entry.undo)
+            target.append(source.pop())
+            with open(self.path, 'ab') as file:
+                file.write(UNDONE if undoing else REDONE)
+            self.stamp = file_stamp(self.path)
+        return entry.label, skipped
+
+    def label(self, undoing=True):
+        """Texto del cambio que se desharía (o rehará), o None si no hay."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            self.refresh()
+            stack = self.undo_stack if undoing else self.redo_stack
+            return stack[-1].label if stack else None
+
+    # Cambios sobre el almacén que quedan en el historial
+    def subtree_adds(self, item, parent_id, index):
+        """Registros que vuelven a crear un elemento y todo lo que contiene, de uno en uno."""
+        stack = [(item, parent_id, index)]
+        while stack:
+            item, parent_id, index = stack.pop()
+            shallow = {key: value for key, value in item.items() if key not in SKIP_KEYS}
+            if item.get('is_folder', False):
+                shallow['contents'] = []
+                # Se apilan al revés para que se añadan en orden al final de su carpeta
+                stack.extend((child, item['id'], None) for child in reversed(self.store.children(item)))
+            else:
+                shallow['content'] = self.store.content(item)
+            yield {'op': 'add', 'parent': parent_id, 'index': index, 'item': shallow}
+
+    def position(self, item):
+        """Carpeta que contiene al elemento (su id, None la raíz) y su posición en ella."""
+        ancestors = self.store.ancestors(item)
+        parent = ancestors[-1] if ancestors else None
+        siblings = self.store.children(parent)
+        index = next(i for i, sibling in enumerate(siblings) if sibling['id'] == item['id'])
+        return (parent['id'] if parent else None), index
+
+    def add(self, folder, item):
+        item = self.store.add(folder, item)
+        if item is not None:
+            parent_id = folder['id'] if folder else None
+            self.record(f"Add '{item['title']}'", [{'op': 'delete', 'id': item['id']}],
+                        self.subtree_adds(item, parent_id, None))
+        return item
+
+    def update(self, item, **fields):
+        old = {key: self.store.content(item) if key == 'content' else item.get(key, DEFAULTS.get(key))
+               for key in fields if key != 'modified'}
+        if 'content' in fields:
+            label = f"Edit '{item['title']}'"
+        elif 'title' in fields:
+            label = f"Rename '{item['title']}'"
+        elif 'favourite' in fields:
+            label = f"Favourite '{item['title']}'" if fields['favourite'] else f"Unfavourite '{item['title']}'"
+        else:
+            label = f"Change '{item['title']}'"
+        new = {key: value for key, value in fields.items() if key != 'modified'}
+        self.record(label, [{'op': 'update', 'id': item['id'], 'fields': old}],
+                    [{'op': 'update', 'id': item['id'], 'fields': new}])
+        self.store.update(item, **fields)
+
+    def delete(self, item):
+        parent_id, index = self.position(item)
+        # Se escribe antes de borrar: el contenido se lee del almacén mientras existe
+        self.record(f"Delete '{item['title']}'", self.subtree_adds(item, parent_id, index),
+                    [{'op': 'delete', 'id': item['id']}])
+        self.store.delete(item)
+
+    def move(self, item, folder, index=None):
+        parent_id, old_index = self.position(item)
+        self.store.move(item, folder, index)
+        self.record(f"Move '{item['title']}'",
+                    [{'op': 'move', 'id': item['id'], 'parent': parent_id, 'index': old_index}],
+                    [{'op': 'move', 'id': item['id'], 'parent': folder['id'] if folder else None, 'index': index}])
+
+    def copy(self, item, folder, index=None):
+        copy = self.store.copy(item, folder, index)
+        if copy is not None:
+            parent_id = folder['id'] if folder else None
+            self.record(f"Copy '{item['title']}'", [{'op': 'delete', 'id': copy['id']}],
+                        self.subtree_adds(copy, parent_id, index))
+        return copy
+
+    def clear(self):
+        items = list(self.store.children())
+        undo = chain.from_iterable(self.subtree_adds(item, None, index) for index, item in enumerate(items))
+        self.record("Clear all", undo, [{'op': 'clear'}])
+        self.store.clear()
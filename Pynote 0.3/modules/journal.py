@@ -0,0 +1,486 @@
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+from modules.codec import BodyCodec
+from modules.database import DATA_FILE, data_dir
+from modules.locking import FileLock, file_stamp
+from modules.metrics import log, metrics
+from modules.snapshot import JsonFormat, meta_file
+from modules.node import as_node
+from modules.tree import TreeIndex
+
+JOURNAL_FILE = os.path.join(data_dir, 'data.journal')
+
+
+# Funciones para navegar el árbol mediante rutas posicionales. Los diarios
+# escritos antes de que las notas tuvieran identificador usan estas rutas.
+def resolve(notes, path):
+    """Devuelve el elemento que ocupa la ruta indicada."""
+    items = notes
+    item = None
+    for index in path:
+        item = items[index]
+        items = item.get('contents', [])
+    return item
+
+
+def children(notes, path):
+    """Devuelve la lista de elementos de la carpeta indicada ([] es la raíz)."""
+    if not path:
+        return notes
+    return resolve(notes, path)['contents']
+
+
+def apply_record(tree, record):
+    """Aplica un registro del diario sobre el árbol de notas (un TreeIndex)."""
+    op = record['op']
+    if 'path' in record or isinstance(record.get('parent'), list):
+        apply_positional(tree, record)
+    elif op == 'add':
+        tree.add(record['parent'], record['item'], record.get('index'))
+    elif op == 'update':
+        tree.update(record['id'], record['fields'])
+    elif op == 'delete':
+        tree.delete(record['id'], record.get('time', 0))
+    elif op == 'move':
+        tree.move(record['id'], record['parent'], record.get('index'), record.get('time', 0))
+    elif op == 'assign_ids':
+        tree.assign_ids(record['ids'])
+    elif op == 'clear':
+        tree.clear()
+    else:
+        raise ValueError(f"Operación desconocida en el diario: {op}")
+
+
+def apply_positional(tree, record):
+    """Aplica un registro antiguo que señala los elementos por su posición."""
+    notes = tree.notes
+    # Sin identificadores no se sabe qué carpetas cambian ni qué totales
+    tree.touch_all()
+    tree.stale_stats = True
+    tree.views = None
+    op = record['op']
+    if op == 'add':
+        parent = resolve(notes, record['parent'])
+        item = as_node(record['item'])
+        children(notes, record['parent']).append(item)
+        tree.register([item], parent.get('id') if parent else None)
+    elif op == 'update':
+        tree.update_item(resolve(notes, record['path']), record['fields'])
+    elif op == 'delete':
+        path = record['path']
+        tree.unregister(children(notes, path[:-1]).pop(path[-1]))
+    elif op == 'move':
+        # La carpeta destino se resuelve antes de retirar el elemento
+        path = record['path']
+        parent = resolve(notes, record['parent'])
+        target = children(notes, record['parent'])
+        item = children(notes, path[:-1]).pop(path[-1])
+        if record.get('index') is None:
+            target.append(item)
+        else:
+            target.insert(record['index'], item)
+        if 'id' in item:
+            tree.parents[item['id']] = parent.get('id') if parent else None
+    else:
+        raise ValueError(f"Operación desconocida en el diario: {op}")
+
+
+def read_journal(journal_file):
+    """Lee los registros de un diario, ignorando una última línea incompleta."""
+    if not os.path.exists(journal_file):
+        return []
+
+    records = []
+    with open(journal_file, 'r', encoding='utf-8') as file:
+        for line in file:
+            # Una escritura interrumpida solo puede dejar truncada la última línea
+            if not line.endswith('\n'):
+                break
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+def truncate_torn(journal_file):
+    """Recorta una última línea incompleta para poder seguir añadiendo."""
+    if not os.path.exists(journal_file):
+        return
+    with open(journal_file, 'rb+') as file:
+        data = file.read()
+        if data and not data.endswith(b'\n'):
+            file.truncate(data.rfind(b'\n') + 1)
+
+
+class Journal:
+    """Almacén de notas basado en una instantánea más un diario de cambios.
+
+    Cada modificación se añade como una línea al diario, de modo que su coste
+    depende del tamaño del cambio y no del número de notas. Cuando el diario
+    crece demasiado se rota y un hilo en segundo plano lo compacta sobre la
+    instantánea: data.json, con el formato de siempre, o con `snapshot`
+    'binary' las generaciones binarias de modules.binary.
+
+    Varios procesos pueden compartir el mismo diario: cada escritura se hace
+    con el cerrojo de data.json.lock y, antes de añadir la suya, cada proceso
+    aplica los registros que los demás añadieron desde su última lectura
+    (catch_up). Como todos aplican la misma secuencia, todos los árboles
+    coinciden. Solo compacta un proceso a la vez (data.json.compact.lock).
+    """
+
+    def __init__(self, data_file=DATA_FILE, journal_file=JOURNAL_FILE, compact_after=1000, snapshot='json',
+                 codec=None):
+        self.data_file = data_file
+        self.journal_file = journal_file
+        self.rotated_file = journal_file + '.1'
+        # Cómo se guardan los textos en las generaciones de la instantánea
+        codec = codec or BodyCodec()
+        if snapshot == 'binary':
+            from modules.binary import BinaryFormat
+            self.snapshot = BinaryFormat(data_file, codec)
+        elif snapshot == 'json':
+            self.snapshot = JsonFormat(data_file, codec)
+        else:
+            raise ValueError(f"Formato de instantánea desconocido: {snapshot}")
+        self.compact_after = compact_after
+        self.notes = []
+        self.tree = TreeIndex(self.notes)
+        self.pending = 0
+        self.file = None
+        self.last_backup = None
+        self.compactor = None
+        self.bodies = None  # Generación de contenidos de la que se cargaron las notas
+        self.lock = FileLock(data_file + '.lock')
+        self.compact_lock = FileLock(data_file + '.compact.lock')
+        self.offset = 0  # Hasta dónde se han aplicado los registros del diario abierto
+        self.data_stamp = None  # data.json tal como se vio por última vez
+        self.on_foreign = None  # Aplica los registros de otros procesos (por defecto, sobre el árbol)
+        self.buffer = None  # Registros de un lote aún sin escribir (ver batch)
+        self.backups = None  # Copias de seguridad de la instantánea (modules.backup)
+        self.recovered = None  # Información de la copia de la que se recuperó la instantánea al cargar
+
+    def load(self):
+        """Carga la instantánea y reproduce los diarios pendientes."""
+        with self.lock:
+            # Si otro proceso está compactando, la confirmación es cosa suya
+            if self.compact_lock.acquire(blocking=False):
+                try:
+                    self.snapshot.recover(self.rotated_file)
+                finally:
+                    self.compact_lock.release()
+            try:
+                self.notes, self.bodies, unexpanded = self.snapshot.load()
+            except (ValueError, struct.error) as e:
+                # Una instantánea ilegible nunca se carga como vacía (el siguiente
+                # guardado la pisaría): se vuelve a la última copia de seguridad
+                # válida y, si no hay, el error llega a quien carga sin tocar nada
+                log.error("Error al cargar notas: %s", e)
+                self.recovered = self.restore_backup()
+                if self.recovered is None:
+                    raise
+                self.notes, self.bodies, unexpanded = self.snapshot.load()
+
+            # Con la instantánea binaria las carpetas se leen al abrirlas
+            self.tree = TreeIndex(self.notes, self.bodies, unexpanded)
+            self.tree.root_modified = self.snapshot.root_modified
+            records = read_journal(self.rotated_file) + read_journal(self.journal_file)
+            for record in records:
+                self.apply(record)
+            self.pending = len(records)
+
+            truncate_torn(self.journal_file)
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.journal_file, 'ab+')
+            self.offset = self.file.seek(0, os.SEEK_END)
+            self.data_stamp = file_stamp(self.data_file)
+            if os.path.exists(self.rotated_file):
+                self.start_compactor()
+        return self.notes
+
+    def apply(self, record, tree=None):
+        """Aplica un registro; uno que ya no encaja (otro proceso borró su nota) se descarta."""
+        try:
+            apply_record(self.tree if tree is None else tree, record)
+        except KeyError as e:
+            log.warning("Cambio del diario descartado, el elemento %s ya no existe", e)
+            return False
+        return True
+
+    def read_body(self, ref):
+        """Texto de una nota cuyo contenido aún no se ha cargado."""
+        return self.bodies.read(ref)
+
+    def disk_bytes(self):
+        """Lo que ocupan en disco la instantánea y los diarios."""
+        total = 0
+        for path in self.snapshot.disk_files() + [self.journal_file, self.rotated_file]:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                # No existe (o se acaba de borrar)
+                pass
+        return total
+
+    def keep_bodies(self):
+        # La generación cargada sigue en uso mientras la aplicación esté abierta
+        return (self.bodies.name,) if self.bodies is not None else ()
+
+    def append(self, record):
+        """Aplica un registro en memoria y lo añade al diario.
+
+        Devuelve False si el cambio ya no tiene sentido porque otro proceso
+        borró el elemento al que se refiere.
+        """
+        with self.lock:
+            if self.buffer is None:
+                self.catch_up()
+            if not self.apply(record):
+                return False
+            line = (json.dumps(record, ensure_ascii=False, default=dict) + '\n').encode('utf-8')
+            if self.buffer is not None:
+                self.buffer.append(line)
+            else:
+                self.write([line])
+        return True
+
+    @contextmanager
+    def batch(self):
+        """Agrupa los registros en una sola escritura del diario.
+
+        El cerrojo se mantiene durante todo el lote, así que los demás
+        procesos esperan a que termine (y ven todos sus registros juntos).
+        """
+        with self.lock:
+            self.catch_up()
+            self.buffer = []
+            try:
+                yield
+            finally:
+                # Los registros ya están aplicados en memoria: se escriben aunque el lote falle
+                lines, self.buffer = self.buffer, None
+                if lines:
+                    self.write(lines)
+
+    def write(self, lines):
+        data = b''.join(lines)
+        self.file.write(data)
+        self.file.flush()
+        self.offset = self.file.tell()
+        metrics.count('journal_records', len(lines))
+        metrics.count('bytes_written', len(data))
+        self.pending += len(lines)
+        if self.pending >= self.compact_after:
+            self.compact()
+
+    def catch_up(self):
+        """Aplica los registros que otros procesos añadieron desde la última lectura.
+
+        Si otro proceso rotó el diario se termina de leer el antiguo (que
+        sigue abierto) y se pasa al nuevo. Hay que llamarlo con el cerrojo.
+        Devuelve cuántos registros se aplicaron.
+        """
+        applied = self.read_new()
+        stamp = file_stamp(self.journal_file)
+        if stamp is None or stamp[2] != os.fstat(self.file.fileno()).st_ino:
+            self.file.close()
+            self.file = open(self.journal_file, 'ab+')
+            self.offset = 0
+            self.pending = 0
+            applied += self.read_new()
+        return applied
+
+    def read_new(self):
+        self.file.seek(self.offset)
+        data = self.file.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            # Con el cerrojo nadie está escribiendo: es una línea cortada por un fallo
+            self.file.truncate(self.offset + end)
+        applied = 0
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                log.warning("Registro ilegible en el diario compartido")
+                continue
+            if self.on_foreign is not None:
+                self.on_foreign(record)
+            else:
+                self.apply(record)
+            applied += 1
+        self.offset += end
+        self.pending += applied
+        metrics.count('foreign_records', applied)
+        return applied
+
+    def replaced(self):
+        """True si otro programa reescribió data.json sin pasar por el diario.
+
+        Pynote escribe siempre data.json.meta después de data.json y con el
+        cerrojo, así que un data.json más reciente que su índice lo escribió
+        otro programa (por ejemplo un script de sincronización).
+        """
+        stamp = file_stamp(self.data_file)
+        if stamp == self.data_stamp:
+            return False
+        self.data_stamp = stamp
+        if stamp is None or not isinstance(self.snapshot, JsonFormat):
+            return False
+        meta = file_stamp(meta_file(self.data_file))
+        return meta is None or meta[1] < stamp[1]
+
+    def compact(self):
+        """Rota el diario y lo compacta en segundo plano."""
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        with self.lock:
+            if os.path.exists(self.rotated_file):
+                # Queda una compactación sin terminar (o la está haciendo otro proceso)
+                self.start_compactor()
+                return
+            self.catch_up()
+            self.file.close()
+            try:
+                os.replace(self.journal_file, self.rotated_file)
+            except OSError as e:
+                # En Windows no se puede renombrar mientras otro proceso lo tenga abierto
+                log.warning("No se pudo rotar el diario: %s", e)
+            else:
+                self.pending = 0
+            self.file = open(self.journal_file, 'ab+')
+            self.offset = self.file.seek(0, os.SEEK_END)
+            self.start_compactor()
+
+    def start_compactor(self):
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        self.compactor = threading.Thread(target=self.compact_rotated, daemon=True)
+        self.compactor.start()
+
+    def compact_rotated(self):
+        """Reproduce el diario rotado sobre la instantánea en disco.
+
+        Trabaja solo con ficheros, así que nunca comparte el árbol con la
+        interfaz. El orden de los pasos permite recuperarse de un corte en
+        cualquier punto: la existencia del fichero .next confirma el trabajo.
+        La confirmación se hace con el cerrojo, para que ningún proceso cargue
+        la instantánea a medio sustituir.
+        """
+        if not self.compact_lock.acquire(blocking=False):
+            return
+        try:
+            if not os.path.exists(self.rotated_file):
+                return
+            with metrics.timer('compact'):
+                tree = TreeIndex(self.snapshot.read())
+                for record in read_journal(self.rotated_file):
+                    self.apply(record, tree)
+                tree.ensure_stats()
+                # El árbol propio tiene al menos los mismos cambios que el diario rotado
+                self.snapshot.write(tree.notes, keep=self.keep_bodies(), rotated_file=self.rotated_file,
+                                    dirty=tree.take_dirty(), lock=self.lock,
+                                    modified=max(tree.root_modified, self.tree.root_modified))
+        except (json.JSONDecodeError, IOError, KeyError, ValueError) as e:
+            log.error("Error al compactar el diario: %s", e)
+        else:
+            # Cada instantánea compactada se copia aunque no toque por tiempo: así la
+            # copia más reciente es siempre la base del diario vivo y recuperarla
+            # con ese diario no se salta ningún cambio ya compactado. Con el cerrojo
+            # de compactación nadie más sustituye la instantánea mientras se copia.
+            self.last_backup = self.save_backup()
+        finally:
+            self.compact_lock.release()
+
+    def backup(self, force=False):
+        """Copia de seguridad de la instantánea si ya toca (con `force`, siempre); devuelve su ruta o None.
+
+        Con `force`, lo que solo está en el diario se compacta antes en la
+        instantánea, de modo que la copia lo incluye. Un fallo se registra y
+        no impide guardar.
+        """
+        if self.backups is None or not (force or self.backups.due(self.snapshot.backup_name())):
+            return None
+        if force and self.file is not None and self.journaled():
+            # La compactación hace la copia al terminar; si ya había una en marcha,
+            # se espera a que acabe para compactar también lo que llegó después
+            self.wait()
+            self.last_backup = None
+            self.compact()
+            self.wait()
+            return self.last_backup
+        return self.save_backup()
+
+    def journaled(self):
+        """True si hay cambios en el diario que aún no están en la instantánea (o no hay instantánea)."""
+        stamp = file_stamp(self.journal_file)
+        return (self.snapshot.current_file() is None or os.path.exists(self.rotated_file)
+                or (stamp is not None and stamp[0] > 0))
+
+    def save_backup(self):
+        if self.backups is None or self.backups.keep <= 0:
+            return None
+        try:
+            with self.lock:
+                path = self.snapshot.current_file()
+                if path is None:
+                    return None
+                source = open(path, 'rb')
+            # Se comprime sin el cerrojo: lo abierto se sigue leyendo aunque otro proceso lo sustituya
+            with source:
+                return self.backups.save(self.snapshot.backup_name(), source)
+        except (IOError, OSError) as e:
+            log.error("No se pudo hacer la copia de seguridad: %s", e)
+            return None
+
+    def restore_backup(self):
+        """Sustituye la instantánea ilegible por la última copia válida; devuelve su información o None."""
+        if self.backups is None:
+            return None
+        return self.backups.restore(self.snapshot.backup_name(), self.snapshot.restore_target(),
+                                    self.snapshot.current_file())
+
+    def start_indexer(self):
+        """Genera en segundo plano el índice de metadatos si aún no existe."""
+        if not self.snapshot.needs_index(self.bodies):
+            return
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        self.compactor = threading.Thread(target=self.index_snapshot, daemon=True)
+        self.compactor.start()
+
+    def index_snapshot(self):
+        try:
+            self.snapshot.build_index(lock=self.lock)
+        except (json.JSONDecodeError, IOError, ValueError) as e:
+            log.error("Error al indexar la instantánea: %s", e)
+
+    def fold(self):
+        """Vuelca el diario completo en la instantánea y lo elimina."""
+        self.close()
+        with self.lock:
+            if self.pending or os.path.exists(self.rotated_file):
+                self.snapshot.write(self.notes, self.read_body, keep=self.keep_bodies(),
+                                    children_of=self.tree.reader(), dirty=self.tree.take_dirty(),
+                                    modified=self.tree.root_modified)
+            for path in (self.rotated_file, self.journal_file):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def wait(self):
+        """Espera a que termine la compactación o el indexado en curso."""
+        if self.compactor is not None:
+            self.compactor.join()
+
+    def close(self):
+        """Cierra el diario esperando a que termine la compactación en curso."""
+        self.wait()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.snapshot.close()
@@ -0,0 +1,293 @@
+import tkinter as tk
+from tkinter import font as tkfont
+
+# Píxeles que hay que mover el ratón con el botón pulsado para empezar a arrastrar
+DRAG_THRESHOLD = 5
+# Bit de Control en event.state: soltar con Control copia en vez de mover
+CONTROL_MASK = 0x0004
+
+
+class VirtualListbox(tk.Frame):
+    """Lista que solo dibuja las filas visibles más un pequeño margen.
+
+    El modelo es una lista de Python que pertenece a quien llama; la vista
+    obtiene el texto y el color de cada fila con `formatter(index, item)`
+    únicamente cuando esa fila entra en pantalla. Ofrece la parte de la
+    interfaz de tk.Listbox que usa la aplicación (curselection, nearest,
+    selection_set, selection_clear, bind y <<ListboxSelect>>).
+
+    Con enable_drag() las filas se pueden arrastrar para reordenarlas o
+    soltarlas encima de otra (una carpeta); la lista solo dibuja la marca
+    de dónde caerían y avisa al soltar, quien llama cambia el modelo.
+    """
+
+    def __init__(self, master, overscan=5, foreground="black", selectbackground="#c3c3c3", **kwargs):
+        super().__init__(master, **kwargs)
+        self.overscan = overscan
+        self.foreground = foreground
+        self.selectbackground = selectbackground
+        self.font = tkfont.nametofont("TkDefaultFont")
+        self.row_height = self.font.metrics("linespace") + 4
+
+        self.canvas = tk.Canvas(self, highlightthickness=0, takefocus=1)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.items = []
+        self.formatter = lambda index, item: (str(item), "white")
+        self.offset = 0  # Desplazamiento vertical en píxeles
+        self.selected = None
+        self.rows = {}  # Índice del modelo -> (rectángulo, texto) en el canvas
+        self.spare = []  # Filas del canvas libres para reutilizar
+
+        # Arrastrar y soltar (desactivado hasta enable_drag)
+        self.on_drop = None
+        self.can_drop_into = None
+        self.on_drop_outside = None
+        self.press = None  # (fila, y) donde se pulsó el botón
+        self.dragging = False
+        self.marker = self.canvas.create_line(0, 0, 0, 0, width=2, state=tk.HIDDEN)
+        self.target_box = self.canvas.create_rectangle(0, 0, 0, 0, width=2, state=tk.HIDDEN)
+
+        self.canvas.bind("<Configure>", lambda event: self.render())
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<B1-Motion>", self.on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self.on_release)
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self.yview("scroll", -3, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.yview("scroll", 3, "units"))
+        self.canvas.bind("<Up>", lambda event: self.move_selection(-1))
+        self.canvas.bind("<Down>", lambda event: self.move_selection(1))
+
+    # Modelo
+    def set_items(self, items, formatter=None):
+        """Muestra una nueva lista de elementos desde el principio."""
+        self.items = items
+        if formatter is not None:
+            self.formatter = formatter
+        self.offset = 0
+        self.selected = None
+        self.refresh()
+
+    def update_items(self, items):
+        """Cambia la lista mostrada (por ejemplo reordenada) sin volver al principio."""
+        self.items = items
+        self.refresh()
+
+    def refresh(self):
+        """Vuelve a dibujar las filas visibles tras añadir o quitar elementos."""
+        if self.selected is not None and self.selected >= len(self.items):
+            self.selected = None
+        for index in list(self.rows):
+            self.release_row(index)
+        self.clamp_offset()
+        self.render()
+
+    def enable_drag(self, on_drop, can_drop_into=None, on_drop_outside=None):
+        """Permite arrastrar filas.
+
+        Al soltar se llama a `on_drop(fila, índice, dentro, copiar)`: con
+        `dentro` el elemento se soltó encima de la fila `índice` (solo las
+        que acepta `can_drop_into(elemento)`); si no, `índice` es su nueva
+        posición contando la lista sin él. Soltar fuera de la lista llama a
+        `on_drop_outside(fila, widget, copiar)`. `copiar` indica si se soltó
+        con Control pulsado.
+        """
+        self.on_drop = on_drop
+        self.can_drop_into = can_drop_into
+        self.on_drop_outside = on_drop_outside
+
+    def update_row(self, index):
+        """Actualiza en su sitio una fila cuyo título, color o favorito cambió."""
+        if index in self.rows:
+            self.draw_row(index, self.rows[index])
+
+    # Interfaz compatible con tk.Listbox
+    def bind(self, sequence=None, func=None, add=None):
+        return self.canvas.bind(sequence, func, add)
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def nearest(self, y):
+        if not self.items:
+            return -1
+        return max(0, min(len(self.items) - 1, (int(y) + self.offset) // self.row_height))
+
+    def selection_clear(self, first=0, last=None):
+        previous = self.selected
+        self.selected = None
+        if previous is not None:
+            self.update_row(previous)
+
+    def selection_set(self, index):
+        if not 0 <= index < len(self.items):
+            return
+        self.selection_clear()
+        self.selected = index
+        self.update_row(index)
+
+    def see(self, index):
+        top = index * self.row_height
+        height = self.canvas.winfo_height()
+        if top < self.offset:
+            self.offset = top
+        elif top + self.row_height > self.offset + height:
+            self.offset = top + self.row_height - height
+        self.clamp_offset()
+        self.render()
+
+    # Desplazamiento
+    def total_height(self):
+        return len(self.items) * self.row_height
+
+    def clamp_offset(self):
+        limit = max(0, self.total_height() - self.canvas.winfo_height())
+        self.offset = max(0, min(self.offset, limit))
+
+    def yview(self, *args):
+        if not args:
+            return self.fractions()
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * self.total_height())
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= max(1, self.canvas.winfo_height() // self.row_height - 1)
+            self.offset += amount * self.row_height
+        self.clamp_offset()
+        self.render()
+
+    def fractions(self):
+        total = self.total_height()
+        if total == 0:
+            return 0.0, 1.0
+        return self.offset / total, min(1.0, (self.offset + self.canvas.winfo_height()) / total)
+
+    def on_wheel(self, event):
+        self.yview("scroll", -1 if event.delta > 0 else 1, "units")
+
+    # Dibujo
+    def render(self):
+        """Coloca en el canvas solo las filas visibles y el margen de overscan."""
+        height = self.canvas.winfo_height()
+        first = max(0, self.offset // self.row_height - self.overscan)
+        last = min(len(self.items), (self.offset + height) // self.row_height + 1 + self.overscan)
+
+        for index in [index for index in self.rows if not first <= index < last]:
+            self.release_row(index)
+        for index in range(first, last):
+            row = self.rows.get(index)
+            if row is None:
+                row = self.spare.pop() if self.spare else (
+                    self.canvas.create_rectangle(0, 0, 0, 0, outline=""),
+                    self.canvas.create_text(0, 0, anchor=tk.W, font=self.font))
+                self.rows[index] = row
+                self.draw_row(index, row)
+            self.place_row(index, row)
+        if self.dragging:
+            self.canvas.tag_raise(self.marker)
+            self.canvas.tag_raise(self.target_box)
+        self.scrollbar.set(*self.fractions())
+
+    def place_row(self, index, row):
+        rect, text = row
+        top = index * self.row_height - self.offset
+        self.canvas.coords(rect, 0, top, self.canvas.winfo_width(), top + self.row_height)
+        self.canvas.coords(text, 4, top + self.row_height // 2)
+
+    def draw_row(self, index, row):
+        rect, text = row
+        label, color = self.formatter(index, self.items[index])
+        fill = self.selectbackground if index == self.selected else color
+        self.canvas.itemconfigure(rect, fill=fill, state=tk.NORMAL)
+        self.canvas.itemconfigure(text, text=label, fill=self.foreground, state=tk.NORMAL)
+
+    def release_row(self, index):
+        row = self.rows.pop(index)
+        for canvas_item in row:
+            self.canvas.itemconfigure(canvas_item, state=tk.HIDDEN)
+        self.spare.append(row)
+
+    # Eventos
+    def on_click(self, event):
+        self.canvas.focus_set()
+        index = self.nearest(event.y)
+        self.press = None
+        if index >= 0:
+            self.selection_set(index)
+            self.event_generate_select()
+            if self.on_drop is not None:
+                self.press = (index, event.y)
+
+    def drop_target(self, y):
+        """(índice, dentro) de donde caería la fila arrastrada si se suelta en `y`."""
+        position = (int(y) + self.offset) / self.row_height
+        index = int(position)
+        if 0 <= index < len(self.items) and index != self.press[0] and self.can_drop_into is not None:
+            # El centro de una carpeta es soltar dentro; los bordes, ponerlo antes o después
+            if 0.25 <= position - index <= 0.75 and self.can_drop_into(self.items[index]):
+                return index, True
+        return max(0, min(len(self.items), round(position))), False
+
+    def on_drag(self, event):
+        if self.press is None:
+            return
+        if not self.dragging:
+            if abs(event.y - self.press[1]) < DRAG_THRESHOLD:
+                return
+            self.dragging = True
+            self.canvas.config(cursor="hand2")
+        # Cerca de los bordes la lista se desplaza sola
+        if event.y < self.row_height:
+            self.yview("scroll", -1, "units")
+        elif event.y > self.canvas.winfo_height() - self.row_height:
+            self.yview("scroll", 1, "units")
+        index, into = self.drop_target(event.y)
+        width = self.canvas.winfo_width()
+        top = index * self.row_height - self.offset
+        if into:
+            self.canvas.coords(self.target_box, 1, top + 1, width - 1, top + self.row_height - 1)
+            self.canvas.itemconfigure(self.target_box, outline=self.foreground, state=tk.NORMAL)
+            self.canvas.itemconfigure(self.marker, state=tk.HIDDEN)
+        else:
+            self.canvas.coords(self.marker, 0, top, width, top)
+            self.canvas.itemconfigure(self.marker, fill=self.foreground, state=tk.NORMAL)
+            self.canvas.itemconfigure(self.target_box, state=tk.HIDDEN)
+        self.canvas.tag_raise(self.marker)
+        self.canvas.tag_raise(self.target_box)
+
+    def on_release(self, event):
+        press, dragging = self.press, self.dragging
+        self.press = None
+        self.dragging = False
+        if not dragging:
+            return
+        self.canvas.config(cursor="")
+        self.canvas.itemconfigure(self.marker, state=tk.HIDDEN)
+        self.canvas.itemconfigure(self.target_box, state=tk.HIDDEN)
+        source = press[0]
+        copy = bool(event.state & CONTROL_MASK)
+        widget = self.winfo_containing(event.x_root, event.y_root)
+        if widget is not self.canvas:
+            if widget is not None and self.on_drop_outside is not None:
+                self.on_drop_outside(source, widget, copy)
+            return
+        index, into = self.drop_target(event.y)
+        if not into and index > source and not copy:
+            # La posición nueva se cuenta sin el elemento que se mueve
+            index -= 1
+        if into or copy or index != source:
+            self.on_drop(source, index, into, copy)
+
+    def move_selection(self, step):
+        if not self.items:
+            return
+        index = 0 if self.selected is None else max(0, min(len(self.items) - 1, self.selected + step))
+        self.selection_set(index)
+        self.see(index)
+        self.event_generate_select()
+
+    def event_generate_select(self):
+        self.canvas.event_generate("<<ListboxSelect>>")
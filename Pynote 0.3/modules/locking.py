@@ -0,0 +1,91 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+
+class FileLock:
+    """Cerrojo consultivo entre procesos sobre un fichero auxiliar.
+
+    Varias ventanas de Pynote (o un script de sincronización que respete el
+    cerrojo) pueden compartir el mismo almacén: solo escribe quien lo tiene.
+    Es reentrante dentro del proceso, así que un método que ya lo tiene puede
+    llamar a otro que también lo pide. Usa flock en POSIX y msvcrt.locking
+    en Windows; si no hay ninguno solo protege entre hilos.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def acquire(self, blocking=True):
+        if not self.thread_lock.acquire(blocking):
+            return False
+        if self.depth == 0:
+            try:
+                if not self.lock_file(blocking):
+                    self.thread_lock.release()
+                    return False
+            except BaseException:
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            self.unlock_file()
+        self.thread_lock.release()
+
+    def lock_file(self, blocking):
+        self.file = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            elif msvcrt is not None:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self.file.close()
+            self.file = None
+            if blocking:
+                raise
+            return False
+        return True
+
+    def unlock_file(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def file_stamp(path):
+    """Tamaño, fecha e inodo de un fichero (None si no existe) para detectar cambios."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return (info.st_size, info.st_mtime_ns, info.st_ino)
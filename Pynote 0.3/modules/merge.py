@@ -0,0 +1,180 @@
+from modules.node import as_node
+
+
+def index_snapshot(notes):
+    """Elementos, carpeta y lista de hijos de cada identificador de una instantánea."""
+    items, parents, children = {}, {}, {None: []}
+    stack = [(notes, None)]
+    while stack:
+        folder_items, parent_id = stack.pop()
+        for item in folder_items:
+            item_id = item.get('id')
+            if item_id is None:
+                continue
+            items[item_id] = item
+            parents[item_id] = parent_id
+            children[parent_id].append(item_id)
+            if item.get('is_folder', False):
+                children[item_id] = []
+                stack.append((item.get('contents', []), item_id))
+    return items, parents, children
+
+
+def merge_snapshot(tree, theirs, edits, read_content):
+    """Fusiona en `tree` la instantánea `theirs` que escribió otro proceso.
+
+    Es una fusión a tres bandas cuya base es la instantánea que este proceso
+    cargó o escribió por última vez: lo que no aparece en `edits` (los
+    cambios propios desde entonces) se toma de `theirs`, y en lo que ambos
+    cambiaron gana lo propio. Se decide campo a campo: si aquí se renombró
+    una nota y allí se cambió su texto, quedan las dos cosas; la carpeta
+    de un elemento solo es la propia si aquí se movió. Un elemento que ellos borraron se conserva si
+    aquí se modificó algo dentro; lo que aquí se borró sigue borrado. Los
+    elementos se actualizan en su sitio, así que la interfaz puede seguir
+    usando los mismos objetos.
+
+    Devuelve las carpetas (None es la raíz) cuya lista cambió, para que la
+    interfaz solo vuelva a mostrar esas.
+    """
+    tree.expand_all()
+    their_items, their_parents, their_children = index_snapshot(theirs)
+    changed = set()
+
+    # Campos que este proceso no cambió
+    for item_id, their in their_items.items():
+        ours = tree.nodes.get(item_id)
+        if ours is None or edits.fields.get(item_id, ()) is None:
+            continue
+        fields = {key: value for key, value in their.items() if key != 'contents'}
+        updates = {}
+        for key, value in fields.items():
+            if key == 'modified':
+                # Cambiado en los dos lados (cada cambio lo actualiza): vale el más reciente
+                if value != ours.get(key) and (not edits.owns(item_id, key) or value > ours.get(key, 0)):
+                    updates[key] = value
+            elif edits.owns(item_id, key):
+                continue
+            elif key == 'content':
+                if read_content(ours) != value:
+                    updates[key] = value
+            elif ours.get(key) != value:
+                updates[key] = value
+        stale = [key for key in ours
+                 if key not in fields and key not in ('contents', 'body') and not edits.owns(item_id, key)]
+        if 'body' in ours and 'content' not in fields and not edits.owns(item_id, 'content'):
+            stale.append('body')
+        if updates or stale:
+            for key in stale:
+                del ours[key]
+            tree.update_item(ours, updates)
+            changed.add(tree.parents.get(item_id))
+
+    # Carpeta de cada elemento que sobrevive: lo suyo va donde ellos lo
+    # dejaron salvo que aquí se moviera o editara; lo propio que ellos no
+    # tienen se mantiene si se creó o modificó aquí, con sus carpetas
+    targets = {}
+    for item_id in their_items:
+        if item_id in edits.removed:
+            continue
+        if item_id in tree.nodes and item_id in edits.moved:
+            targets[item_id] = tree.parents[item_id]
+        else:
+            targets[item_id] = their_parents[item_id]
+    for item_id in edits.edited:
+        while item_id in tree.nodes:
+            targets.setdefault(item_id, tree.parents[item_id])
+            item_id = tree.parents[item_id]
+
+    # Un ciclo (ellos metieron A en B y aquí B en A) se rompe con la carpeta propia
+    for item_id in list(targets):
+        seen = set()
+        parent_id = targets[item_id]
+        while parent_id is not None and parent_id != item_id and parent_id not in seen:
+            seen.add(parent_id)
+            parent_id = targets.get(parent_id)
+        if parent_id == item_id and item_id in tree.nodes:
+            targets[item_id] = tree.parents[item_id]
+
+    # Sobrevive lo que llega a la raíz: lo que estaba en una carpeta borrada se va con ella
+    alive = {None: True}
+    for item_id in targets:
+        path = []
+        while item_id not in alive:
+            path.append(item_id)
+            item_id = targets.get(item_id, item_id)
+            if item_id in path:
+                alive[item_id] = False
+        for seen in path:
+            alive[seen] = alive[item_id]
+
+    added = {}
+
+    def node(item_id):
+        item = tree.nodes.get(item_id)
+        if item is None:
+            # Elemento que añadieron ellos; sus hijos se colocan como los demás
+            item = added.get(item_id)
+            if item is None:
+                item = added[item_id] = as_node(their_items[item_id])
+        return item
+
+    members = {}
+    for item_id, parent_id in targets.items():
+        if alive[item_id]:
+            members.setdefault(parent_id, set()).add(item_id)
+
+    # Orden de cada carpeta: el suyo si aquí no se tocó, si no el propio, y
+    # lo que falta se coloca en la posición que tenía en el otro orden
+    lists = {}
+    for folder_id in [None] + [item_id for item_id, ok in alive.items()
+                               if ok and item_id is not None and node(item_id).get('is_folder', False)]:
+        wanted = members.get(folder_id, set())
+        ours = ([item.get('id') for item in tree.children(folder_id)]
+                if folder_id is None or folder_id in tree.nodes else [])
+        their_list = their_children.get(folder_id) or []
+        if folder_id in their_children and folder_id not in edits.reordered:
+            first, second = their_list, ours
+        else:
+            first, second = ours, their_list
+        order = [item_id for item_id in first if item_id in wanted]
+        present = set(order)
+        positions = {item_id: i for i, item_id in enumerate(second)}
+        for item_id in second + first:
+            if item_id in wanted and item_id not in present:
+                present.add(item_id)
+                order.insert(min(positions.get(item_id, len(order)), len(order)), item_id)
+        lists[folder_id] = order
+        if order != ours:
+            changed.add(folder_id)
+
+    # Los elementos sin identificador (de versiones anteriores) se quedan al final
+    nodes = {item_id: node(item_id) for order in lists.values() for item_id in order}
+    for folder_id, order in lists.items():
+        keep = [item for item in (tree.notes if folder_id is None else nodes[folder_id].get('contents', []))
+                if item.get('id') is None]
+        items = [nodes[item_id] for item_id in order] + keep
+        if folder_id is None:
+            tree.notes[:] = items
+        elif folder_id not in changed and folder_id in tree.nodes:
+            continue
+        else:
+            nodes[folder_id]['contents'] = items
+    tree.rebuild()
+
+    # Lo que ahora difiere de su instantánea se reescribirá en el próximo guardado
+    if tree.dirty is not None:
+        tree.dirty = set()
+        for item_id in edits.edited:
+            tree.touch(item_id)
+        for folder_id, order in lists.items():
+            if order != their_children.get(folder_id):
+                tree.touch(folder_id)
+
+    # Los totales de las carpetas se rehacen con el árbol ya leído entero
+    for folder_id in tree.compute_stats():
+        tree.touch(folder_id)
+        changed.add(tree.parents.get(folder_id))
+    tree.stale_stats = False
+    if tree.views is not None:
+        tree.views.build(tree.notes)
+    return changed
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Registro común de la aplicación. Los mensajes solo llevan tamaños, cuentas,
+# tiempos y rutas de ficheros: nunca títulos ni textos de las notas.
+log = logging.getLogger('pynote')
+
+FORMAT = '%(asctime)s %(levelname)s %(threadName)s: %(message)s'
+
+
+def setup_logging(settings, base_dir=None):
+    """Configura el registro según la sección 'logging' de la configuración."""
+    level = getattr(logging, str(settings.get('level', 'WARNING')).upper(), logging.WARNING)
+    path = settings.get('file')
+    if path:
+        handler = logging.FileHandler(os.path.join(base_dir or '', os.path.expanduser(path)), encoding='utf-8')
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(FORMAT))
+    for old in list(log.handlers):
+        log.removeHandler(old)
+    log.addHandler(handler)
+    log.setLevel(level)
+    log.propagate = False
+
+
+class Metrics:
+    """Temporizadores y contadores de las rutas calientes.
+
+    Cada temporizador guarda el número de llamadas, el tiempo total y las
+    últimas `samples` duraciones para calcular percentiles; los contadores
+    acumulan bytes escritos, filas dibujadas, etc. Se puede usar desde
+    cualquier hilo.
+    """
+
+    def __init__(self, samples=200):
+        self.samples = samples
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}  # Nombre -> [llamadas, segundos totales, últimas duraciones]
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0.0, deque(maxlen=self.samples)]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2].append(seconds)
+        log.debug("%s: %.2f ms", name, seconds * 1000)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """Copia de los contadores y resumen de cada temporizador, en ms."""
+        with self.lock:
+            counters = dict(self.counters)
+            timers = {name: (calls, total, sorted(recent))
+                      for name, (calls, total, recent) in self.timers.items()}
+        summary = {}
+        for name, (calls, total, recent) in timers.items():
+            summary[name] = {
+                'calls': calls,
+                'avg_ms': round(total / calls * 1000, 2),
+                'p50_ms': round(recent[len(recent) // 2] * 1000, 2),
+                'p95_ms': round(recent[min(len(recent) - 1, len(recent) * 95 // 100)] * 1000, 2),
+                'max_ms': round(recent[-1] * 1000, 2),
+            }
+        return {'counters': counters, 'timers': summary}
+
+    def report(self):
+        """Texto con los temporizadores y contadores para el panel de métricas."""
+        data = self.snapshot()
+        lines = []
+        for name, timer in sorted(data['timers'].items()):
+            lines.append(f"{name}: {timer['calls']} x {timer['avg_ms']} ms "
+                         f"(p95 {timer['p95_ms']} ms, max {timer['max_ms']} ms)")
+        for name, value in sorted(data['counters'].items()):
+            lines.append(f"{name}: {value}")
+        return lines
+
+    def export(self, path):
+        """Guarda las métricas como JSON (por ejemplo al cerrar la aplicación)."""
+        from modules.database import atomic_write
+        data = self.snapshot()
+        data['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        atomic_write(path, json.dumps(data, indent=4))
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+
+
+metrics = Metrics()
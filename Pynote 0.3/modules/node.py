@@ -0,0 +1,196 @@
+import sys
+from collections.abc import MutableMapping
+
+# Bits de Node.flags. Los bits HAS_* recuerdan si la clave existía en el JSON,
+# para que una nota sin 'favourite' se vuelva a escribir sin ella.
+FOLDER = 1
+FAVOURITE = 2
+HAS_FOLDER = 4
+HAS_FAVOURITE = 8
+
+FLAG_KEYS = {'is_folder': (FOLDER, HAS_FOLDER), 'favourite': (FAVOURITE, HAS_FAVOURITE)}
+SLOT_KEYS = frozenset(('title', 'content', 'body', 'contents', 'color', 'id', 'modified', 'stats'))
+# Orden en que se escriben las claves; coincide con el de las notas que crea la aplicación
+KEY_ORDER = ('title', 'is_folder', 'content', 'body', 'contents', 'color', 'favourite', 'id', 'modified', 'stats')
+
+
+class Node(MutableMapping):
+    """Nota o carpeta con el mismo interfaz que el diccionario de data.json.
+
+    Los atributos conocidos van en __slots__ en lugar de un diccionario por
+    nota, los colores se internan para que todas las notas "white" compartan
+    la misma cadena y is_folder/favourite se guardan como bits. Un atributo
+    sin asignar equivale a una clave ausente; las claves desconocidas se
+    conservan en `extra`, así que la conversión a JSON no pierde nada.
+    """
+
+    __slots__ = ('title', 'content', 'body', 'contents', 'color', 'id', 'modified', 'stats', 'flags', 'extra')
+
+    def __init__(self, fields=()):
+        self.flags = 0
+        self.extra = None
+        for key, value in (fields.items() if hasattr(fields, 'items') else fields):
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in SLOT_KEYS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if key in FLAG_KEYS:
+            bit, present = FLAG_KEYS[key]
+            if self.flags & present:
+                return bool(self.flags & bit)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        # Versión sin excepciones: se llama por cada nota al recorrer el árbol
+        if key in SLOT_KEYS:
+            return getattr(self, key, default)
+        if key in FLAG_KEYS:
+            bit, present = FLAG_KEYS[key]
+            if self.flags & present:
+                return bool(self.flags & bit)
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __setitem__(self, key, value):
+        if key in SLOT_KEYS:
+            if key == 'color' and type(value) is str:
+                value = sys.intern(value)
+            elif key == 'body':
+                value = tuple(value)
+            setattr(self, key, value)
+        elif key in FLAG_KEYS and type(value) is bool:
+            bit, present = FLAG_KEYS[key]
+            self.flags = (self.flags | present | bit) if value else (self.flags | present) & ~bit
+            if self.extra is not None:
+                self.extra.pop(key, None)
+        else:
+            if key in FLAG_KEYS:
+                # Un valor que no es booleano se guarda tal cual
+                self.flags &= ~(FLAG_KEYS[key][0] | FLAG_KEYS[key][1])
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in SLOT_KEYS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif key in FLAG_KEYS and self.flags & FLAG_KEYS[key][1]:
+            self.flags &= ~(FLAG_KEYS[key][0] | FLAG_KEYS[key][1])
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in KEY_ORDER:
+            if key in self:
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return f"Node({dict(self)!r})"
+
+    def copy(self):
+        """Copia superficial, como dict.copy(), sin pasar por el interfaz de Mapping."""
+        node = Node.__new__(Node)
+        for key in SLOT_KEYS:
+            value = getattr(self, key, node)
+            if value is not node:
+                setattr(node, key, value)
+        node.flags = self.flags
+        node.extra = dict(self.extra) if self.extra is not None else None
+        return node
+
+
+# Claves que se guardan tal cual, sin convertir
+PLAIN_KEYS = frozenset(('title', 'content', 'contents', 'id', 'modified', 'stats'))
+
+
+def node_hook(fields):
+    """object_hook de json.load que convierte las notas y carpetas en Node.
+
+    Hace lo mismo que Node(fields) pero sin pasar por __setitem__ para las
+    claves habituales: es la mayor parte del tiempo de arranque.
+    """
+    if 'title' not in fields:
+        return fields
+    node = Node.__new__(Node)
+    node.extra = None
+    flags = 0
+    for key, value in fields.items():
+        if key in PLAIN_KEYS:
+            setattr(node, key, value)
+        elif key == 'color' and type(value) is str:
+            node.color = sys.intern(value)
+        elif key == 'body':
+            node.body = tuple(value)
+        elif key == 'favourite' and type(value) is bool:
+            flags |= (HAS_FAVOURITE | FAVOURITE) if value else HAS_FAVOURITE
+        elif key == 'is_folder' and type(value) is bool:
+            flags |= (HAS_FOLDER | FOLDER) if value else HAS_FOLDER
+        else:
+            node.flags = flags
+            node[key] = value
+            flags = node.flags
+    node.flags = flags
+    return node
+
+
+def as_node(item):
+    """Convierte un diccionario (con sus contenidos) en Node si aún no lo es."""
+    if isinstance(item, Node):
+        return item
+    node = Node(item)
+    if 'contents' in node:
+        node['contents'] = [as_node(child) for child in node['contents']]
+    return node
+
+
+def benchmark(count):
+    """Memoria que ocupan `count` notas como diccionarios y como Node."""
+    import json
+    import tracemalloc
+
+    folders = [{"title": f"Folder {i}", "is_folder": True,
+                "contents": [{"title": f"Note {i}.{j}", "body": [0, 0], "color": "white", "favourite": False,
+                              "id": f"{i:016x}{j:016x}"}
+                             for j in range(min(100, count - i * 100))],
+                "color": "white", "id": f"{i:032x}"}
+               for i in range((count + 99) // 100)]
+    text = json.dumps(folders)
+    del folders
+
+    results = {}
+    for name, hook in (('dict', None), ('node', node_hook)):
+        tracemalloc.start()
+        notes = json.loads(text, object_hook=hook)
+        results[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert json.dumps(notes, default=dict) == text
+        del notes
+    return results
+
+
+if __name__ == "__main__":
+    for count in [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]:
+        results = benchmark(count)
+        print(f"{count:>9} notas: dict {results['dict'] / 2 ** 20:8.1f} MiB, "
+              f"Node {results['node'] / 2 ** 20:8.1f} MiB "
+              f"({results['node'] / results['dict']:.0%})")
@@ -0,0 +1,34 @@
+import time
+
+
+class StartupProfile:
+    """Tiempos de cada fase del arranque, para `app.py --profile-startup`.
+
+    Las fases del hilo principal se miden con mark() como intervalos
+    consecutivos; las que corren en paralelo (la carga de notas) se añaden
+    con su propia duración mediante add().
+    """
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.last = self.start
+        self.phases = []  # (fase, segundos, en paralelo)
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last, False))
+        self.last = now
+
+    def add(self, name, seconds):
+        self.phases.append((name, seconds, True))
+
+    def total(self):
+        return self.last - self.start
+
+    def report(self):
+        lines = ["Arranque:"]
+        for name, seconds, parallel in self.phases:
+            note = "  (en segundo plano)" if parallel else ""
+            lines.append(f"  {name:<16} {seconds * 1000:9.1f} ms{note}")
+        lines.append(f"  {'total':<16} {self.total() * 1000:9.1f} ms")
+        return "\n".join(lines)
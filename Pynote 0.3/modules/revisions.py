@@ -0,0 +1,324 @@
+import difflib
+import hashlib
+import heapq
+import json
+import os
+import time
+import zlib
+from collections import namedtuple
+
+from modules.locking import FileLock, file_stamp
+from modules.metrics import log, metrics
+
+# Versiones anteriores del texto de las notas (data.json.revisions o
+# data.db.revisions). Cada versión es una cabecera JSON de una línea seguida
+# de `bytes` bytes comprimidos con zlib: el texto entero ("key") o las
+# diferencias con la versión anterior de la misma nota. Solo se añade al
+# final; la retención reescribe el fichero entero de tarde en tarde.
+HEADER = '{"id":%s,"time":%d,"key":%d,"bytes":%d,"chars":%d,"hash":"%s"}\n'
+DAY = 24 * 60 * 60
+
+# Versión guardada: dónde empiezan sus bytes, si es texto entero, cuándo se
+# guardó, cuántos caracteres tiene y la huella del texto
+Revision = namedtuple('Revision', 'offset size key time chars digest')
+
+
+def digest(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def common_prefix(a, b):
+    """Longitud del principio común de dos textos (comparando trozos, no carácter a carácter)."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def common_suffix(a, b, limit):
+    low, high = 0, min(len(a), len(b), limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def make_delta(old, new):
+    """Operaciones que convierten `old` en `new`: [inicio, fin] copia de `old`, una cadena se inserta.
+
+    Primero se quita lo común del principio y del final (una edición en un
+    solo sitio cuesta solo lo que cambió, aunque la nota sea un único
+    párrafo) y el resto se compara por líneas.
+    """
+    prefix = common_prefix(old, new)
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+    ops = [[0, prefix]] if prefix else []
+    start = prefix
+    old_lines = old[prefix:len(old) - suffix].splitlines(True)
+    new_lines = new[prefix:len(new) - suffix].splitlines(True)
+    offsets = [start]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line))
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([offsets[i1], offsets[i2]])
+        elif j2 > j1:
+            ops.append(''.join(new_lines[j1:j2]))
+    if suffix:
+        ops.append([len(old) - suffix, len(old)])
+    # Las copias seguidas se juntan en una
+    merged = []
+    for op in ops:
+        if merged and type(op) is list and type(merged[-1]) is list and merged[-1][1] == op[0]:
+            merged[-1] = [merged[-1][0], op[1]]
+        else:
+            merged.append(op)
+    return merged
+
+
+def apply_delta(old, ops):
+    return ''.join(old[op[0]:op[1]] if type(op) is list else op for op in ops)
+
+
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp)) if timestamp else "unknown"
+
+
+def revision_diff(old, new, old_label, new_label):
+    """Líneas de unified diff de `old` a `new` (para la ventana de versiones y la orden pynote)."""
+    lines = difflib.unified_diff(old.splitlines(True), new.splitlines(True), old_label, new_label)
+    return [line if line.endswith('\n') else line + '\n' for line in lines]
+
+
+class Revisions:
+    """Versiones anteriores del texto de cada nota.
+
+    Al cambiar el texto de una nota se guarda la diferencia con la versión
+    anterior, comprimida, así que lo que crece el fichero depende de lo que
+    se editó y no del tamaño de la nota. La primera versión de cada nota
+    (y la que sigue a un cambio que no pasó por aquí) va entera. Para que
+    leer una versión no tenga que recorrer toda la cadena se vuelve a
+    guardar el texto entero cuando las diferencias desde el último superan
+    lo que ocupa, con lo que eso nunca cuesta más que las propias ediciones.
+
+    Se conservan las `max_versions` últimas versiones de cada nota, las de
+    menos de `max_age_days` días y en total no más de `max_bytes`; el
+    fichero se reescribe con solo eso cuando se pasa de largo. Como el
+    historial de deshacer, lo comparten las ventanas y la orden pynote:
+    cada operación toma el cerrojo y vuelve a leer las cabeceras si otro
+    proceso cambió el fichero.
+    """
+
+    def __init__(self, path, max_versions=50, max_age_days=365, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_versions = max_versions
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.lock = FileLock(path + '.lock')
+        self.notes = {}  # Identificador de la nota -> versiones, de la más antigua a la más nueva
+        self.size = 0
+        self.stamp = None
+
+    @property
+    def enabled(self):
+        return self.max_versions > 0
+
+    def refresh(self):
+        """Vuelve a leer las cabeceras si el fichero cambió; se llama con el cerrojo."""
+        stamp = file_stamp(self.path)
+        if stamp == self.stamp:
+            return
+        self.notes = {}
+        self.size = 0
+        if stamp is not None:
+            self.scan()
+        self.stamp = file_stamp(self.path)
+
+    def scan(self):
+        with metrics.timer('revisions_load'), open(self.path, 'r+b') as file:
+            size = os.fstat(file.fileno()).st_size
+            while True:
+                start = file.tell()
+                line = file.readline()
+                if not line:
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if not isinstance(entry, dict) or file.tell() + entry.get('bytes', size) > size:
+                    # Versión a medio escribir por un cierre inesperado: se descarta
+                    log.warning("Versiones truncadas en el byte %d de %s", start, self.path)
+                    file.truncate(start)
+                    break
+                self.notes.setdefault(entry['id'], []).append(Revision(
+                    file.tell(), entry['bytes'], bool(entry['key']), entry['time'], entry['chars'], entry['hash']))
+                file.seek(entry['bytes'], os.SEEK_CUR)
+            self.size = file.tell()
+
+    def record(self, note_id, old, new, old_time=0, new_time=None):
+        """Guarda que el texto de una nota pasó de `old` a `new`.
+
+        Si la última versión guardada no es `old` (el texto cambió sin
+        pasar por aquí, o es el primer cambio) se guarda antes `old` entero.
+        Un error al escribir se registra y no impide el cambio.
+        """
+        if not self.enabled or old == new:
+            return False
+        new_time = int(time.time()) if new_time is None else new_time
+        with self.lock:
+            try:
+                self.refresh()
+                versions = self.notes.get(note_id, [])
+                records = []
+                old_digest = digest(old)
+                if not versions or versions[-1].digest != old_digest:
+                    records.append((True, old_time, old, old_digest, zlib.compress(old.encode('utf-8'))))
+                    since_key, key_size = 0, len(records[-1][4])
+                else:
+                    since_key, key_size = self.since_key(versions)
+                delta = zlib.compress(json.dumps(make_delta(old, new), ensure_ascii=False).encode('utf-8'))
+                if since_key + len(delta) > key_size:
+                    records.append((True, new_time, new, digest(new), zlib.compress(new.encode('utf-8'))))
+                else:
+                    records.append((False, new_time, new, digest(new), delta))
+                self.append(note_id, records)
+                if len(self.notes[note_id]) > 2 * self.max_versions or self.size > self.max_bytes:
+                    self.compact()
+                self.stamp = file_stamp(self.path)
+            except (IOError, OSError) as e:
+                log.error("No se pudo guardar la versión anterior de la nota: %s", e)
+                return False
+        return True
+
+    def since_key(self, versions):
+        """Bytes de diferencias desde el último texto entero y lo que ocupa ese texto."""
+        since = 0
+        for version in reversed(versions):
+            if version.key:
+                return since, version.size
+            since += version.size
+        return since, 0
+
+    def append(self, note_id, records, file=None):
+        """Escribe versiones al final del fichero (o de `file`) y las añade al índice."""
+        target = file if file is not None else open(self.path, 'ab')
+        try:
+            start = target.seek(0, os.SEEK_END)
+            try:
+                for key, when, text, text_digest, data in records:
+                    target.write((HEADER % (json.dumps(note_id), when, key, len(data), len(text), text_digest))
+                                 .encode('utf-8'))
+                    self.notes.setdefault(note_id, []).append(
+                        Revision(target.tell(), len(data), key, when, len(text), text_digest))
+                    target.write(data)
+                    metrics.count('revision_bytes', len(data))
+            except BaseException:
+                target.truncate(start)
+                raise
+            self.size = target.tell()
+        finally:
+            if file is None:
+                target.close()
+
+    def versions(self, note_id):
+        """Versiones guardadas de una nota (Revision), de la más antigua a la más nueva."""
+        if not self.enabled:
+            return []
+        with self.lock:
+            self.refresh()
+            return list(self.notes.get(note_id, []))
+
+    def texts(self, note_id, versions=None):
+        """Texto de cada versión (de las dadas o de todas), de la más antigua a la más nueva."""
+        with self.lock:
+            if versions is None:
+                self.refresh()
+                versions = self.notes.get(note_id, [])
+            with open(self.path, 'rb') as file:
+                return list(self.decode(file, versions))
+
+    def decode(self, file, versions):
+        text = ''
+        for version in versions:
+            file.seek(version.offset)
+            data = zlib.decompress(file.read(version.size)).decode('utf-8')
+            text = data if version.key else apply_delta(text, json.loads(data))
+            yield text
+
+    def text(self, note_id, index):
+        """Texto de una versión; solo se leen las guardadas desde el último texto entero anterior."""
+        with self.lock:
+            self.refresh()
+            versions = self.notes.get(note_id, [])[:index + 1]
+            start = max(i for i, version in enumerate(versions) if version.key)
+            with open(self.path, 'rb') as file:
+                *_, text = self.decode(file, versions[start:])
+        return text
+
+    def compact(self):
+        """Reescribe el fichero con las versiones que entran en la retención; se llama con el cerrojo."""
+        cutoff = int(time.time()) - self.max_age_days * DAY
+        budget = self.max_bytes * 3 // 4
+        tmp_file = self.path + '.tmp'
+        old_notes = self.notes
+        with metrics.timer('revisions_compact'), open(self.path, 'rb') as source:
+            # Primero cada nota por su cuenta: sus últimas versiones que no caducaron
+            kept = {}
+            for note_id, versions in old_notes.items():
+                first = max(0, len(versions) - self.max_versions)
+                while first < len(versions) and versions[first].time < cutoff:
+                    first += 1
+                if first < len(versions):
+                    texts = list(self.decode(source, versions))[first:]
+                    kept[note_id] = [(version.time, text) for version, text in zip(versions[first:], texts)]
+            # Después, si aún no cabe, se quitan las versiones más antiguas de todas
+            encoded = {note_id: self.encode(versions) for note_id, versions in kept.items()}
+            total = sum(len(data) for records in encoded.values() for *_, data in records)
+            oldest = [(versions[0][0], note_id) for note_id, versions in kept.items()]
+            heapq.heapify(oldest)
+            while total > budget and oldest:
+                when, note_id = heapq.heappop(oldest)
+                total -= sum(len(data) for *_, data in encoded[note_id])
+                kept[note_id].pop(0)
+                if kept[note_id]:
+                    encoded[note_id] = self.encode(kept[note_id])
+                    total += sum(len(data) for *_, data in encoded[note_id])
+                    heapq.heappush(oldest, (kept[note_id][0][0], note_id))
+                else:
+                    del kept[note_id], encoded[note_id]
+        self.notes = {}
+        with open(tmp_file, 'wb') as target:
+            for note_id, records in encoded.items():
+                self.append(note_id, records, target)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(tmp_file, self.path)
+        log.info("Versiones de notas compactadas: %d notas, %d bytes", len(self.notes), self.size)
+
+    def encode(self, versions):
+        """Registros de una lista de (fecha, texto): el primero entero y el resto como diferencias."""
+        records = []
+        since_key = key_size = 0
+        previous = None
+        for when, text in versions:
+            text_digest = digest(text)
+            if previous is not None:
+                delta = zlib.compress(json.dumps(make_delta(previous, text), ensure_ascii=False).encode('utf-8'))
+            if previous is None or since_key + len(delta) > key_size:
+                data = zlib.compress(text.encode('utf-8'))
+                records.append((True, when, text, text_digest, data))
+                since_key, key_size = 0, len(data)
+            else:
+                records.append((False, when, text, text_digest, delta))
+                since_key += len(delta)
+            previous = text
+        return records
@@ -0,0 +1,250 @@
+import bisect
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from modules.database import atomic_write, data_dir
+
+INDEX_FILE = os.path.join(data_dir, 'search_index.json')
+INDEX_VERSION = 2
+
+TOKEN_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# Peso extra de un término que aparece en el título
+TITLE_BOOST = 2.0
+# Máximo de términos en que se expande una búsqueda por prefijo
+MAX_PREFIX_TERMS = 200
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def parse_query(query):
+    """Divide la consulta en frases ("a b"), prefijos (abc*) y términos sueltos."""
+    clauses = []
+    for phrase, word in QUERY_RE.findall(query):
+        if phrase:
+            tokens = tokenize(phrase)
+            if len(tokens) == 1:
+                clauses.append(('term', tokens[0]))
+            elif tokens:
+                clauses.append(('phrase', tokens))
+        elif word.endswith('*') and tokenize(word):
+            clauses.append(('prefix', tokenize(word)[0]))
+        else:
+            clauses.extend(('term', token) for token in tokenize(word))
+    return clauses
+
+
+def walk(notes):
+    """Recorre el árbol en profundidad y en orden, incluidas las carpetas."""
+    stack = [iter(notes)]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+        yield item
+        if item.get('is_folder', False):
+            stack.append(iter(item.get('contents', [])))
+
+
+def contains_phrase(tokens, phrase):
+    """Comprueba si la secuencia de términos aparece seguida en los tokens."""
+    size = len(phrase)
+    first = phrase[0]
+    return any(token == first and tokens[i:i + size] == phrase for i, token in enumerate(tokens))
+
+
+class SearchIndex:
+    """Índice invertido sobre títulos y contenido de las notas.
+
+    Cada término guarda la frecuencia con que aparece en cada documento; las
+    frases se resuelven intersecando sus términos y comprobando después el
+    texto de los pocos candidatos. Los documentos se identifican por un
+    número interno que, al guardarse en disco, se sustituye por la posición
+    del elemento en un recorrido en profundidad del árbol.
+    """
+
+    def __init__(self, content_of=None):
+        # Función que devuelve el texto de una nota aunque no esté cargado en memoria
+        self.content_of = content_of or (lambda item: item.get('content', ''))
+        self.clear()
+
+    def clear(self):
+        self.docs = {}  # Número de documento -> elemento
+        self.docnos = {}  # id(elemento) -> número de documento
+        self.postings = {}  # Término -> {documento: frecuencia}
+        self.doc_terms = {}  # Documento -> términos que contiene
+        self.title_terms = {}  # Documento -> términos del título
+        self.vocabulary = []  # Términos ordenados para las búsquedas por prefijo
+        self.next_docno = 0
+        self.dirty = True
+
+    # Mantenimiento incremental
+    def add(self, item):
+        docno = self.docnos.get(id(item))
+        if docno is None:
+            docno = self.next_docno
+            self.next_docno += 1
+            self.docs[docno] = item
+            self.docnos[id(item)] = docno
+        else:
+            self.remove_terms(docno)
+
+        title = tokenize(item.get('title', ''))
+        counts = Counter(title)
+        counts.update(tokenize(self.content_of(item)))
+        for term, count in counts.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                bisect.insort(self.vocabulary, term)
+            postings[docno] = count
+        self.doc_terms[docno] = set(counts)
+        self.title_terms[docno] = set(title)
+        self.dirty = True
+
+    def add_subtree(self, item):
+        self.add(item)
+        for child in walk(item.get('contents', [])):
+            self.add(child)
+
+    def remove_terms(self, docno):
+        for term in self.doc_terms.pop(docno, ()):
+            postings = self.postings[term]
+            del postings[docno]
+            if not postings:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+        self.title_terms.pop(docno, None)
+
+    def remove(self, item):
+        docno = self.docnos.pop(id(item), None)
+        if docno is not None:
+            self.remove_terms(docno)
+            del self.docs[docno]
+            self.dirty = True
+
+    def remove_subtree(self, item):
+        self.remove(item)
+        for child in walk(item.get('contents', [])):
+            self.remove(child)
+
+    def build(self, notes):
+        self.clear()
+        for item in walk(notes):
+            self.add(item)
+
+    # Consultas
+    def idf(self, df):
+        return math.log(1 + len(self.docs) / df)
+
+    def matches(self, clause):
+        """Documentos que cumplen una cláusula, con su puntuación."""
+        kind, value = clause
+        if kind == 'term':
+            terms = [value] if value in self.postings else []
+        elif kind == 'prefix':
+            start = bisect.bisect_left(self.vocabulary, value)
+            terms = []
+            for term in self.vocabulary[start:start + MAX_PREFIX_TERMS]:
+                if not term.startswith(value):
+                    break
+                terms.append(term)
+        else:
+            return self.phrase_matches(value)
+
+        scores = {}
+        for term in terms:
+            postings = self.postings[term]
+            idf = self.idf(len(postings))
+            for docno, count in postings.items():
+                score = idf * (1 + math.log(count))
+                if term in self.title_terms[docno]:
+                    score += TITLE_BOOST * idf
+                scores[docno] = scores.get(docno, 0) + score
+        return scores
+
+    def phrase_matches(self, tokens):
+        if any(token not in self.postings for token in tokens):
+            return {}
+        candidates = set.intersection(*(set(self.postings[token]) for token in tokens))
+        idf = sum(self.idf(len(self.postings[token])) for token in tokens)
+        scores = {}
+        for docno in candidates:
+            item = self.docs[docno]
+            if contains_phrase(tokenize(item.get('title', '')), tokens):
+                scores[docno] = (1 + TITLE_BOOST) * idf
+            elif contains_phrase(tokenize(self.content_of(item)), tokens):
+                scores[docno] = idf
+        return scores
+
+    def search(self, query, limit=50):
+        """Devuelve los elementos que cumplen todas las cláusulas, por relevancia."""
+        clauses = parse_query(query)
+        if not clauses:
+            return []
+        # Se empieza por la cláusula más selectiva para reducir las intersecciones
+        results = None
+        for scores in sorted((self.matches(clause) for clause in clauses), key=len):
+            if results is None:
+                results = scores
+            else:
+                results = {docno: results[docno] + score for docno, score in scores.items() if docno in results}
+            if not results:
+                return []
+        best = heapq.nlargest(limit, results.items(), key=lambda pair: pair[1])
+        return [self.docs[docno] for docno, score in best]
+
+    # Persistencia
+    def save(self, notes, fingerprint, index_file=INDEX_FILE):
+        ordinals = {id(item): ordinal for ordinal, item in enumerate(walk(notes))}
+        remap = {docno: ordinals[id(item)] for docno, item in self.docs.items() if id(item) in ordinals}
+        data = {
+            'version': INDEX_VERSION,
+            'fingerprint': fingerprint,
+            'documents': len(ordinals),
+            # Cada término se guarda como una lista plana [documento, frecuencia, ...]
+            'postings': {term: [value for docno, count in postings.items() if docno in remap
+                                for value in (remap[docno], count)]
+                         for term, postings in self.postings.items()},
+            'titles': [[remap[docno], sorted(terms)] for docno, terms in self.title_terms.items() if docno in remap],
+        }
+        atomic_write(index_file, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        self.dirty = False
+
+    def load(self, notes, fingerprint, index_file=INDEX_FILE):
+        """Carga el índice guardado si corresponde exactamente a estas notas."""
+        if not os.path.exists(index_file):
+            return False
+        try:
+            with open(index_file, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (json.JSONDecodeError, IOError):
+            return False
+        items = list(walk(notes))
+        if (data.get('version') != INDEX_VERSION or data.get('fingerprint') != fingerprint
+                or data.get('documents') != len(items)):
+            return False
+
+        self.clear()
+        self.docs = dict(enumerate(items))
+        self.docnos = {id(item): docno for docno, item in self.docs.items()}
+        self.doc_terms = {docno: set() for docno in self.docs}
+        self.next_docno = len(items)
+        for term, flat in data['postings'].items():
+            docnos = flat[0::2]
+            self.postings[term] = dict(zip(docnos, flat[1::2]))
+            for docno in docnos:
+                self.doc_terms[docno].add(term)
+        self.title_terms = {docno: set() for docno in self.docs}
+        self.title_terms.update((docno, set(terms)) for docno, terms in data['titles'])
+        self.vocabulary = sorted(self.postings)
+        self.dirty = False
+        return True
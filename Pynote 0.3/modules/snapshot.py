@@ -0,0 +1,629 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+from modules.codec import BodyCodec, decode
+from modules.database import atomic_write, replace_file
+from modules.locking import FileLock
+from modules.metrics import log, metrics
+from modules.node import node_hook
+
+# La 2 admite textos comprimidos en la generación (modules.codec); las
+# versiones anteriores no la reconocen y leen data.json completo
+META_VERSION = 2
+# Una generación a la que se añaden textos se escribe de nuevo (sin los que
+# ya no usa nadie) cuando pasa del doble de lo que ocupaba al crearla
+GROWTH_SLACK = 1024 * 1024
+# Formato de data.json.spans
+LAYOUT_VERSION = 2
+
+
+# Junto a data.json se guarda un índice de metadatos (data.json.meta) y un
+# fichero con los contenidos de cada generación (data.json.bodies.<n>). Al
+# arrancar basta con leer los metadatos; el texto de cada nota se lee de su
+# generación cuando se abre. data.json sigue siendo la copia completa, así
+# que las versiones anteriores pueden leerlo igual que siempre; la
+# generación, en cambio, guarda comprimidos los textos grandes y una sola
+# vez los repetidos (modules.codec).
+#
+# Al guardar, lo que no cambió se copia de data.json y del índice sin volver
+# a codificarlo (ver Layout), y los textos nuevos se añaden al final de la
+# generación actual: las referencias de lo copiado (también las de textos
+# compartidos con otras carpetas) siguen valiendo. Dónde está cada elemento
+# se guarda en data.json.spans al cerrar, para que el siguiente proceso no
+# tenga que escribirlo todo la primera vez.
+def meta_file(data_file):
+    return data_file + '.meta'
+
+
+def spans_file(data_file):
+    return data_file + '.spans'
+
+
+def bodies_pattern(data_file):
+    return data_file + '.bodies.*'
+
+
+def stat_key(path):
+    info = os.stat(path)
+    return [info.st_size, info.st_mtime_ns]
+
+
+def file_key(path):
+    """stat_key() de un fichero, o None si no existe."""
+    try:
+        return stat_key(path)
+    except OSError:
+        return None
+
+
+class BodyFile:
+    """Lectura de contenidos de una generación por desplazamiento y longitud.
+
+    Se abre al crearlo: si otro proceso borra después esta generación, el
+    fichero abierto sigue siendo legible.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.file = open(path, 'rb')
+        self.lock = threading.Lock()
+
+    def read(self, ref):
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'rb')
+            self.file.seek(ref[0])
+            data = self.file.read(ref[1])
+        # Se descomprime fuera del cerrojo
+        return decode(data, ref)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_snapshot(data_file):
+    """Lee data.json completo, contenidos incluidos."""
+    if not os.path.exists(data_file):
+        return []
+    with open(data_file, 'r') as file:
+        return json.load(file, object_hook=node_hook)
+
+
+def bodies_file(data_file, meta):
+    return os.path.join(os.path.dirname(data_file), meta.get('bodies', ''))
+
+
+def read_meta(data_file, object_hook=None):
+    """Índice de metadatos de data.json, o None si falta o está desfasado."""
+    if not os.path.exists(meta_file(data_file)) or not os.path.exists(data_file):
+        return None
+    try:
+        with open(meta_file(data_file), 'r') as file:
+            meta = json.load(file, object_hook=object_hook)
+    except (json.JSONDecodeError, IOError):
+        return None
+    if (meta.get('version') not in (1, META_VERSION) or meta.get('data') != stat_key(data_file)
+            or not os.path.exists(bodies_file(data_file, meta))):
+        return None
+    return meta
+
+
+def load_snapshot(data_file):
+    """Carga solo los metadatos si el índice corresponde a data.json.
+
+    Devuelve las notas, el BodyFile de donde leer sus contenidos y la fecha
+    del último cambio en la raíz; las notas diferidas llevan una clave
+    'body' con [desplazamiento, longitud]. Si el índice falta o está
+    desfasado se lee data.json completo, que no guarda esa fecha.
+    """
+    meta = read_meta(data_file, node_hook)
+    if meta is None:
+        remove_old_bodies(data_file, keep=())
+        return read_snapshot(data_file), None, 0
+    remove_old_bodies(data_file, keep=(meta['bodies'],))
+    return meta['notes'], BodyFile(bodies_file(data_file, meta)), meta.get('modified', 0)
+
+
+class CountingWriter:
+    """Fichero binario que lleva la cuenta de la posición de escritura.
+
+    Todo lo que se escribe es ASCII (json.dumps escapa el resto), así que la
+    posición en caracteres coincide con la posición en bytes.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.pos = 0
+
+    def write(self, text):
+        self.file.write(text.encode('ascii'))
+        self.pos += len(text)
+
+    def copy(self, data):
+        self.file.write(data)
+        self.pos += len(data)
+
+
+class NullWriter:
+    pos = None  # data.json no se escribe aquí: el índice no lleva posiciones
+
+    def write(self, text):
+        pass
+
+    def copy(self, data):
+        pass
+
+
+class Layout:
+    """Dónde está cada elemento en data.json y en su índice, para copiarlo sin codificarlo.
+
+    `spans` da para cada identificador [inicio, longitud] en data.json,
+    [inicio, longitud] en el índice, su nivel de sangría y la carpeta que lo
+    contiene. Los inicios son relativos al de esa carpeta (en la raíz, al de
+    la lista): un subárbol copiado tal cual no cambia las posiciones de lo
+    que contiene, así que cada escritura solo toca las de lo que escribe.
+    `seen` son las huellas de los textos de la generación `bodies`, que
+    ocupaba `base` bytes al crearla.
+
+    Se mantiene en memoria entre escrituras y se guarda en data.json.spans
+    al cerrar. Solo vale mientras data.json y su índice sean los que se
+    escribieron con él (`data_key` y `meta_key`).
+    """
+
+    def __init__(self, bodies, base=0, seen=None, spans=None, notes_start=0):
+        self.bodies = bodies
+        self.base = base
+        self.seen = {} if seen is None else seen
+        self.spans = {} if spans is None else spans
+        self.notes_start = notes_start  # Posición de la lista de notas en el índice
+        self.data_key = self.meta_key = None
+        self.pending = None  # Índice escrito que aún no se ha confirmado
+        self.writes = 0  # Cada escritura mueve lo copiado: las posiciones anteriores dejan de valer
+        self.saved = False
+
+    def generation(self, data_file):
+        return os.path.join(os.path.dirname(data_file), self.bodies)
+
+    def current(self, data_file):
+        return (self.data_key is not None and self.data_key == file_key(data_file)
+                and self.meta_key == file_key(meta_file(data_file)))
+
+    def reusable(self, data_file):
+        """True si la próxima escritura puede copiar de los ficheros actuales y añadir a su generación."""
+        size = file_key(self.generation(data_file))
+        # Con demasiados textos que ya no se usan se escribe todo en una generación nueva
+        return self.current(data_file) and size is not None and size[0] <= 2 * self.base + GROWTH_SLACK
+
+    def locate(self, item_id, parent_id, level, origin):
+        """(inicio, fin) en data.json y en el índice de un elemento que puede copiarse, o None."""
+        span = self.spans.get(item_id)
+        if span is None or span[4] != level or span[5] != parent_id:
+            return None
+        data_start = origin[0] + span[0]
+        meta_start = origin[1] + span[2]
+        return data_start, data_start + span[1], meta_start, meta_start + span[3]
+
+    def save(self, data_file):
+        """Guarda las posiciones en data.json.spans si aún corresponden a los ficheros."""
+        if self.saved or not self.current(data_file):
+            return
+        atomic_write(spans_file(data_file), json.dumps({
+            'version': LAYOUT_VERSION, 'bodies': self.bodies, 'base': self.base, 'seen': self.seen,
+            'notes_start': self.notes_start, 'data': self.data_key, 'meta': self.meta_key, 'spans': self.spans,
+        }, separators=(',', ':')))
+        self.saved = True
+
+    @classmethod
+    def read(cls, data_file):
+        """Posiciones guardadas en data.json.spans, o None si no corresponden a los ficheros actuales."""
+        try:
+            with open(spans_file(data_file), 'r') as file:
+                saved = json.load(file)
+        except (json.JSONDecodeError, IOError):
+            return None
+        if saved.get('version') != LAYOUT_VERSION:
+            return None
+        layout = cls(saved['bodies'], saved['base'], saved['seen'], saved['spans'], saved['notes_start'])
+        layout.data_key = saved['data']
+        layout.meta_key = saved['meta']
+        layout.saved = True
+        return layout if layout.current(data_file) else None
+
+
+class Unchanged:
+    """Elemento que no cambió desde la instantánea actual: se copia de sus ficheros.
+
+    Guarda dónde estaba según `layout` y el propio elemento, que solo se
+    codifica si entretanto esas posiciones dejaron de valer.
+    """
+
+    __slots__ = ('layout', 'writes', 'id', 'item', 'data_start', 'data_end', 'meta_start', 'meta_end')
+
+    def __init__(self, layout, item, data_start, data_end, meta_start, meta_end):
+        self.layout = layout
+        self.writes = layout.writes
+        self.id = item['id']
+        self.item = item
+        self.data_start = data_start
+        self.data_end = data_end
+        self.meta_start = meta_start
+        self.meta_end = meta_end
+
+
+def compact(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+class SnapshotWriter:
+    """Escribe a la vez data.json (con el formato de json.dump(indent=4)) y su índice de metadatos.
+
+    El índice es la misma lista sin textos: cada nota lleva en 'body' la
+    referencia a su texto en la generación, que escribe `bodies`. Lo que
+    llega como Unchanged se copia de `sources` (data.json y el índice
+    actuales) si sus posiciones son las de `layout`, donde se anotan las
+    nuevas.
+    """
+
+    def __init__(self, data, meta, bodies, read_body=None, layout=None, sources=None):
+        self.data = data
+        self.meta = meta
+        self.bodies = bodies
+        self.read_body = read_body
+        self.layout = layout
+        self.sources = sources
+        self.copied = 0
+
+    def write_items(self, items, level, parent_id, origin):
+        data, meta = self.data, self.meta
+        if not items:
+            data.write('[]')
+            meta.write('[]')
+            return
+        pad = '\n' + ' ' * 4 * (level + 1)
+        data.write('[')
+        meta.write('[')
+        for i, item in enumerate(items):
+            data.write((',' if i else '') + pad)
+            if i:
+                meta.write(',')
+            if type(item) is Unchanged:
+                if self.sources is not None and item.layout is self.layout and item.writes == self.layout.writes:
+                    self.copy(item, level + 1, parent_id, origin)
+                    continue
+                # Las posiciones ya no valen: se codifica el elemento
+                item = item.item
+            self.write_item(item, level + 1, parent_id, origin)
+        data.write('\n' + ' ' * 4 * level + ']')
+        meta.write(']')
+
+    def write_item(self, item, level, parent_id, origin):
+        data, meta = self.data, self.meta
+        pad = '\n' + ' ' * 4 * (level + 1)
+        start = (data.pos, meta.pos)
+        data.write('{')
+        meta.write('{')
+        first = True
+        for key, value in item.items():
+            if key == 'body':
+                if 'content' in item:
+                    continue
+                # Contenido diferido: se lee de la generación anterior
+                key, value = 'content', self.read_body(value)
+            name = json.dumps(key)
+            data.write(('' if first else ',') + pad + name + ': ')
+            if not first:
+                meta.write(',')
+            first = False
+            if key == 'content' and type(value) is str:
+                data.write(json.dumps(value))
+                meta.write('"body":' + compact(self.bodies.add(value)))
+            elif key == 'contents':
+                meta.write(name + ':')
+                self.write_items(value, level + 1, item.get('id'), start)
+            else:
+                data.write(json.dumps(value))
+                meta.write(name + ':' + compact(value))
+        data.write('}' if first else '\n' + ' ' * 4 * level + '}')
+        meta.write('}')
+        if self.layout is not None and data.pos is not None and 'id' in item:
+            self.layout.spans[item['id']] = [start[0] - origin[0], data.pos - start[0], start[1] - origin[1],
+                                             meta.pos - start[1], level, parent_id]
+
+    def copy(self, unchanged, level, parent_id, origin):
+        old_data, old_meta = self.sources
+        start = (self.data.pos, self.meta.pos)
+        old_data.seek(unchanged.data_start)
+        self.data.copy(old_data.read(unchanged.data_end - unchanged.data_start))
+        old_meta.seek(unchanged.meta_start)
+        self.meta.copy(old_meta.read(unchanged.meta_end - unchanged.meta_start))
+        # Solo cambia su posición en la carpeta: las de lo que contiene son relativas a él
+        self.layout.spans[unchanged.id] = [start[0] - origin[0], unchanged.data_end - unchanged.data_start,
+                                           start[1] - origin[1], unchanged.meta_end - unchanged.meta_start,
+                                           level, parent_id]
+        self.copied += 1
+
+
+def write_snapshot(notes, data_file, read_body=None, target=None, layout=None, codec=None, modified=0):
+    """Escribe la instantánea completa y los contenidos que le faltan a la generación.
+
+    `target` permite escribir en otra ruta (por ejemplo data.json.next) y
+    renombrarla después. Con `layout` (el de los ficheros actuales, ver
+    freeze) lo que llega como Unchanged se copia de ellos y los textos
+    nuevos se añaden a su generación; si no, se crea una generación nueva.
+    `codec` (un BodyCodec) decide cómo se guardan los textos y `modified` es
+    la fecha del último cambio en la raíz (TreeIndex.root_modified), que va
+    en el índice. Devuelve el Layout de lo escrito, cuyo índice se confirma con commit_meta una vez
+    que data.json está en su sitio.
+    """
+    target = target or data_file
+    codec = codec or BodyCodec()
+    meta_tmp = meta_file(target) + '.tmp'
+    if layout is not None:
+        # Solo un proceso a la vez añade textos a la generación
+        lock = FileLock(data_file + '.bodies.lock')
+        bodies_path = layout.generation(data_file)
+        tmp_bodies = None
+    else:
+        lock = nullcontext()
+        bodies_path = f"{data_file}.bodies.{time.time_ns()}"
+        tmp_bodies = bodies_path + '.tmp'
+        layout = Layout(os.path.basename(bodies_path))
+    sources = []
+    try:
+        with lock:
+            with open(tmp_bodies or bodies_path, 'wb' if tmp_bodies else 'r+b') as bodies_file, \
+                    open(target + '.tmp', 'wb') as data_out, open(meta_tmp, 'wb') as meta_out:
+                end = bodies_file.seek(0, os.SEEK_END)
+                try:
+                    if tmp_bodies is None:
+                        sources = [open(data_file, 'rb'), open(meta_file(data_file), 'rb')]
+                    bodies = codec.writer(bodies_file, layout.seen)
+                    data, meta = CountingWriter(data_out), CountingWriter(meta_out)
+                    meta.write('{"version":' + str(META_VERSION) + ',"bodies":' + json.dumps(layout.bodies)
+                               + ',"modified":' + json.dumps(modified) + ',"notes":')
+                    writer = SnapshotWriter(data, meta, bodies, read_body, layout, sources or None)
+                    layout.notes_start = meta.pos
+                    writer.write_items(notes, 0, None, (0, meta.pos))
+                    metrics.count('bytes_written', data.pos + meta.pos + bodies.tell() - end)
+                    metrics.count('bodies_deduplicated', bodies.deduplicated)
+                    metrics.count('fragments_copied', writer.copied)
+                    for file in (bodies_file, data_out):
+                        file.flush()
+                        os.fsync(file.fileno())
+                    size = bodies.tell()
+                except BaseException:
+                    # Lo añadido a medias no lo referencia nadie: se quita
+                    bodies_file.truncate(end)
+                    raise
+    except BaseException:
+        # Disco lleno o cualquier fallo a medias: la instantánea anterior sigue en su sitio
+        remove_temporary(*[path for path in (tmp_bodies, target + '.tmp', meta_tmp) if path])
+        raise
+    finally:
+        for file in sources:
+            file.close()
+    if tmp_bodies is not None:
+        layout.base = size
+        replace_file(tmp_bodies, bodies_path)
+    replace_file(target + '.tmp', target)
+    layout.pending = meta_tmp
+    layout.writes += 1
+    layout.saved = False
+    return layout
+
+
+def commit_meta(layout, data_file, keep=(), data_key=None):
+    """Confirma el índice escrito con la instantánea, ligado al data.json actual."""
+    data_key = data_key or stat_key(data_file)
+    # La clave 'data' va al final: solo se conoce cuando data.json está en su sitio
+    with open(layout.pending, 'ab') as file:
+        file.write((',"data":' + compact(data_key) + '}').encode('ascii'))
+        file.flush()
+        os.fsync(file.fileno())
+    replace_file(layout.pending, meta_file(data_file))
+    layout.pending = None
+    layout.data_key = data_key
+    layout.meta_key = stat_key(meta_file(data_file))
+    remove_old_bodies(data_file, keep=(layout.bodies,) + tuple(keep))
+
+
+def build_meta(data_file, keep=(), lock=None, codec=None):
+    """Genera el índice de metadatos de un data.json existente sin reescribirlo."""
+    data_key = stat_key(data_file)
+    notes = read_snapshot(data_file)
+    layout = Layout(os.path.basename(f"{data_file}.bodies.{time.time_ns()}"))
+    bodies_path = layout.generation(data_file)
+    meta_tmp = meta_file(data_file) + '.tmp'
+    try:
+        with open(bodies_path + '.tmp', 'wb') as bodies, open(meta_tmp, 'wb') as meta_out:
+            meta = CountingWriter(meta_out)
+            meta.write('{"version":' + str(META_VERSION) + ',"bodies":' + json.dumps(layout.bodies) + ',"notes":')
+            # Sin las posiciones en data.json no hay nada que copiar: la primera escritura lo codifica todo
+            writer = SnapshotWriter(NullWriter(), meta, (codec or BodyCodec()).writer(bodies))
+            writer.write_items(notes, 0, None, (None, meta.pos))
+            bodies.flush()
+            os.fsync(bodies.fileno())
+    except BaseException:
+        remove_temporary(bodies_path + '.tmp', meta_tmp)
+        raise
+    with lock or nullcontext():
+        if stat_key(data_file) != data_key:
+            # data.json cambió mientras tanto; el índice ya no le corresponde
+            remove_temporary(bodies_path + '.tmp', meta_tmp)
+            return
+        os.replace(bodies_path + '.tmp', bodies_path)
+        layout.pending = meta_tmp
+        commit_meta(layout, data_file, keep, data_key)
+
+
+class JsonFormat:
+    """Instantánea en data.json con su índice de metadatos.
+
+    Journal trabaja con cualquier formato a través de este interfaz; el
+    formato binario equivalente está en modules.binary.
+    """
+
+    # data.json guarda los textos tal cual además de la generación (ver body_report)
+    inline_texts = True
+
+    def __init__(self, data_file, codec=None):
+        self.data_file = data_file
+        self.codec = codec or BodyCodec()
+        # Instantánea ya compactada; su existencia marca el punto de confirmación
+        self.next_file = data_file + '.next'
+        self.layout = None  # Posiciones de lo que escribió este proceso (ver Layout)
+        self.spans_key = None  # data.json.spans tal como se leyó por última vez
+        self.root_modified = 0  # Último cambio en la raíz según la instantánea cargada
+
+    def current_file(self):
+        return self.data_file if os.path.exists(self.data_file) else None
+
+    def backup_name(self):
+        """Nombre de las copias de seguridad de la instantánea (modules.backup)."""
+        return os.path.basename(self.data_file)
+
+    def restore_target(self):
+        """Dónde se descomprime una copia de seguridad para que sea la instantánea actual."""
+        return self.data_file
+
+    def recover(self, rotated_file):
+        """Termina una compactación que se interrumpió tras confirmarse."""
+        if os.path.exists(self.next_file):
+            if os.path.exists(rotated_file):
+                os.remove(rotated_file)
+            os.replace(self.next_file, self.data_file)
+
+    def load(self):
+        """Devuelve las notas, el fichero del que leer sus contenidos y las carpetas sin leer."""
+        from modules.binary import binary_file, binary_to_json, current_generation, is_newer
+        if is_newer(current_generation(binary_file(self.data_file)), self.data_file):
+            # Se vuelve del formato binario: la instantánea más reciente es la binaria
+            binary_to_json(binary_file(self.data_file), self.data_file, self.codec)
+        notes, bodies, self.root_modified = load_snapshot(self.data_file)
+        return notes, bodies, {}
+
+    def read(self):
+        return read_snapshot(self.data_file)
+
+    def reusable_layout(self):
+        """Layout de los ficheros actuales si la próxima escritura puede partir de él, o None."""
+        if self.layout is None or not self.layout.current(self.data_file):
+            self.layout = None
+            key = file_key(spans_file(self.data_file))
+            if key is not None and key != self.spans_key:
+                # Lo que dejó guardado el último proceso que escribió, si nadie escribió después
+                self.spans_key = key
+                self.layout = Layout.read(self.data_file)
+        if self.layout is None or not self.layout.reusable(self.data_file):
+            return None
+        return self.layout
+
+    def freeze(self, notes, dirty=None):
+        """Copia del árbol para escribirla fuera del cerrojo (ver freeze)."""
+        return freeze(notes, dirty, self.reusable_layout() if dirty is not None else None)
+
+    def write(self, notes, read_body=None, keep=(), rotated_file=None, children_of=None, dirty=None, lock=None,
+              modified=0):
+        """Escribe y confirma la instantánea.
+
+        Con `rotated_file` el diario rotado se borra en el punto de
+        confirmación (data.json.next), que se hace con `lock` si se indica.
+        En JSON todas las carpetas están en memoria, así que `children_of` no
+        se usa. `dirty` son los identificadores modificados desde la
+        instantánea actual (None: todos); `notes` puede venir ya de freeze().
+        `modified` es el último cambio en la raíz (TreeIndex.root_modified).
+        """
+        notes = self.freeze(notes, dirty)
+        layout = self.layout if dirty is not None and self.layout is not None and \
+            self.layout.reusable(self.data_file) else None
+        try:
+            if rotated_file is None:
+                layout = write_snapshot(notes, self.data_file, read_body, layout=layout, codec=self.codec,
+                                        modified=modified)
+                commit_meta(layout, self.data_file, keep=keep)
+            else:
+                layout = write_snapshot(notes, self.data_file, read_body, target=self.next_file, layout=layout,
+                                        codec=self.codec, modified=modified)
+                with lock or nullcontext():
+                    os.remove(rotated_file)
+                    replace_file(self.next_file, self.data_file)
+                    commit_meta(layout, self.data_file, keep=keep)
+        except BaseException:
+            # Las posiciones en memoria pueden haber quedado a medias
+            self.layout = None
+            raise
+        self.layout = layout
+
+    def disk_files(self):
+        """Ficheros de la instantánea, para medir lo que ocupa en disco."""
+        return [self.data_file, meta_file(self.data_file), spans_file(self.data_file),
+                self.next_file] + glob.glob(bodies_pattern(self.data_file))
+
+    def needs_index(self, bodies):
+        return bodies is None and os.path.exists(self.data_file)
+
+    def build_index(self, lock=None):
+        build_meta(self.data_file, lock=lock, codec=self.codec)
+
+    def close(self):
+        """Guarda las posiciones de lo escrito para el próximo proceso."""
+        if self.layout is None:
+            return
+        try:
+            self.layout.save(self.data_file)
+        except (IOError, OSError) as e:
+            log.warning("No se pudieron guardar las posiciones de data.json: %s", e)
+
+
+def remove_temporary(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def remove_old_bodies(data_file, keep):
+    for path in glob.glob(bodies_pattern(data_file)):
+        if os.path.basename(path) not in keep and not path.endswith('.tmp'):
+            try:
+                os.remove(path)
+            except OSError:
+                # En Windows no se puede borrar si otro proceso aún lo tiene abierto
+                pass
+
+
+def freeze(items, dirty=None, layout=None):
+    """Copia la estructura del árbol (no los textos) para escribirla sin bloquearlo.
+
+    Con `layout` (el de los ficheros actuales), lo que no está en `dirty` y
+    sigue en la misma carpeta queda como Unchanged sin recorrerlo, así que
+    la copia cuesta lo que cambió y no lo que ocupa el árbol.
+    """
+    return freeze_items(items, dirty, layout, None, 1, (0, layout.notes_start) if layout is not None else None)
+
+
+def freeze_items(items, dirty, layout, parent_id, level, origin):
+    copies = []
+    for item in items:
+        if type(item) is Unchanged:
+            copies.append(item)
+            continue
+        where = None
+        if origin is not None and 'id' in item:
+            where = layout.locate(item['id'], parent_id, level, origin)
+            if where is not None and item['id'] not in dirty:
+                copies.append(Unchanged(layout, item, *where))
+                continue
+        copy = item.copy()
+        if 'contents' in copy:
+            copy['contents'] = freeze_items(copy['contents'], dirty, layout, copy.get('id'), level + 2,
+                                            (where[0], where[2]) if where is not None else None)
+        copies.append(copy)
+    return copies
@@ -0,0 +1,581 @@
+import os
+import sqlite3
+from contextlib import contextmanager, nullcontext
+
+from modules.aggregates import EMPTY, FolderStats, note_size, now
+from modules.cache import LRUCache
+from modules.database import DATA_FILE, data_dir
+from modules.journal import JOURNAL_FILE, Journal
+from modules.locking import FileLock
+from modules.metrics import log
+from modules.node import Node
+from modules.search import parse_query
+from modules.store import NoteStore
+
+DB_FILE = os.path.join(data_dir, 'data.db')
+
+# Identificador de la carpeta raíz en la columna parent
+ROOT = 0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    is_folder INTEGER NOT NULL DEFAULT 0,
+    color TEXT NOT NULL DEFAULT 'white',
+    favourite INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_parent_position ON items (parent, position);
+CREATE TABLE IF NOT EXISTS contents (
+    id INTEGER PRIMARY KEY,
+    content TEXT NOT NULL
+);
+"""
+
+# Versión del esquema guardada en PRAGMA user_version
+SCHEMA_VERSION = 4
+
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (title, content);
+INSERT INTO search (rowid, title, content)
+    SELECT items.id, items.title, COALESCE(contents.content, '')
+    FROM items LEFT JOIN contents ON contents.id = items.id;
+"""
+
+# Totales de cada carpeta (la raíz es la fila 0), como el campo 'stats' de data.json
+STATS_SCHEMA = """
+ALTER TABLE items ADD COLUMN modified INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE items ADD COLUMN size INTEGER NOT NULL DEFAULT 0;
+UPDATE items SET size = (SELECT length(CAST(content AS BLOB)) FROM contents WHERE contents.id = items.id)
+    WHERE is_folder = 0;
+CREATE TABLE IF NOT EXISTS folder_stats (
+    id INTEGER PRIMARY KEY,
+    notes INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    favourites INTEGER NOT NULL DEFAULT 0,
+    modified INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Índices de las vistas de favoritos y colores: solo tienen las filas que aparecen en ellas
+VIEWS_SCHEMA = """
+CREATE INDEX IF NOT EXISTS items_favourite ON items (title COLLATE NOCASE) WHERE favourite = 1;
+CREATE INDEX IF NOT EXISTS items_color ON items (color, title COLLATE NOCASE) WHERE color <> 'white';
+"""
+
+# Recalcula todos los totales sumando cada elemento en cada carpeta que lo contiene
+REBUILD_STATS = """
+DELETE FROM folder_stats;
+INSERT INTO folder_stats (id) SELECT 0 UNION ALL SELECT id FROM items WHERE is_folder = 1;
+WITH RECURSIVE containers(item, folder) AS (
+    SELECT id, parent FROM items
+    UNION ALL
+    SELECT containers.item, items.parent FROM containers JOIN items ON items.id = containers.folder
+)
+INSERT OR REPLACE INTO folder_stats (id, notes, bytes, favourites, modified)
+    SELECT containers.folder, SUM(1 - items.is_folder), SUM(items.size), SUM(items.favourite), MAX(items.modified)
+    FROM containers JOIN items ON items.id = containers.item GROUP BY containers.folder;
+"""
+
+# Suma un cambio a una carpeta y a todas las que la contienen
+ADJUST_STATS = """
+WITH RECURSIVE chain(id) AS (
+    SELECT ?
+    UNION ALL
+    SELECT items.parent FROM items JOIN chain ON items.id = chain.id
+)
+UPDATE folder_stats SET notes = notes + ?, bytes = bytes + ?, favourites = favourites + ?,
+    modified = MAX(modified, ?)
+WHERE id IN (SELECT id FROM chain)
+"""
+
+COLUMNS = "items.id, items.title, items.is_folder, items.color, items.favourite, items.parent, items.modified"
+
+ANCESTORS = """
+WITH RECURSIVE chain(id, depth) AS (
+    SELECT parent, 1 FROM items WHERE id = ?
+    UNION ALL
+    SELECT items.parent, chain.depth + 1 FROM items JOIN chain ON items.id = chain.id
+)
+SELECT """ + COLUMNS + """ FROM chain JOIN items ON items.id = chain.id ORDER BY chain.depth DESC
+"""
+
+SUBTREE = """
+WITH RECURSIVE subtree(id) AS (
+    SELECT ?
+    UNION ALL
+    SELECT items.id FROM items JOIN subtree ON items.parent = subtree.id
+)
+SELECT id FROM subtree
+"""
+
+
+def upgrade(db):
+    """Crea o actualiza el esquema según PRAGMA user_version."""
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        db.executescript(SCHEMA)
+    if version < 2:
+        db.executescript(SEARCH_SCHEMA)
+    if version < 3:
+        db.executescript(STATS_SCHEMA)
+        db.executescript(REBUILD_STATS)
+    if version < 4:
+        db.executescript(VIEWS_SCHEMA)
+    db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    db.commit()
+
+
+def fts_query(query):
+    """Traduce la sintaxis de búsqueda de la aplicación a una consulta FTS5."""
+    parts = []
+    for kind, value in parse_query(query):
+        if kind == 'phrase':
+            parts.append('"' + ' '.join(value) + '"')
+        elif kind == 'prefix':
+            parts.append(f'"{value}"*')
+        else:
+            parts.append(f'"{value}"')
+    return ' '.join(parts)
+
+
+def insert_item(db, parent, position, item):
+    """Inserta un elemento (y su contenido) y devuelve su identificador.
+
+    Un 'id' entero se conserva (al deshacer un borrado); los de data.json
+    son texto y SQLite asigna uno nuevo.
+    """
+    is_folder = item.get('is_folder', False)
+    item_id = item.get('id')
+    cursor = db.execute(
+        "INSERT INTO items (id, parent, position, title, is_folder, color, favourite, modified, size) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (item_id if type(item_id) is int else None, parent, position, item['title'], int(is_folder),
+         item.get('color', 'white'),
+         int(item.get('favourite', False)), item.get('modified', 0), 0 if is_folder else note_size(item)))
+    item_id = cursor.lastrowid
+    if is_folder:
+        db.execute("INSERT INTO folder_stats (id) VALUES (?)", (item_id,))
+    else:
+        db.execute("INSERT INTO contents (id, content) VALUES (?, ?)", (item_id, item.get('content', '')))
+    db.execute("INSERT INTO search (rowid, title, content) VALUES (?, ?, ?)",
+               (item_id, item['title'], item.get('content', '')))
+    return item_id
+
+
+def row_stats(row):
+    """FolderStats de una fila de items unida a folder_stats (como aggregates.item_stats)."""
+    is_folder, size, favourite, modified, notes, total_bytes, favourites, last = row
+    if is_folder:
+        return FolderStats(notes or 0, total_bytes or 0, (favourites or 0) + favourite, max(last or 0, modified))
+    return FolderStats(1, size, favourite, modified)
+
+
+class SqliteStore(NoteStore):
+    """Almacén SQLite con una fila por nota o carpeta.
+
+    Solo se consultan los hijos de las carpetas que se visitan, y el
+    contenido de las notas vive en una tabla aparte que se lee al abrirlas
+    a través de una caché LRU.
+
+    SQLite ya coordina la escritura entre procesos; sync() consulta
+    PRAGMA data_version para saber si otra conexión cambió la base y, en
+    ese caso, descarta lo leído para volver a consultarlo.
+    """
+
+    def __init__(self, db_file=DB_FILE, cache_bytes=32 * 1024 * 1024):
+        self.db_file = db_file
+        self.cache = LRUCache(cache_bytes)
+        self.db = None
+        # Hijos ya leídos de cada carpeta y carpeta de cada elemento conocido
+        self.folders = {}
+        self.parents = {}
+        # Un único Node por fila, para que la lista y la búsqueda compartan objetos
+        self.nodes = {}
+        self.data_version = None
+        self.batching = False
+
+    def node(self, row):
+        item_id, title, is_folder, color, favourite, parent, modified = row
+        item = self.nodes.get(item_id)
+        if item is None:
+            item = Node({"id": item_id, "title": title, "color": color, "favourite": bool(favourite),
+                         "modified": modified})
+            if is_folder:
+                item["is_folder"] = True
+            self.nodes[item_id] = item
+        self.parents[item_id] = parent
+        return item
+
+    def load(self):
+        if not os.path.exists(self.db_file) and os.path.exists(DATA_FILE):
+            # Si se abren dos ventanas a la vez, solo migra la primera
+            with FileLock(self.db_file + '.lock'):
+                if not os.path.exists(self.db_file):
+                    migrate_json(db_file=self.db_file)
+        try:
+            self.connect()
+        except sqlite3.DatabaseError as e:
+            # Base dañada: se vuelve a la última copia de seguridad válida
+            log.error("Error al abrir %s: %s", self.db_file, e)
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+            self.recovered = self.restore_backup()
+            if self.recovered is None:
+                raise
+            self.connect()
+        self.folders = {}
+        self.parents = {}
+        self.nodes = {}
+        self.data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+
+    def connect(self):
+        # La carga puede hacerse en un hilo de fondo; después solo la usa la interfaz
+        self.db = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        upgrade(self.db)
+
+    def restore_backup(self):
+        if self.backups is None:
+            return None
+        with FileLock(self.db_file + '.lock'):
+            # El WAL de la base dañada no debe aplicarse sobre la copia
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(self.db_file + suffix):
+                    os.replace(self.db_file + suffix, self.db_file + suffix + '.corrupt')
+            return self.backups.restore(self.backup_name(), self.db_file)
+
+    def backup_name(self):
+        return os.path.basename(self.db_file)
+
+    def backup(self, force=False):
+        name = self.backup_name()
+        if self.backups is None or not (force or self.backups.due(name)):
+            return None
+        tmp_file = os.path.join(self.backups.directory, f"{name}.{os.getpid()}.copy")
+        try:
+            os.makedirs(self.backups.directory, exist_ok=True)
+            # Con una conexión propia la copia es coherente aunque la interfaz siga escribiendo
+            source = sqlite3.connect(self.db_file)
+            target = sqlite3.connect(tmp_file)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            with open(tmp_file, 'rb') as copy:
+                return self.backups.save(name, copy)
+        except (sqlite3.Error, IOError, OSError) as e:
+            log.error("No se pudo hacer la copia de seguridad: %s", e)
+            return None
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def sync(self):
+        version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version:
+            return False
+        self.data_version = version
+        self.folders = {}
+        self.parents = {}
+        self.nodes = {}
+        self.cache.clear()
+        return True
+
+    def watch_paths(self):
+        return [self.db_file, self.db_file + '-wal']
+
+    def history_file(self):
+        return self.db_file + '.history'
+
+    def revisions_file(self):
+        return self.db_file + '.revisions'
+
+    def transaction(self):
+        # Dentro de un lote todo va en la transacción del lote
+        return nullcontext() if self.batching else self.db
+
+    @contextmanager
+    def batch(self):
+        self.batching = True
+        try:
+            with self.db:
+                yield
+        except BaseException:
+            # La transacción se deshizo: lo leído en memoria ya no vale
+            self.folders = {}
+            self.parents = {}
+            self.nodes = {}
+            self.cache.clear()
+            raise
+        finally:
+            self.batching = False
+
+    def folder_id(self, folder):
+        return ROOT if folder is None else folder['id']
+
+    def children(self, folder=None):
+        return self.children_of(self.folder_id(folder))
+
+    def children_of(self, parent):
+        items = self.folders.get(parent)
+        if items is None:
+            rows = self.db.execute(
+                f"SELECT {COLUMNS} FROM items WHERE parent = ? ORDER BY position", (parent,))
+            items = [self.node(row) for row in rows]
+            self.folders[parent] = items
+        return items
+
+    def get(self, item_id):
+        item = self.nodes.get(item_id)
+        if item is None:
+            row = self.db.execute(f"SELECT {COLUMNS} FROM items WHERE id = ?", (item_id,)).fetchone()
+            item = self.node(row) if row else None
+        return item
+
+    def content(self, note):
+        text = self.cache.get(note['id'])
+        if text is None:
+            row = self.db.execute("SELECT content FROM contents WHERE id = ?", (note['id'],)).fetchone()
+            text = row[0] if row else ''
+            self.cache.put(note['id'], text)
+        return text
+
+    def add(self, folder, item, index=None):
+        items = self.children(folder)
+        parent = self.folder_id(folder)
+        with self.transaction():
+            position = self.make_room(parent, items, index)
+            item = Node(item)
+            item.setdefault('modified', now())
+            item['id'] = insert_item(self.db, parent, position, item)
+            if item.get('is_folder', False):
+                self.adjust_stats(parent, 0, 0, int(item.get('favourite', False)), item['modified'])
+            else:
+                self.adjust_stats(parent, 1, note_size(item), int(item.get('favourite', False)), item['modified'])
+        # El contenido no se mantiene en memoria; se lee de la tabla al abrir la nota
+        item.pop('content', None)
+        if item.pop('contents', None) is not None:
+            self.folders[item['id']] = []
+        self.parents[item['id']] = parent
+        self.nodes[item['id']] = item
+        if index is None:
+            items.append(item)
+        else:
+            items.insert(index, item)
+        return item
+
+    def update(self, item, **fields):
+        fields.setdefault('modified', now())
+        for key in fields:
+            if key not in ('title', 'color', 'favourite', 'modified', 'content'):
+                raise ValueError(f"Campo desconocido: {key}")
+        size = favourite = 0
+        base = self.revision_base(item, fields)
+        text = fields.get('content')
+        with self.transaction():
+            if 'content' in fields:
+                content = fields.pop('content')
+                old_size = self.db.execute("SELECT size FROM items WHERE id = ?", (item['id'],)).fetchone()[0]
+                size = note_size({'content': content}) - old_size
+                self.db.execute("UPDATE items SET size = ? WHERE id = ?", (old_size + size, item['id']))
+                self.db.execute("UPDATE contents SET content = ? WHERE id = ?", (content, item['id']))
+                self.db.execute("UPDATE search SET content = ? WHERE rowid = ?", (content, item['id']))
+                self.cache.put(item['id'], content)
+            if 'title' in fields:
+                self.db.execute("UPDATE search SET title = ? WHERE rowid = ?", (fields['title'], item['id']))
+            if 'favourite' in fields:
+                favourite = int(bool(fields['favourite'])) - int(item.get('favourite', False))
+            for key, value in fields.items():
+                self.db.execute(f"UPDATE items SET {key} = ? WHERE id = ?", (value, item['id']))
+            self.adjust_stats(self.parent_of(item), 0, size, favourite, fields['modified'])
+        item.update(fields)
+        self.add_revision(item, base, text, fields['modified'])
+
+    def delete(self, item):
+        ids = [row[0] for row in self.db.execute(SUBTREE, (item['id'],))]
+        stats = self.item_stats(item)
+        with self.transaction():
+            self.adjust_stats(self.parent_of(item), -stats.notes, -stats.bytes, -stats.favourites, now())
+            self.db.executemany("DELETE FROM folder_stats WHERE id = ?", ((i,) for i in ids))
+            self.db.executemany("DELETE FROM items WHERE id = ?", ((i,) for i in ids))
+            self.db.executemany("DELETE FROM contents WHERE id = ?", ((i,) for i in ids))
+            self.db.executemany("DELETE FROM search WHERE rowid = ?", ((i,) for i in ids))
+        parent = self.parents.get(item['id'])
+        if parent in self.folders:
+            siblings = self.folders[parent]
+            siblings[:] = [sibling for sibling in siblings if sibling is not item]
+        for i in ids:
+            self.folders.pop(i, None)
+            self.parents.pop(i, None)
+            self.nodes.pop(i, None)
+            self.cache.pop(i)
+
+    def move(self, item, folder, index=None):
+        parent = self.folder_id(folder)
+        if parent in (row[0] for row in self.db.execute(SUBTREE, (item['id'],))):
+            raise ValueError("No se puede mover una carpeta dentro de sí misma")
+        old_siblings = self.children_of(self.parents[item['id']])
+        items = self.children_of(parent)
+        old_siblings[:] = [sibling for sibling in old_siblings if sibling is not item]
+        # Solo cambian la fila movida y las que quedan detrás de ella en el destino
+        stats = self.item_stats(item)
+        when = now()
+        with self.transaction():
+            position = self.make_room(parent, items, index)
+            self.adjust_stats(self.parents[item['id']], -stats.notes, -stats.bytes, -stats.favourites, when)
+            self.adjust_stats(parent, stats.notes, stats.bytes, stats.favourites, max(stats.modified, when))
+            self.db.execute("UPDATE items SET parent = ?, position = ? WHERE id = ?", (parent, position, item['id']))
+        if index is None:
+            items.append(item)
+        else:
+            items.insert(index, item)
+        self.parents[item['id']] = parent
+
+    def make_room(self, parent, items, index):
+        """Posición para poner un elemento en `index` de la carpeta (al final si es None).
+
+        Los que quedan detrás se corren una plaza; las posiciones pueden
+        tener huecos (al sacar un elemento no se renumera), solo importa el orden.
+        """
+        if index is None or index >= len(items):
+            return self.db.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM items WHERE parent = ?", (parent,)).fetchone()[0]
+        position = self.db.execute("SELECT position FROM items WHERE id = ?", (items[index]['id'],)).fetchone()[0]
+        self.db.execute("UPDATE items SET position = position + 1 WHERE parent = ? AND position >= ?",
+                        (parent, position))
+        return position
+
+    def search(self, query, limit=50):
+        match = fts_query(query)
+        if not match:
+            return []
+        rows = self.db.execute(
+            f"SELECT {COLUMNS} FROM search JOIN items ON items.id = search.rowid "
+            "WHERE search MATCH ? ORDER BY bm25(search, 2.0, 1.0) LIMIT ?", (match, limit))
+        return [self.node(row) for row in rows]
+
+    def ancestors(self, item):
+        return [self.node(row) for row in self.db.execute(ANCESTORS, (item['id'],))]
+
+    def favourites(self):
+        rows = self.db.execute(
+            f"SELECT {COLUMNS} FROM items WHERE favourite = 1 ORDER BY title COLLATE NOCASE")
+        return [self.node(row) for row in rows]
+
+    def colors(self):
+        return dict(self.db.execute("SELECT color, COUNT(*) FROM items WHERE color <> 'white' GROUP BY color"))
+
+    def by_color(self, color):
+        rows = self.db.execute(
+            f"SELECT {COLUMNS} FROM items WHERE color = ? AND color <> 'white' ORDER BY title COLLATE NOCASE",
+            (color,))
+        return [self.node(row) for row in rows]
+
+    def parent_of(self, item):
+        parent = self.parents.get(item['id'])
+        if parent is None:
+            parent = self.db.execute("SELECT parent FROM items WHERE id = ?", (item['id'],)).fetchone()[0]
+        return parent
+
+    def adjust_stats(self, parent, notes, size, favourites, modified):
+        self.db.execute(ADJUST_STATS, (parent, notes, size, favourites, modified))
+
+    def folder_stats(self, folder=None):
+        row = self.db.execute("SELECT notes, bytes, favourites, modified FROM folder_stats WHERE id = ?",
+                              (self.folder_id(folder),)).fetchone()
+        return FolderStats(*row) if row else EMPTY
+
+    def item_stats(self, item):
+        row = self.db.execute(
+            "SELECT items.is_folder, items.size, items.favourite, items.modified, folder_stats.notes, "
+            "folder_stats.bytes, folder_stats.favourites, folder_stats.modified "
+            "FROM items LEFT JOIN folder_stats ON folder_stats.id = items.id WHERE items.id = ?",
+            (item['id'],)).fetchone()
+        return row_stats(row) if row else EMPTY
+
+    def children_stats(self, folder=None):
+        rows = self.db.execute(
+            "SELECT items.id, items.is_folder, items.size, items.favourite, items.modified, folder_stats.notes, "
+            "folder_stats.bytes, folder_stats.favourites, folder_stats.modified "
+            "FROM items LEFT JOIN folder_stats ON folder_stats.id = items.id WHERE items.parent = ?",
+            (self.folder_id(folder),))
+        stats = {row[0]: row_stats(row[1:]) for row in rows}
+        return [stats.get(item['id'], EMPTY) for item in self.children(folder)]
+
+    def clear(self):
+        with self.transaction():
+            self.db.execute("DELETE FROM items")
+            self.db.execute("DELETE FROM contents")
+            self.db.execute("DELETE FROM search")
+            self.db.execute("DELETE FROM folder_stats")
+            self.db.execute("INSERT INTO folder_stats (id) VALUES (?)", (ROOT,))
+        self.folders = {}
+        self.parents = {}
+        self.nodes = {}
+        self.cache.clear()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def stats(self):
+        # Los textos van tal cual y el índice FTS5 guarda su propia copia: lo que
+        # ocupan en disco es lo que ocupa la base de datos
+        stats = dict(self.cache.stats())
+        notes, text = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM items WHERE is_folder = 0").fetchone()
+        disk = 0
+        for path in (self.db_file, self.db_file + '-wal', self.db_file + '-shm'):
+            if os.path.exists(path):
+                disk += os.path.getsize(path)
+        stats.update({'text_notes': notes, 'text_bytes': text, 'text_in_memory_bytes': self.cache.size,
+                      'disk_bytes': disk})
+        return stats
+
+
+def migrate_json(data_file=DATA_FILE, journal_file=JOURNAL_FILE, db_file=DB_FILE):
+    """Copia una única vez las notas de data.json (y su diario) a SQLite.
+
+    La base se construye en un fichero temporal que solo se renombra al
+    terminar, así que una migración interrumpida se repite desde cero.
+    """
+    journal = Journal(data_file, journal_file)
+    notes = journal.load()
+
+    tmp_file = db_file + '.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    db = sqlite3.connect(tmp_file)
+    upgrade(db)
+    count = 0
+    with db:
+        stack = [(ROOT, notes)]
+        while stack:
+            parent, items = stack.pop()
+            for position, item in enumerate(items):
+                if 'body' in item and 'content' not in item:
+                    # Contenido que la carga diferida dejó en disco
+                    item = dict(item, content=journal.read_body(item['body']))
+                item_id = insert_item(db, parent, position, item)
+                count += 1
+                if item.get('is_folder', False):
+                    stack.append((item_id, item.get('contents', [])))
+    db.executescript(REBUILD_STATS)
+    db.close()
+    journal.close()
+    if journal.bodies is not None:
+        journal.bodies.close()
+    os.replace(tmp_file, db_file)
+    log.info("Migradas %d notas y carpetas a %s", count, db_file)
+    return count
+
+
+if __name__ == "__main__":
+    migrate_json()
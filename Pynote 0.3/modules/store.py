@@ -0,0 +1,670 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from modules.aggregates import item_stats, now
+from modules.autosave import SaveScheduler
+from modules.backup import BACKUP_DIR, Backups
+from modules.cache import LRUCache
+from modules.codec import BodyCodec, body_report
+from modules.database import DATA_FILE
+from modules.journal import JOURNAL_FILE, Journal, apply_record
+from modules.locking import file_stamp
+from modules.merge import merge_snapshot
+from modules.metrics import metrics
+from modules.node import as_node
+from modules.revisions import Revisions
+from modules.search import INDEX_FILE, SearchIndex, walk
+from modules.tree import TreeIndex, new_id
+from modules.views import ViewIndex, views_file
+
+# Campos que no pasan a una copia: se asignan de nuevo al añadirla
+COPY_SKIP = ('id', 'contents', 'content', 'body', 'stats', 'modified')
+
+
+class NoteStore:
+    """Interfaz común de los almacenes de notas.
+
+    Las notas y carpetas se manejan como diccionarios con el mismo esquema
+    que data.json. La aplicación solo pide los hijos de la carpeta que está
+    mostrando y el contenido de la nota que abre, de modo que cada almacén
+    decide qué mantiene en memoria y qué lee bajo demanda. Cada elemento
+    lleva un 'id' estable que sirve para volver a encontrarlo con get().
+    """
+
+    revisions = None  # Versiones anteriores del texto (modules.revisions), si se guardan
+    backups = None  # Copias de seguridad de los datos (modules.backup), si se hacen
+    recovered = None  # Información de la copia de seguridad de la que se recuperaron los datos al cargar
+
+    def load(self):
+        raise NotImplementedError
+
+    def children(self, folder=None):
+        """Elementos de una carpeta (None es la raíz)."""
+        raise NotImplementedError
+
+    def get(self, item_id):
+        """Elemento con ese identificador, o None si ya no existe."""
+        raise NotImplementedError
+
+    def content(self, note):
+        """Texto completo de una nota, que puede leerse de disco al pedirlo."""
+        raise NotImplementedError
+
+    def add(self, folder, item, index=None):
+        """Añade un elemento (al final de la carpeta si no se da `index`) y devuelve el objeto guardado.
+
+        Si el elemento ya trae 'id' se conserva, como al deshacer un borrado.
+        """
+        raise NotImplementedError
+
+    def update(self, item, **fields):
+        raise NotImplementedError
+
+    def delete(self, item):
+        raise NotImplementedError
+
+    def move(self, item, folder, index=None):
+        """Lleva un elemento (con todo lo que contiene) a otra carpeta o a otra posición de la suya.
+
+        `index` es la posición entre los hijos de la carpeta destino sin
+        contar el elemento, así que dentro de la misma carpeta sirve para
+        reordenar.
+        """
+        raise NotImplementedError
+
+    def copy(self, item, folder, index=None):
+        """Añade en `folder` una copia del elemento y de todo lo que contiene, y la devuelve.
+
+        La copia lleva identificadores nuevos. Se añade elemento a elemento
+        dentro de un lote; los almacenes que pueden añadir un subárbol de
+        una vez lo redefinen.
+        """
+        self.check_copy(item, folder)
+        with self.batch():
+            copy = self.add(folder, self.copy_fields(item), index)
+            stack = [(item, copy)] if item.get('is_folder', False) and copy is not None else []
+            while stack:
+                source, target = stack.pop()
+                for child in list(self.children(source)):
+                    child_copy = self.add(target, self.copy_fields(child))
+                    if child.get('is_folder', False):
+                        stack.append((child, child_copy))
+        return copy
+
+    def check_copy(self, item, folder):
+        if folder is not None and any(ancestor['id'] == item['id']
+                                      for ancestor in self.ancestors(folder) + [folder]):
+            raise ValueError("No se puede copiar una carpeta dentro de sí misma")
+
+    def copy_fields(self, item, read=None):
+        """Campos de un elemento para añadir una copia suya, sin lo que contiene."""
+        fields = {key: value for key, value in item.items() if key not in COPY_SKIP}
+        if item.get('is_folder', False):
+            fields['contents'] = []
+        else:
+            fields['content'] = (read or self.content)(item)
+        return fields
+
+    def search(self, query, limit=50):
+        """Notas y carpetas que coinciden con la consulta, de más a menos relevantes."""
+        raise NotImplementedError
+
+    def ancestors(self, item):
+        """Carpetas que contienen al elemento, desde la raíz."""
+        raise NotImplementedError
+
+    def folder_stats(self, folder=None):
+        """Totales (FolderStats) de todo lo que contiene una carpeta (None es la raíz)."""
+        raise NotImplementedError
+
+    def item_stats(self, item):
+        """Lo que suma un elemento (FolderStats) a los totales de las carpetas que lo contienen."""
+        raise NotImplementedError
+
+    def favourites(self):
+        """Todos los elementos favoritos, por título."""
+        raise NotImplementedError
+
+    def colors(self):
+        """Número de elementos de cada color (sin contar el blanco por defecto)."""
+        raise NotImplementedError
+
+    def by_color(self, color):
+        """Todos los elementos de un color, por título."""
+        raise NotImplementedError
+
+    def children_stats(self, folder=None):
+        """item_stats() de cada elemento de children(folder), en el mismo orden."""
+        return [self.item_stats(item) for item in self.children(folder)]
+
+    def clear(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Fuerza la escritura de los cambios pendientes."""
+        pass
+
+    @contextmanager
+    def batch(self):
+        """Agrupa muchos cambios seguidos (por ejemplo una importación) en una sola escritura."""
+        yield
+
+    def sync(self):
+        """Aplica lo que otros procesos cambiaron en el almacén.
+
+        Devuelve True si cambió algo y la interfaz debe volver a pedir los
+        elementos que muestra (que pueden ser objetos nuevos: se buscan de
+        nuevo por identificador).
+        """
+        return False
+
+    def watch_paths(self):
+        """Ficheros cuyo cambio indica que otro proceso escribió en el almacén."""
+        return []
+
+    def history_file(self):
+        """Fichero del historial de deshacer (modules.history), o None si no lo tiene."""
+        return None
+
+    def backup(self, force=False):
+        """Copia de seguridad de los datos si ya toca (con `force`, siempre); devuelve su ruta o None."""
+        return None
+
+    def backup_name(self):
+        """Nombre con el que se guardan las copias de seguridad de este almacén (modules.backup)."""
+        return None
+
+    def revisions_file(self):
+        """Fichero de las versiones anteriores del texto (modules.revisions), o None si no lo tiene."""
+        return None
+
+    def revision_base(self, item, fields):
+        """(texto, fecha) de la nota antes de un update() que cambia su texto, o None si no se guarda."""
+        if self.revisions is None or 'content' not in fields or item.get('is_folder', False):
+            return None
+        return self.content(item), item.get('modified', 0)
+
+    def add_revision(self, item, base, text, when):
+        """Guarda en las versiones el cambio de texto de update(); `base` es lo que dio revision_base()."""
+        if base is not None and base[0] != text:
+            self.revisions.record(item['id'], base[0], text, base[1], when)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        """Métricas internas del almacén para diagnóstico."""
+        return {}
+
+
+class JsonStore(NoteStore):
+    """Almacén en memoria respaldado por data.json.
+
+    Con `journal` activo cada cambio se añade al diario de cambios; si no,
+    los cambios se aplican en memoria y un SaveScheduler reescribe data.json
+    en segundo plano cuando se calma la actividad. Si existe el índice de
+    metadatos solo se cargan títulos y atributos; el texto de las notas se
+    lee al abrirlas a través de una caché LRU. Con `snapshot` 'binary' además
+    cada carpeta se lee de la instantánea la primera vez que se abre. En la
+    instantánea los textos grandes van comprimidos con `compression` a
+    partir de `compress_min` bytes, y los repetidos una sola vez; se
+    descomprimen al leerlos, nunca para mostrar la lista.
+
+    Otros procesos pueden usar los mismos ficheros. Con diario se aplican
+    sus registros antes de añadir uno propio y en cada sync(); sin diario,
+    si otro proceso reescribió data.json se fusiona con los cambios propios
+    (modules.merge) antes de guardar y en cada sync().
+    """
+
+    def __init__(self, data_file=DATA_FILE, journal_file=JOURNAL_FILE, compact_after=1000,
+                 journal=True, autosave_delay=1.0, index_file=INDEX_FILE, cache_bytes=32 * 1024 * 1024,
+                 snapshot='json', compression='zlib', compress_min=4096):
+        self.data_file = data_file
+        self.index_file = index_file
+        self.views_file = views_file(data_file)
+        self.journal = Journal(data_file, journal_file, compact_after, snapshot,
+                               BodyCodec(compression, compress_min))
+        self.use_journal = journal
+        self.autosave_delay = autosave_delay
+        self.scheduler = None
+        # Protege el árbol mientras el hilo de guardado lo serializa
+        self.lock = threading.Lock()
+        self.notes = []
+        # Índice por identificador con la carpeta de cada elemento
+        self.tree = TreeIndex(self.notes)
+        self.cache = LRUCache(cache_bytes)
+        # El índice de búsqueda se carga de disco o se construye en la primera consulta
+        self.search_index = SearchIndex(self.read_content)
+        self.index_ready = False
+        self.index_fingerprint = None
+        self.index_deferred = False
+        self.changes = 0  # Cambios desde la carga; invalidan un índice que aún no se ha leído
+        self.journal.on_foreign = self.apply_foreign
+        self.snapshot_stamp = None  # Instantánea tal como se cargó o escribió aquí (sin diario)
+        self.external = False  # Otro proceso cambió el árbol desde el último sync()
+
+    def fingerprint(self):
+        """Tamaño y fecha de los ficheros de datos, para validar el índice guardado."""
+        result = []
+        for path in (self.journal.snapshot.current_file(), self.journal.journal_file, self.journal.rotated_file):
+            if path is not None and os.path.exists(path):
+                info = os.stat(path)
+                result.append([info.st_size, info.st_mtime_ns])
+            else:
+                result.append(None)
+        return result
+
+    def load(self):
+        fingerprint = self.fingerprint()
+        self.journal.backups = self.backups
+        self.notes = self.journal.load()
+        self.recovered = self.journal.recovered
+        if self.recovered is not None:
+            # La instantánea se sustituyó: los índices guardados ya no le corresponden
+            fingerprint = self.fingerprint()
+        if not self.use_journal:
+            # Un diario pendiente de una sesión anterior se vuelca una sola vez
+            with self.journal.lock:
+                self.journal.fold()
+                self.snapshot_stamp = self.current_stamp()
+            self.journal.tree.track_edits()
+            self.scheduler = SaveScheduler(self.save_snapshot, self.autosave_delay)
+        else:
+            # Con diario la instantánea la reescribe la compactación con su propio árbol
+            self.journal.tree.touch_all()
+        self.tree = self.journal.tree
+        missing = self.tree.missing_ids()
+        if missing:
+            # Notas creadas por versiones anteriores: el identificador se asigna una vez
+            self.record({'op': 'assign_ids', 'ids': [new_id() for item in missing]})
+        if self.tree.ensure_stats():
+            # Instantánea sin totales por carpeta: se reescribe para no volver a calcularlos
+            if self.use_journal:
+                self.journal.compact()
+            else:
+                self.scheduler.mark_dirty()
+        self.journal.start_indexer()
+        views = ViewIndex()
+        if views.load(self.views_file, fingerprint):
+            self.tree.views = views
+        self.index_fingerprint = fingerprint
+        self.changes = 0
+        # El índice se lee en la primera búsqueda o antes del primer cambio:
+        # quien solo consulta una carpeta (la orden pynote) no lo necesita
+        self.index_deferred = True
+
+    def load_deferred_index(self):
+        """Lee el índice aplazado antes de un cambio, que si no lo invalidaría."""
+        if self.index_deferred and not self.changes and not self.tree.unexpanded:
+            # Con carpetas sin leer habría que expandirlas todas: se reconstruye al buscar
+            self.index_deferred = False
+            self.index_ready = self.search_index.load(self.notes, self.index_fingerprint, self.index_file)
+
+    def record(self, record):
+        """Aplica un cambio y lo registra en el diario o lo deja para el autoguardado.
+
+        Devuelve False si otro proceso ya borró el elemento al que se refiere.
+        """
+        with self.lock:
+            self.load_deferred_index()
+            if self.use_journal:
+                if not self.journal.append(record):
+                    return False
+            else:
+                apply_record(self.tree, record)
+                self.scheduler.mark_dirty()
+            self.changes += 1
+        return True
+
+    def save_snapshot(self):
+        """Escribe data.json desde el hilo de autoguardado."""
+        # El indexado de metadatos del arranque escribe los mismos ficheros
+        self.journal.wait()
+        with self.journal.lock:
+            # Solo se copia la estructura bajo el cerrojo; la codificación va fuera
+            with self.lock:
+                # Si otro proceso guardó entretanto, sus cambios no se pisan
+                self.merge_external()
+                dirty = self.tree.take_dirty()
+                # Lo que no cambió queda como referencia a su sitio en los ficheros actuales
+                notes = self.journal.snapshot.freeze(self.notes, dirty)
+                children_of = self.tree.reader()
+                modified = self.tree.root_modified
+                edits = self.tree.take_edits()
+            try:
+                self.journal.snapshot.write(notes, self.journal.read_body, keep=self.journal.keep_bodies(),
+                                            children_of=children_of, dirty=dirty, modified=modified)
+            except Exception:
+                with self.lock:
+                    self.tree.restore_dirty(dirty)
+                    self.tree.restore_edits(edits)
+                raise
+            self.snapshot_stamp = self.current_stamp()
+            self.journal.backup()
+
+    def current_stamp(self):
+        path = self.journal.snapshot.current_file()
+        return file_stamp(path) if path is not None else None
+
+    def merge_external(self):
+        """Fusiona la instantánea si otro proceso la reescribió; se llama con los dos cerrojos."""
+        if self.tree.edits is None:
+            # Con diario los cambios de otros procesos llegan por el propio diario
+            return False
+        stamp = self.current_stamp()
+        if stamp is None or stamp == self.snapshot_stamp:
+            # Sin instantánea no hay nada que fusionar: el próximo guardado la recrea
+            return False
+        with metrics.timer('merge'):
+            theirs = self.journal.snapshot.read()
+            changed = merge_snapshot(self.tree, theirs, self.tree.edits, self.read_content)
+        self.snapshot_stamp = stamp
+        if changed:
+            self.index_ready = False
+            self.index_deferred = False
+            self.changes += 1
+            self.external = True
+        return bool(changed)
+
+    def apply_foreign(self, record):
+        """Aplica un registro que otro proceso añadió al diario, manteniendo el índice de búsqueda."""
+        op = record['op']
+        self.load_deferred_index()
+        if op == 'delete' and self.index_ready:
+            item = self.tree.get(record['id'])
+            if item is not None:
+                self.search_index.remove_subtree(item)
+        if not self.journal.apply(record):
+            return
+        self.changes += 1
+        self.external = True
+        if not self.index_ready:
+            return
+        if op == 'add':
+            self.search_index.add_subtree(self.tree.get(record['item']['id']))
+        elif op == 'update' and ('title' in record['fields'] or 'content' in record['fields']):
+            self.search_index.add(self.tree.get(record['id']))
+        elif op == 'clear':
+            self.search_index.clear()
+        elif op == 'assign_ids':
+            self.index_ready = False
+
+    def reload(self):
+        """Vuelve a cargar el árbol cuando otro programa sustituyó data.json.
+
+        El diario se reproduce sobre la instantánea nueva, así que los
+        cambios de todos los procesos prevalecen sobre ella. Se llama con los
+        dos cerrojos.
+        """
+        old_bodies = self.journal.bodies
+        self.notes = self.journal.load()
+        self.journal.tree.touch_all()
+        self.tree = self.journal.tree
+        if old_bodies is not None and old_bodies is not self.journal.bodies:
+            old_bodies.close()
+        self.cache.clear()
+        missing = self.tree.missing_ids()
+        if missing:
+            self.journal.append({'op': 'assign_ids', 'ids': [new_id() for item in missing]})
+        self.tree.ensure_stats()
+        self.index_ready = False
+        self.index_deferred = False
+        self.changes += 1
+        self.external = True
+
+    def sync(self):
+        if self.use_journal:
+            with self.lock, self.journal.lock:
+                if self.journal.replaced():
+                    self.reload()
+                else:
+                    self.journal.catch_up()
+        elif self.scheduler is not None:
+            with self.journal.lock, self.lock:
+                # Lo propio que aún difiere de lo fusionado hay que guardarlo
+                if self.merge_external() and (self.tree.edits or self.tree.dirty):
+                    self.scheduler.mark_dirty()
+        changed, self.external = self.external, False
+        return changed
+
+    def watch_paths(self):
+        return [self.data_file, self.journal.journal_file]
+
+    def history_file(self):
+        return self.data_file + '.history'
+
+    def revisions_file(self):
+        return self.data_file + '.revisions'
+
+    def backup(self, force=False):
+        if force and self.scheduler is not None:
+            # Lo que espera al autoguardado también entra en la copia
+            self.flush()
+            if self.journal.snapshot.current_file() is None:
+                self.save_snapshot()
+        return self.journal.backup(force)
+
+    def backup_name(self):
+        return self.journal.snapshot.backup_name()
+
+    def contains(self, item):
+        return item is not None and self.tree.get(item.get('id')) is item
+
+    def children(self, folder=None):
+        if folder is None:
+            return self.notes
+        if folder.get('id') in self.tree.unexpanded:
+            with self.lock:
+                self.tree.expand(folder['id'])
+        return folder.setdefault('contents', [])
+
+    def get(self, item_id):
+        with self.lock:
+            return self.tree.get(item_id)
+
+    def content(self, note):
+        if 'content' in note or 'body' not in note:
+            return note.get('content', '')
+        key = tuple(note['body'])
+        text = self.cache.get(key)
+        if text is None:
+            text = self.journal.read_body(note['body'])
+            self.cache.put(key, text)
+        return text
+
+    def read_content(self, note):
+        """Texto de una nota sin pasar por la caché (para recorridos completos)."""
+        if 'content' in note or 'body' not in note:
+            return note.get('content', '')
+        return self.journal.read_body(note['body'])
+
+    def add(self, folder, item, index=None):
+        if folder is not None and not self.contains(folder):
+            return None
+        item = as_node(item)
+        item.setdefault('id', new_id())
+        item.setdefault('modified', now())
+        for child in walk(item.get('contents', [])):
+            child.setdefault('id', new_id())
+            child.setdefault('modified', item['modified'])
+        record = {'op': 'add', 'parent': folder['id'] if folder else None, 'item': item}
+        if index is not None:
+            record['index'] = index
+        if not self.record(record):
+            return None
+        if self.index_ready:
+            self.search_index.add_subtree(item)
+        return item
+
+    def update(self, item, **fields):
+        fields.setdefault('modified', now())
+        if not self.contains(item):
+            return
+        base = self.revision_base(item, fields)
+        text, when = fields.get('content'), fields['modified']
+        if self.record({'op': 'update', 'id': item['id'], 'fields': fields}):
+            self.add_revision(item, base, text, when)
+            if self.index_ready and ('title' in fields or 'content' in fields):
+                self.search_index.add(item)
+
+    def delete(self, item):
+        if self.contains(item) and self.record({'op': 'delete', 'id': item['id'], 'time': now()}):
+            if self.index_ready:
+                self.search_index.remove_subtree(item)
+
+    def move(self, item, folder, index=None):
+        if not self.contains(item) or (folder is not None and not self.contains(folder)):
+            return
+        self.record({'op': 'move', 'id': item['id'], 'parent': folder['id'] if folder else None, 'index': index,
+                     'time': now()})
+
+    def copy(self, item, folder, index=None):
+        # Todo el subárbol va en un único registro 'add'; el texto se escribe
+        # otra vez, pero al pasar a la instantánea se guarda una sola vez
+        if not self.contains(item) or (folder is not None and not self.contains(folder)):
+            return None
+        self.check_copy(item, folder)
+        root = self.copy_fields(item)
+        stack = [(item, root)] if item.get('is_folder', False) else []
+        while stack:
+            source, target = stack.pop()
+            for child in self.children(source):
+                fields = self.copy_fields(child, self.read_content)
+                if child.get('is_folder', False):
+                    stack.append((child, fields))
+                target['contents'].append(fields)
+        return self.add(folder, root, index)
+
+    def search(self, query, limit=50):
+        if not self.index_ready:
+            with self.lock:
+                self.tree.expand_all()
+            loaded = (self.index_deferred and not self.changes
+                      and self.search_index.load(self.notes, self.index_fingerprint, self.index_file))
+            if not loaded:
+                self.search_index.build(self.notes)
+            self.index_ready = True
+        return self.search_index.search(query, limit)
+
+    def ancestors(self, item):
+        return self.tree.ancestors(item.get('id'))
+
+    def folder_stats(self, folder=None):
+        return self.tree.folder_stats(folder['id'] if folder else None)
+
+    def item_stats(self, item):
+        return item_stats(item)
+
+    def view_index(self):
+        """Índices de favoritos y colores; si no se pudieron cargar se rehacen una vez."""
+        with self.lock:
+            if self.tree.views is None:
+                self.tree.expand_all()
+                views = ViewIndex()
+                views.build(self.notes)
+                self.tree.views = views
+            return self.tree.views
+
+    def view_items(self, ids):
+        with self.lock:
+            items = [self.tree.get(item_id) for item_id in ids]
+        return sorted((item for item in items if item is not None), key=lambda item: item['title'].lower())
+
+    def favourites(self):
+        return self.view_items(list(self.view_index().favourites))
+
+    def colors(self):
+        return self.view_index().counts()
+
+    def by_color(self, color):
+        return self.view_items(list(self.view_index().colors.get(color, ())))
+
+    def clear(self):
+        self.record({'op': 'clear'})
+        if self.index_ready:
+            self.search_index.clear()
+
+    def flush(self):
+        if self.scheduler is not None:
+            self.scheduler.flush()
+
+    @contextmanager
+    def batch(self):
+        if not self.use_journal:
+            # El autoguardado ya agrupa los cambios que llegan seguidos
+            yield
+            return
+        with self.journal.batch():
+            yield
+
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+        self.journal.wait()
+        with self.journal.lock, self.lock:
+            # Los índices se guardan con la huella de los ficheros, así que antes
+            # tienen que recoger lo que otros procesos escribieron hasta ahora
+            if not self.use_journal:
+                self.merge_external()
+            elif self.journal.file is not None:
+                self.journal.catch_up()
+            fingerprint = self.fingerprint()
+        self.journal.close()
+        if self.journal.bodies is not None:
+            self.journal.bodies.close()
+        # Los índices se guardan junto a data.json para no reconstruirlos al arrancar
+        if self.index_ready and (self.search_index.dirty or fingerprint != self.index_fingerprint):
+            self.search_index.save(self.notes, fingerprint, self.index_file)
+        views = self.tree.views
+        if views is not None and (views.dirty or fingerprint != self.index_fingerprint):
+            views.save(self.views_file, fingerprint)
+
+    def text_report(self):
+        """body_report() de todas las notas, sin cargar las carpetas que aún no se abrieron."""
+        with self.lock:
+            items = list(walk(self.notes))
+            for folder_no in list(self.tree.unexpanded.values()):
+                items.extend(walk(self.tree.source.subtree(folder_no)))
+        return body_report(items, self.cache.size, self.journal.snapshot.inline_texts)
+
+    def stats(self):
+        stats = dict(self.cache.stats())
+        if self.scheduler is not None:
+            stats.update(self.scheduler.stats())
+        else:
+            stats['journal_pending'] = self.journal.pending
+        stats.update(self.text_report())
+        stats['disk_bytes'] = self.journal.disk_bytes()
+        return stats
+
+
+def open_store(storage):
+    """Crea el almacén indicado en la sección 'storage' de la configuración."""
+    store = create_store(storage)
+    revisions = storage.get('revisions', {})
+    if revisions.get('max_versions', 50) > 0:
+        store.revisions = Revisions(store.revisions_file(), revisions.get('max_versions', 50),
+                                    revisions.get('max_age_days', 365),
+                                    revisions.get('max_bytes', 64 * 1024 * 1024))
+    backups = storage.get('backups', {})
+    if backups.get('keep', 10) > 0:
+        store.backups = Backups(backups.get('directory') or BACKUP_DIR, backups.get('keep', 10),
+                                backups.get('interval_minutes', 60) * 60)
+    return store
+
+
+def create_store(storage):
+    backend = storage.get('backend', 'json')
+    if backend == 'sqlite':
+        from modules.sqlite_store import SqliteStore
+        return SqliteStore(cache_bytes=storage.get('cache_bytes', 32 * 1024 * 1024))
+    if backend == 'json':
+        return JsonStore(snapshot=storage.get('snapshot', 'json'),
+                         compact_after=storage.get('compact_after', 1000),
+                         journal=storage.get('journal', True),
+                         autosave_delay=storage.get('autosave_delay', 1.0),
+                         cache_bytes=storage.get('cache_bytes', 32 * 1024 * 1024),
+                         compression=storage.get('compression', 'zlib'),
+                         compress_min=storage.get('compress_min', 4096))
+    raise ValueError(f"Tipo de almacenamiento desconocido: {backend}")
@@ -0,0 +1,228 @@
+import argparse
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from modules.metrics import log, metrics
+
+# Ficheros que se importan como notas
+EXTENSIONS = ('.md', '.txt')
+# Caracteres que no pueden ir en un nombre de fichero en alguno de los sistemas
+UNSAFE = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+MAX_NAME = 120
+
+
+# Importación y exportación masiva entre el almacén y un árbol de ficheros:
+# cada carpeta es un directorio y cada nota un fichero .md o .txt cuyo
+# nombre es el título. Los ficheros se recorren y se leen o escriben a
+# medida que se avanza, con un número acotado en vuelo, así que la memoria
+# no depende del número de notas. La lectura y escritura de ficheros va en
+# un grupo de hilos; el almacén solo se toca desde el hilo principal.
+def scan(source):
+    """Recorre el directorio en profundidad y en orden alfabético.
+
+    Devuelve pares (carpeta, ruta): la carpeta es la tupla de nombres de
+    directorio relativa a `source`, y la ruta es None cuando el elemento es
+    el propio directorio (que siempre llega antes que su contenido).
+    """
+    stack = [((), source)]
+    while stack:
+        parts, directory = stack.pop()
+        if parts:
+            yield parts, None
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name.lower())
+        except OSError as e:
+            log.warning("No se pudo leer el directorio %s: %s", directory, e)
+            continue
+        folders = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                folders.append((parts + (entry.name,), entry.path))
+            elif entry.name.lower().endswith(EXTENSIONS):
+                yield parts, entry.path
+        # Se apilan al revés para recorrerlos en orden
+        stack.extend(reversed(folders))
+
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        return file.read()
+
+
+def write_text(path, text):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write(text)
+    return len(text)
+
+
+class Batches:
+    """Abre un lote del almacén y lo cierra cada `size` cambios."""
+
+    def __init__(self, store, size):
+        self.store = store
+        self.size = size
+        self.count = 0
+        self.current = None
+
+    def add(self, folder, item):
+        if self.current is None:
+            self.current = ExitStack()
+            self.current.enter_context(self.store.batch())
+        item = self.store.add(folder, item)
+        self.count += 1
+        if self.count % self.size == 0:
+            self.close()
+        return item
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+
+def import_tree(store, source, folder=None, batch_size=500, workers=8, window=256):
+    """Importa los .md y .txt de `source` dentro de `folder` (None es la raíz).
+
+    Los subdirectorios se convierten en carpetas y cada fichero en una nota
+    con su nombre sin extensión como título. Devuelve (carpetas, notas).
+    """
+    if not os.path.isdir(source):
+        raise ValueError(f"No existe el directorio: {source}")
+    folders = {(): folder}
+    counts = [0, 0]
+    batches = Batches(store, batch_size)
+    # Lecturas en vuelo, en el orden en que hay que añadirlas
+    pending = deque()
+
+    def add_next():
+        parts, path, future = pending.popleft()
+        parent = folders.get(parts[:-1] if path is None else parts)
+        if path is None:
+            folders[parts] = batches.add(parent, {'title': parts[-1], 'is_folder': True, 'contents': []})
+            counts[0] += 1
+        else:
+            title = os.path.splitext(os.path.basename(path))[0]
+            batches.add(parent, {'title': title, 'content': future.result()})
+            counts[1] += 1
+
+    with metrics.timer('import'), ThreadPoolExecutor(workers) as pool:
+        try:
+            for parts, path in scan(source):
+                pending.append((parts, path, pool.submit(read_text, path) if path is not None else None))
+                while len(pending) > window:
+                    add_next()
+            while pending:
+                add_next()
+        finally:
+            for _, _, future in pending:
+                if future is not None:
+                    future.cancel()
+            batches.close()
+    return tuple(counts)
+
+
+def safe_name(title):
+    """Nombre de fichero válido en cualquier sistema a partir de un título."""
+    name = UNSAFE.sub('_', title).strip().rstrip('.')[:MAX_NAME].strip()
+    return name or 'Untitled'
+
+
+def unique_name(name, used, extension=''):
+    """Añade " (2)", " (3)"... si el nombre ya se usó en el directorio (sin distinguir mayúsculas)."""
+    candidate = name
+    number = 2
+    while (candidate + extension).lower() in used:
+        candidate = f"{name} ({number})"
+        number += 1
+    used.add((candidate + extension).lower())
+    return candidate + extension
+
+
+def export_tree(store, target, folder=None, extension='.md', workers=8, window=256):
+    """Escribe las carpetas como directorios y las notas como ficheros en `target`.
+
+    Devuelve (carpetas, notas).
+    """
+    counts = [0, 0]
+    os.makedirs(target, exist_ok=True)
+    writes = deque()
+    with metrics.timer('export'), ThreadPoolExecutor(workers) as pool:
+        try:
+            stack = [(folder, target)]
+            while stack:
+                parent, directory = stack.pop()
+                used = set()
+                for item in store.children(parent):
+                    if item.get('is_folder', False):
+                        path = os.path.join(directory, unique_name(safe_name(item['title']), used))
+                        os.makedirs(path, exist_ok=True)
+                        stack.append((item, path))
+                        counts[0] += 1
+                        continue
+                    path = os.path.join(directory, unique_name(safe_name(item['title']), used, extension))
+                    writes.append(pool.submit(write_text, path, store.content(item)))
+                    counts[1] += 1
+                    while len(writes) > window:
+                        metrics.count('bytes_exported', writes.popleft().result())
+            while writes:
+                metrics.count('bytes_exported', writes.popleft().result())
+        finally:
+            for future in writes:
+                future.cancel()
+    return tuple(counts)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m modules.transfer",
+                                     description="Import or export notes as a tree of Markdown/text files")
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help="add the .md/.txt files of a directory as notes")
+    importer.add_argument('source', help="directory to import")
+    importer.add_argument('--into', default='', metavar='FOLDER',
+                          help="folder path (titles separated by '/') to import into; created if missing")
+    importer.add_argument('--batch', type=int, default=500, help="changes per storage commit")
+    exporter = commands.add_parser('export', help="write notes and folders to a directory")
+    exporter.add_argument('target', help="directory to write to")
+    exporter.add_argument('--from', dest='folder', default='', metavar='FOLDER',
+                          help="folder path (titles separated by '/') to export; default is everything")
+    exporter.add_argument('--ext', default='.md', choices=EXTENSIONS, help="extension of the note files")
+    for command in (importer, exporter):
+        command.add_argument('--workers', type=int, default=8, help="threads reading or writing files")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from modules.api import find_folder
+    from modules.config import load_config
+    from modules.store import open_store
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    store = open_store(load_config().get('storage', {}))
+    store.load()
+    start = time.perf_counter()
+    try:
+        if args.command == 'import':
+            folder = find_folder(store, args.into, create=True)
+            folders, notes = import_tree(store, args.source, folder, args.batch, args.workers)
+            print(f"Importadas {notes} notas y {folders} carpetas de {args.source}", end='')
+        else:
+            folder = find_folder(store, args.folder)
+            folders, notes = export_tree(store, args.target, folder, args.ext, args.workers)
+            print(f"Exportadas {notes} notas y {folders} carpetas a {args.target}", end='')
+        print(f" en {time.perf_counter() - start:.1f} s")
+    except ValueError as e:
+        print(e)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
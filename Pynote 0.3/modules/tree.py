@@ -0,0 +1,440 @@
+from modules.aggregates import folder_stats, item_stats, total
+from modules.node import as_node
+
+
+def new_id():
+    import uuid  # Solo al crear: importarlo retrasa el arranque de la orden pynote
+    return uuid.uuid4().hex
+
+
+class TreeIndex:
+    """Índice en memoria del árbol de notas por identificador.
+
+    Cada nota y carpeta lleva un 'id' persistente en data.json; el índice
+    guarda el elemento y la carpeta que lo contiene, de modo que buscar,
+    mover o borrar por identificador no depende de la posición en la lista.
+
+    Si el árbol viene de una instantánea binaria, `unexpanded` guarda las
+    carpetas cuyos hijos aún están solo en `source`; se leen la primera vez
+    que se piden sus hijos o uno de sus elementos por identificador.
+
+    `dirty` guarda los identificadores de los elementos que cambiaron desde
+    la última escritura de la instantánea, junto con todas sus carpetas; el
+    resto se copia tal cual de la instantánea anterior. None significa que
+    no se sabe qué cambió y hay que reescribirlo todo.
+
+    Con track_edits() se anota además qué cambió este proceso (`edits`),
+    para fusionar la instantánea si otro proceso la reescribe entretanto.
+
+    Cada operación actualiza también los totales ('stats') de las carpetas
+    que contienen al elemento, que se guardan con la instantánea. Si esta
+    es de una versión que no los tenía (`stale_stats`), ensure_stats() los
+    calcula una vez recorriendo todo el árbol. La raíz no tiene 'stats': sus
+    totales se suman de sus elementos, salvo la fecha del último cambio
+    (`root_modified`), que también la mueven los borrados y los traslados.
+
+    Si el almacén le asigna `views` (un ViewIndex), también mantiene los
+    índices de favoritos y colores; None significa que no están al día.
+    """
+
+    def __init__(self, notes, source=None, unexpanded=None):
+        self.notes = notes
+        self.source = source
+        self.unexpanded = dict(unexpanded or {})  # Id de carpeta -> número de carpeta en source
+        self.nodes = {}  # Identificador -> elemento
+        self.parents = {}  # Identificador -> identificador de la carpeta (None en la raíz)
+        self.dirty = set()
+        self.edits = None
+        self.views = None
+        self.root_modified = 0  # Último cambio en la raíz, aunque ya no quede el elemento
+        # Basta mirar la raíz: las carpetas se escriben siempre con sus totales
+        self.stale_stats = any(item.get('is_folder', False) and 'stats' not in item for item in notes)
+        self.rebuild()
+
+    def rebuild(self):
+        self.nodes = {}
+        self.parents = {}
+        self.register(self.notes, None)
+
+    def register(self, items, parent_id):
+        stack = [(items, parent_id)]
+        while stack:
+            items, parent_id = stack.pop()
+            for item in items:
+                item_id = item.get('id')
+                if item_id is not None:
+                    self.nodes[item_id] = item
+                    self.parents[item_id] = parent_id
+                if item.get('is_folder', False):
+                    stack.append((item.get('contents', []), item_id))
+
+    def unregister(self, item):
+        stack = [item]
+        while stack:
+            item = stack.pop()
+            self.nodes.pop(item.get('id'), None)
+            self.parents.pop(item.get('id'), None)
+            self.unexpanded.pop(item.get('id'), None)
+            stack.extend(item.get('contents', []))
+
+    def missing_ids(self):
+        """Elementos sin identificador, en orden de recorrido en profundidad.
+
+        Las carpetas sin leer no cuentan: una instantánea binaria solo se
+        lee por partes si todos sus elementos tienen identificador.
+        """
+        missing = []
+        stack = [iter(self.notes)]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+            if 'id' not in item:
+                missing.append(item)
+            if item.get('is_folder', False):
+                stack.append(iter(item.get('contents', [])))
+        return missing
+
+    def assign_ids(self, ids):
+        assigned = []
+        for item, item_id in zip(self.missing_ids(), ids):
+            item['id'] = item_id
+            assigned.append(item_id)
+        self.rebuild()
+        # Los elementos sin identificador no estaban en las vistas
+        self.views = None
+        for item_id in assigned:
+            self.touch(item_id)
+        if self.edits is not None:
+            self.edits.added(assigned)
+
+    # Seguimiento de cambios para reescribir solo lo que cambió
+    def touch(self, item_id):
+        """Marca un elemento y las carpetas que lo contienen como modificados."""
+        while item_id is not None and self.dirty is not None:
+            self.dirty.add(item_id)
+            item_id = self.parents.get(item_id)
+
+    def touch_all(self):
+        self.dirty = None
+
+    def take_dirty(self):
+        """Devuelve los cambios pendientes de escribir y empieza a contar de nuevo."""
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def restore_dirty(self, dirty):
+        """Vuelve a marcar los cambios de una escritura que falló."""
+        if dirty is None or self.dirty is None:
+            self.dirty = None
+        else:
+            self.dirty.update(dirty)
+
+    def track_edits(self):
+        self.edits = Edits()
+
+    def take_edits(self):
+        """Devuelve los cambios propios desde la última escritura y empieza de nuevo."""
+        edits = self.edits
+        if edits is not None:
+            self.edits = Edits()
+        return edits
+
+    def restore_edits(self, edits):
+        if edits is not None and self.edits is not None:
+            self.edits.update(edits)
+
+    # Totales por carpeta
+    def folder_stats(self, folder_id):
+        """Totales de una carpeta (None es la raíz, que se suma de sus elementos)."""
+        if folder_id is None:
+            stats = total(item_stats(item) for item in self.notes)
+            return stats._replace(modified=max(stats.modified, self.root_modified))
+        return folder_stats(self.node(folder_id))
+
+    def adjust_stats(self, folder_id, notes, size, favourites, modified):
+        """Suma un cambio a los totales de una carpeta y de todas las que la contienen."""
+        # Como la fila de la raíz en modules.sqlite_store: un borrado no deja ningún elemento con su fecha
+        self.root_modified = max(self.root_modified, modified)
+        if self.stale_stats:
+            return
+        while folder_id is not None:
+            folder = self.nodes[folder_id]
+            old = folder_stats(folder)
+            # Se sustituye la lista: una copia congelada del árbol puede estar usando la anterior
+            folder['stats'] = [old.notes + notes, old.bytes + size, old.favourites + favourites,
+                               max(old.modified, modified)]
+            folder_id = self.parents[folder_id]
+
+    def compute_stats(self, items=None):
+        """Calcula desde cero los totales de las carpetas de `items` (None es todo el árbol).
+
+        Devuelve los identificadores de las carpetas cuyos totales cambiaron.
+        """
+        if items is None:
+            self.expand_all()
+            items = self.notes
+        changed = []
+        # Postorden: una carpeta se suma cuando ya están los totales de las suyas
+        stack = [(item, False) for item in items if item.get('is_folder', False)]
+        while stack:
+            folder, ready = stack.pop()
+            children = folder.get('contents', [])
+            if not ready:
+                stack.append((folder, True))
+                stack.extend((child, False) for child in children if child.get('is_folder', False))
+                continue
+            stats = list(total(item_stats(child) for child in children))
+            if folder.get('stats') != stats:
+                folder['stats'] = stats
+                changed.append(folder.get('id'))
+        return changed
+
+    def ensure_stats(self):
+        """Calcula los totales que faltan; devuelve True si hubo que recorrer el árbol."""
+        if not self.stale_stats:
+            return False
+        for folder_id in self.compute_stats():
+            self.touch(folder_id)
+        self.stale_stats = False
+        return True
+
+    def subtree_ids(self, item):
+        ids = []
+        stack = [item]
+        while stack:
+            item = stack.pop()
+            if item.get('id') is not None:
+                ids.append(item['id'])
+            stack.extend(item.get('contents', []))
+        return ids
+
+    def get(self, item_id):
+        item = self.nodes.get(item_id)
+        if item is None and self.unexpanded:
+            item = self.find(item_id)
+        return item
+
+    def node(self, item_id):
+        item = self.get(item_id)
+        if item is None:
+            raise KeyError(item_id)
+        return item
+
+    def find(self, item_id):
+        """Lee las carpetas necesarias para llegar a un elemento de la instantánea."""
+        folder_no = self.source.locate(item_id)
+        if folder_no is None or folder_no == 0:
+            return None
+        # Primero se busca (y se lee) la carpeta que lo contiene
+        folder_id = self.source.folder_id(folder_no)
+        if self.get(folder_id) is not None and folder_id in self.unexpanded:
+            self.expand(folder_id)
+        return self.nodes.get(item_id)
+
+    def expand(self, folder_id):
+        items, pending = self.source.children(self.unexpanded.pop(folder_id))
+        self.nodes[folder_id]['contents'] = items
+        self.register(items, folder_id)
+        self.unexpanded.update(pending)
+
+    def expand_subtree(self, item):
+        stack = [item]
+        while stack:
+            item = stack.pop()
+            if item.get('id') in self.unexpanded:
+                self.expand(item['id'])
+            stack.extend(item.get('contents', []))
+
+    def expand_all(self):
+        """Lee todas las carpetas pendientes (para búsquedas o recorridos completos)."""
+        while self.unexpanded:
+            self.expand(next(iter(self.unexpanded)))
+
+    def reader(self):
+        """Función que da los hijos de cualquier carpeta sin dejarlos en memoria.
+
+        Se queda con una copia de las carpetas pendientes, así que sirve para
+        escribir una copia congelada del árbol desde otro hilo.
+        """
+        unexpanded = dict(self.unexpanded)
+
+        def children_of(item):
+            if 'contents' in item:
+                return item['contents']
+            folder_no = unexpanded.get(item.get('id'))
+            return self.source.subtree(folder_no) if folder_no is not None else None
+        return children_of
+
+    def children(self, folder_id):
+        if folder_id is None:
+            return self.notes
+        folder = self.node(folder_id)
+        if folder_id in self.unexpanded:
+            self.expand(folder_id)
+        return folder.setdefault('contents', [])
+
+    def ancestors(self, item_id):
+        """Carpetas que contienen al elemento, desde la raíz."""
+        folders = []
+        parent_id = self.parents.get(item_id)
+        while parent_id is not None:
+            folders.append(self.nodes[parent_id])
+            parent_id = self.parents[parent_id]
+        folders.reverse()
+        return folders
+
+    def detach(self, item_id):
+        """Saca un elemento de la lista de su carpeta."""
+        item = self.node(item_id)
+        siblings = self.children(self.parents[item_id])
+        for i, sibling in enumerate(siblings):
+            if sibling is item:
+                del siblings[i]
+                break
+        return item
+
+    # Operaciones que aplican los registros del diario
+    def add(self, parent_id, item, index=None):
+        item = as_node(item)
+        siblings = self.children(parent_id)
+        if index is None:
+            siblings.append(item)
+        else:
+            siblings.insert(index, item)
+        self.register([item], parent_id)
+        self.compute_stats([item])
+        if self.views is not None:
+            self.views.add_subtree(item)
+        stats = item_stats(item)
+        self.adjust_stats(parent_id, stats.notes, stats.bytes, stats.favourites, stats.modified)
+        # Un elemento que vuelve (por ejemplo al deshacer) no puede copiarse de la instantánea
+        stack = [item]
+        while stack:
+            child = stack.pop()
+            if self.dirty is not None and child.get('id') is not None:
+                self.dirty.add(child['id'])
+            stack.extend(child.get('contents', []))
+        self.touch(parent_id)
+        if self.edits is not None:
+            self.edits.added(self.subtree_ids(item))
+            self.edits.reordered.add(parent_id)
+
+    def update(self, item_id, fields):
+        item = self.node(item_id)
+        old = item_stats(item)
+        indexed = self.views is not None and ('favourite' in fields or 'color' in fields)
+        if indexed:
+            self.views.remove(item)
+        self.update_item(item, fields)
+        if indexed:
+            self.views.add(item)
+        new = item_stats(item)
+        if new != old:
+            self.adjust_stats(self.parents[item_id], new.notes - old.notes, new.bytes - old.bytes,
+                              new.favourites - old.favourites, new.modified)
+        self.touch(item_id)
+        if self.edits is not None:
+            self.edits.changed(item_id, fields)
+
+    def update_item(self, item, fields):
+        if 'content' in fields:
+            # El texto nuevo sustituye a la referencia al fichero de contenidos
+            item.pop('body', None)
+        item.update(fields)
+
+    def delete(self, item_id, when=0):
+        self.touch(self.parents.get(item_id))
+        item = self.detach(item_id)
+        if self.views is not None:
+            # Las vistas tienen también lo que hay en las carpetas aún sin leer
+            self.expand_subtree(item)
+        stats = item_stats(item)
+        self.adjust_stats(self.parents.get(item_id), -stats.notes, -stats.bytes, -stats.favourites, when)
+        if self.views is not None:
+            self.views.remove_subtree(item)
+        if self.edits is not None:
+            self.edits.reordered.add(self.parents.get(item_id))
+            self.edits.removed.update(self.subtree_ids(item))
+        self.unregister(item)
+
+    def move(self, item_id, parent_id, index=None, when=0):
+        siblings = self.children(parent_id)
+        ancestor = parent_id
+        while ancestor is not None:
+            if ancestor == item_id:
+                raise ValueError("No se puede mover una carpeta dentro de sí misma")
+            ancestor = self.parents[ancestor]
+        self.touch(self.parents.get(item_id))
+        item = self.detach(item_id)
+        stats = item_stats(item)
+        self.adjust_stats(self.parents.get(item_id), -stats.notes, -stats.bytes, -stats.favourites, when)
+        if index is None:
+            siblings.append(item)
+        else:
+            siblings.insert(index, item)
+        if self.edits is not None:
+            self.edits.edited.add(item_id)
+            self.edits.moved.add(item_id)
+            self.edits.reordered.update((self.parents.get(item_id), parent_id))
+        self.parents[item_id] = parent_id
+        self.adjust_stats(parent_id, stats.notes, stats.bytes, stats.favourites, max(stats.modified, when))
+        self.touch(parent_id)
+
+    def clear(self):
+        if self.edits is not None:
+            self.edits.removed.update(self.nodes)
+            self.edits.reordered.add(None)
+        del self.notes[:]
+        if self.views is not None:
+            self.views.clear()
+        self.nodes = {}
+        self.parents = {}
+        self.unexpanded = {}
+        self.root_modified = 0
+
+
+class Edits:
+    """Cambios hechos por este proceso desde la última escritura de la instantánea."""
+
+    def __init__(self):
+        self.edited = set()  # Elementos con campos o posición propios cambiados
+        self.fields = {}  # Identificador -> campos cambiados aquí (None: todos, el elemento se añadió aquí)
+        self.moved = set()  # Elementos añadidos o cambiados de carpeta aquí
+        self.reordered = set()  # Carpetas (None es la raíz) cuya lista de hijos cambió
+        self.removed = set()  # Elementos borrados, con todo lo que contenían
+
+    def added(self, ids):
+        for item_id in ids:
+            self.edited.add(item_id)
+            self.moved.add(item_id)
+            self.fields[item_id] = None
+
+    def changed(self, item_id, fields):
+        self.edited.add(item_id)
+        if item_id not in self.fields:
+            self.fields[item_id] = set(fields)
+        elif self.fields[item_id] is not None:
+            self.fields[item_id].update(fields)
+
+    def owns(self, item_id, key):
+        """True si el campo `key` del elemento se cambió aquí (y en la fusión gana lo propio)."""
+        if item_id not in self.fields:
+            return False
+        fields = self.fields[item_id]
+        return fields is None or key in fields
+
+    def update(self, other):
+        self.edited |= other.edited
+        self.moved |= other.moved
+        self.reordered |= other.reordered
+        self.removed |= other.removed
+        for item_id, fields in other.fields.items():
+            if fields is None:
+                self.fields[item_id] = None
+            else:
+                self.changed(item_id, fields)
+
+    def __bool__(self):
+        return bool(self.edited or self.reordered or self.removed)
@@ -0,0 +1,103 @@
+import json
+import os
+
+from modules.database import atomic_write
+from modules.search import walk
+
+VIEWS_VERSION = 1
+# Color de las notas que nunca se colorearon; no tiene vista propia
+DEFAULT_COLOR = 'white'
+
+
+def views_file(data_file):
+    """Fichero de los índices de las vistas, junto a data.json."""
+    return data_file + '.views'
+
+
+class ViewIndex:
+    """Índices secundarios de las vistas "Favourites" y "By color".
+
+    Guarda el identificador de cada elemento favorito y, por color, el de
+    cada elemento de ese color (salvo el blanco por defecto, que sería el
+    árbol entero). El árbol los actualiza en cada cambio de favorito o de
+    color, así que abrir una vista no recorre ninguna carpeta. Se guardan
+    al cerrar junto con la huella de los ficheros de datos, como el índice
+    de búsqueda: si no coinciden al arrancar, se reconstruyen la primera
+    vez que se abre una vista.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.favourites = set()
+        self.colors = {}  # Color -> identificadores
+        self.dirty = True
+
+    def add(self, item):
+        item_id = item.get('id')
+        if item_id is None:
+            return
+        if item.get('favourite', False) is True:
+            self.favourites.add(item_id)
+        color = item.get('color')
+        if type(color) is str and color != DEFAULT_COLOR:
+            self.colors.setdefault(color, set()).add(item_id)
+        self.dirty = True
+
+    def remove(self, item):
+        item_id = item.get('id')
+        self.favourites.discard(item_id)
+        color = item.get('color')
+        ids = self.colors.get(color)
+        if ids is not None:
+            ids.discard(item_id)
+            if not ids:
+                del self.colors[color]
+        self.dirty = True
+
+    def add_subtree(self, item):
+        self.add(item)
+        for child in walk(item.get('contents', [])):
+            self.add(child)
+
+    def remove_subtree(self, item):
+        self.remove(item)
+        for child in walk(item.get('contents', [])):
+            self.remove(child)
+
+    def build(self, notes):
+        self.clear()
+        for item in walk(notes):
+            self.add(item)
+
+    def counts(self):
+        """Número de elementos de cada color."""
+        return {color: len(ids) for color, ids in self.colors.items()}
+
+    # Persistencia
+    def save(self, path, fingerprint):
+        data = {
+            'version': VIEWS_VERSION,
+            'fingerprint': fingerprint,
+            'favourites': sorted(self.favourites),
+            'colors': {color: sorted(ids) for color, ids in self.colors.items()},
+        }
+        atomic_write(path, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        self.dirty = False
+
+    def load(self, path, fingerprint):
+        """Carga los índices guardados si corresponden exactamente a estas notas."""
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (json.JSONDecodeError, IOError):
+            return False
+        if data.get('version') != VIEWS_VERSION or data.get('fingerprint') != fingerprint:
+            return False
+        self.favourites = set(data['favourites'])
+        self.colors = {color: set(ids) for color, ids in data['colors'].items()}
+        self.dirty = False
+        return True
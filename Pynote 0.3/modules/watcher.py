@@ -0,0 +1,106 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+from modules.locking import file_stamp
+from modules.metrics import log
+
+# Eventos de inotify que indican que un fichero cambió o se sustituyó
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT = struct.Struct('iIII')  # wd, mask, cookie, longitud del nombre
+
+
+def open_inotify(directories):
+    """Descriptor de inotify que vigila los directorios, o None si no está disponible."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    for directory in directories:
+        if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+class FileWatcher:
+    """Avisa cuando otro proceso cambia alguno de los ficheros del almacén.
+
+    Con inotify (Linux) un hilo espera los eventos del directorio sin coste;
+    en otros sistemas compara cada `interval` segundos el tamaño, la fecha y
+    el inodo de cada fichero. El aviso solo levanta una bandera que la
+    interfaz consulta con changed(): la comprobación real la hace el
+    almacén, que sabe distinguir sus propias escrituras.
+    """
+
+    def __init__(self, paths, interval=1.0):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.names = {os.path.basename(path) for path in self.paths}
+        self.interval = interval
+        self.flag = threading.Event()
+        self.stopped = threading.Event()
+        self.fd = open_inotify({os.path.dirname(path) for path in self.paths})
+        self.mode = 'inotify' if self.fd is not None else 'polling'
+        target = self.run_inotify if self.fd is not None else self.run_polling
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+
+    def changed(self):
+        """True si hubo algún cambio desde la última consulta."""
+        if self.flag.is_set():
+            self.flag.clear()
+            return True
+        return False
+
+    def run_inotify(self):
+        try:
+            while not self.stopped.is_set():
+                ready, _, _ = select.select([self.fd], [], [], self.interval)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset < len(data):
+                    wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+                    name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+                    offset += EVENT.size + length
+                    if os.fsdecode(name) in self.names:
+                        self.flag.set()
+        except OSError as e:
+            log.warning("inotify dejó de funcionar, se pasa a consultar los ficheros: %s", e)
+            self.mode = 'polling'
+            self.run_polling()
+        finally:
+            os.close(self.fd)
+
+    def run_polling(self):
+        stamps = [file_stamp(path) for path in self.paths]
+        while not self.stopped.wait(self.interval):
+            current = [file_stamp(path) for path in self.paths]
+            if current != stamps:
+                stamps = current
+                self.flag.set()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from modules.binary import ROOT, BinarySnapshot, binary_to_json, write_binary  # noqa: E402
+from modules.codec import BodyCodec  # noqa: E402
+from modules.snapshot import read_snapshot  # noqa: E402
+from modules.store import JsonStore  # noqa: E402
+
+
+def sample_tree():
+    return [
+        {'title': 'Inbox', 'is_folder': True, 'id': 'a', 'color': '#ffcccc', 'contents': [
+            {'title': 'Vacía', 'is_folder': True, 'id': 'b', 'contents': []},
+            {'title': 'Larga', 'content': 'línea de texto\n' * 2000, 'id': 'c', 'favourite': True},
+            {'title': 'Extra', 'content': 'con campos propios', 'id': 'd', 'modified': 12.5, 'tags': ['x']}]},
+        {'title': 'Raíz', 'content': '', 'id': 'e'},
+        {'title': 'Sin id', 'content': 'de una versión anterior'},
+    ]
+
+
+def plain(items):
+    return [{key: plain(value) if key == 'contents' else value for key, value in item.items()} for item in items]
+
+
+class BinarySnapshotTest(unittest.TestCase):
+    """Una generación binaria devuelve el mismo árbol, entero o carpeta a carpeta."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'data.pnb.1')
+        write_binary(sample_tree(), self.path, codec=BodyCodec(threshold=1024))
+        self.snapshot = BinarySnapshot(self.path)
+
+    def tearDown(self):
+        self.snapshot.close()
+
+    def test_read_all(self):
+        self.assertEqual(plain(self.snapshot.read_all(content=True)), sample_tree())
+        # Sin content=True las notas llevan la referencia a su texto
+        notes = self.snapshot.read_all()
+        self.assertEqual(self.snapshot.read(notes[0]['contents'][1]['body']), 'línea de texto\n' * 2000)
+
+    def test_lazy_folders(self):
+        notes, pending = self.snapshot.children(ROOT)
+        self.assertEqual([item['title'] for item in notes], ['Inbox', 'Raíz', 'Sin id'])
+        self.assertNotIn('contents', notes[0])
+        children, nested = self.snapshot.children(pending['a'])
+        self.assertEqual([item['title'] for item in children], ['Vacía', 'Larga', 'Extra'])
+        self.assertEqual(self.snapshot.folder_id(pending['a']), 'a')
+        self.assertEqual(self.snapshot.locate('d'), pending['a'])
+        self.assertIsNone(self.snapshot.locate('zz'))
+
+    def test_to_json(self):
+        data_file = os.path.join(self.directory, 'data.json')
+        binary_to_json(os.path.join(self.directory, 'data.pnb'), data_file)
+        self.assertEqual(plain(read_snapshot(data_file)), sample_tree())
+
+    def test_bad_file(self):
+        path = os.path.join(self.directory, 'data.pnb.2')
+        with open(path, 'wb') as file:
+            file.write(b'NOTPYNOTE' + bytes(64))
+        with self.assertRaises(ValueError):
+            BinarySnapshot(path)
+
+
+class BinaryStoreTest(unittest.TestCase):
+    """El almacén con instantánea binaria conserva los cambios al volver a abrirlo."""
+
+    def open_store(self, journal):
+        return JsonStore(os.path.join(self.directory, 'data.json'), os.path.join(self.directory, 'data.journal'),
+                         journal=journal, autosave_delay=3600, snapshot='binary',
+                         index_file=os.path.join(self.directory, 'index.json'))
+
+    def test_reopen(self):
+        self.directory = tempfile.mkdtemp()
+        for journal in (True, False):
+            store = self.open_store(journal)
+            store.load()
+            folder = store.add(None, {'title': f'Carpeta {journal}', 'is_folder': True, 'contents': []})
+            store.add(folder, {'title': 'Nota', 'content': 'texto ' * 1000})
+            store.close()
+        store = self.open_store(True)
+        store.load()
+        folders = store.children(None)
+        self.assertEqual([item['title'] for item in folders], ['Carpeta True', 'Carpeta False'])
+        for folder in folders:
+            note = store.children(folder)[0]
+            self.assertEqual(store.content(note), 'texto ' * 1000)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
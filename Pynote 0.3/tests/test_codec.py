@@ -0,0 +1,86 @@
+import io
+import os
+import sys
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from modules.codec import RAW, ZLIB, BodyCodec, body_report, body_size, decode  # noqa: E402
+
+TEXTS = ['corto', 'ñandú ' * 2000, 'repetido ' * 100, 'repetido ' * 100, bytes(range(256)).hex() * 30, '']
+
+
+def read(file, ref):
+    return decode(file.getvalue()[ref[0]:ref[0] + ref[1]], ref)
+
+
+class BodyCodecTest(unittest.TestCase):
+    """Cada referencia devuelve su texto, comprimido o no, y los repetidos se guardan una vez."""
+
+    def test_round_trip(self):
+        for method in ('zlib', 'lzma', 'none'):
+            file = io.BytesIO()
+            writer = BodyCodec(method, threshold=1024).writer(file)
+            refs = [writer.add(text) for text in TEXTS]
+            self.assertEqual([read(file, ref) for ref in refs], TEXTS)
+            self.assertEqual([body_size(ref) for ref in refs], [len(text.encode('utf-8')) for text in TEXTS])
+            self.assertEqual(refs[2], refs[3])
+            self.assertEqual(writer.deduplicated, 1)
+
+    def test_compression(self):
+        file = io.BytesIO()
+        writer = BodyCodec('zlib', threshold=1024).writer(file)
+        small, large = writer.add('a' * 1000), writer.add('a' * 5000)
+        self.assertEqual((len(small), len(large)), (2, 4))
+        self.assertEqual(large[2:], [ZLIB, 5000])
+        self.assertLess(large[1], 5000)
+        # Lo que no se comprime bien se guarda tal cual
+        self.assertEqual(BodyCodec('zlib').compress(os.urandom(5000))[1], RAW)
+        self.assertEqual(BodyCodec('none').compress(b'a' * 5000)[1], RAW)
+
+    def test_no_dedup(self):
+        file = io.BytesIO()
+        writer = BodyCodec(dedup=False).writer(file)
+        first, second = writer.add(TEXTS[2]), writer.add(TEXTS[3])
+        self.assertNotEqual(first[0], second[0])
+        self.assertEqual(read(file, second), TEXTS[3])
+
+    def test_existing_generation(self):
+        # Al añadir a una generación, sus huellas evitan volver a escribir lo que ya tiene
+        file = io.BytesIO()
+        writer = BodyCodec().writer(file)
+        ref = writer.add(TEXTS[1])
+        size = file.tell()
+        writer = BodyCodec().writer(file, dict(writer.seen))
+        self.assertEqual(writer.add(TEXTS[1]), ref)
+        self.assertEqual(file.tell(), size)
+        self.assertEqual(read(file, writer.add('otro ' * 100)), 'otro ' * 100)
+
+    def test_report(self):
+        file = io.BytesIO()
+        writer = BodyCodec(threshold=1024).writer(file)
+        items = [{'title': str(i), 'body': writer.add(text)} for i, text in enumerate(TEXTS[1:4])]
+        items.append({'title': 'cargada', 'content': 'ñ' * 10})
+        report = body_report(items + [{'title': 'carpeta', 'is_folder': True}], cache_bytes=100)
+        sizes = [len(text.encode('utf-8')) for text in TEXTS[1:4]]
+        self.assertEqual((report['text_notes'], report['text_bytes'], report['text_unique_bodies']),
+                         (4, sum(sizes) + 20, 2))
+        self.assertEqual(report['text_on_disk_bytes'], file.tell() + 20)
+        self.assertEqual(report['text_saved_by_dedup'], sizes[2])
+        self.assertEqual(report['text_saved_by_compression'], sizes[0] + sizes[1] - file.tell())
+        self.assertEqual(report['text_in_memory_bytes'], 120)
+        # Si los textos también están tal cual en otro fichero no hay ahorro que contar
+        inline = body_report(items, inline=True)
+        self.assertNotIn('text_on_disk_bytes', inline)
+        self.assertNotIn('text_saved_by_dedup', inline)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            BodyCodec('bz2')
+        with self.assertRaises(ValueError):
+            decode(b'', [0, 0, 9, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
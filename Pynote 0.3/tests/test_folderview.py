@@ -0,0 +1,96 @@
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from modules.folderview import SHOWS, SORTS, FolderView  # noqa: E402
+from modules.store import JsonStore  # noqa: E402
+
+COLORS = ('white', '#ffcccc', '#ccffcc')
+
+
+class FolderViewTest(unittest.TestCase):
+    """Colocar cada cambio con bisect deja la misma lista que volver a ordenar la carpeta."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.store = JsonStore(os.path.join(directory, 'data.json'), os.path.join(directory, 'data.journal'),
+                               journal=False, autosave_delay=3600, index_file=os.path.join(directory, 'index.json'))
+        self.store.load()
+        self.rng = random.Random(1)
+        self.count = 0
+        self.folder = self.store.add(None, {'title': 'carpeta', 'is_folder': True, 'contents': []})
+        for i in range(30):
+            self.add()
+
+    def tearDown(self):
+        self.store.close()
+
+    def title(self):
+        # Títulos distintos: con la misma clave el orden entre ellos no está definido
+        self.count += 1
+        return self.rng.choice(['alfa', 'Beta', 'gamma', 'Ñu', 'Sub']) + str(self.count)
+
+    def add(self):
+        if self.rng.random() < 0.2:
+            item = {'title': self.title(), 'is_folder': True, 'contents': []}
+        else:
+            item = {'title': self.title(),
+                    'content': 'x' * self.rng.randint(0, 500), 'color': self.rng.choice(COLORS),
+                    'favourite': self.rng.random() < 0.3}
+        return self.store.add(self.folder, item)
+
+    def change(self, views):
+        children = self.store.children(self.folder)
+        action = self.rng.random()
+        if action < 0.3:
+            item = self.add()
+            for view in views:
+                view.add(item)
+            return
+        item = self.rng.choice(children)
+        if action < 0.45:
+            for view in views:
+                view.remove(item)
+            self.store.delete(item)
+            return
+        if action < 0.6:
+            self.store.update(item, title=self.title())
+        elif action < 0.7:
+            self.store.update(item, color=self.rng.choice(COLORS))
+        elif action < 0.8:
+            self.store.update(item, favourite=not item.get('favourite', False))
+        elif 'contents' in item:
+            self.store.add(item, {'title': 'dentro', 'content': 'y' * 300})
+        else:
+            self.store.update(item, content='z' * self.rng.randint(0, 900))
+        for view in views:
+            view.update(item)
+
+    def test_matches_rebuild(self):
+        views = [FolderView(self.store, self.folder, sort, reverse, show)
+                 for sort in SORTS for show in SHOWS for reverse in (False, True)]
+        for step in range(60):
+            self.change(views)
+            for view in views:
+                fresh = FolderView(self.store, self.folder, view.sort, view.reverse, view.show)
+                self.assertEqual([item['id'] for item in view.items()], [item['id'] for item in fresh.items()],
+                                 (view.sort, view.show, view.reverse, step))
+                self.assertEqual([item['id'] for item in view.items('a')], [item['id'] for item in fresh.items('a')])
+
+    def test_filter_while_typing(self):
+        view = FolderView(self.store, self.folder, 'title')
+        for text in ('a', 'al', 'alf', 'al', ''):
+            expected = [item for item in view.visible() if text in item['title'].casefold()]
+            self.assertEqual(view.items(text), expected)
+        self.add()
+        view.add(self.store.children(self.folder)[-1])
+        self.assertEqual(view.items('alf'), [item for item in view.visible() if 'alf' in item['title'].casefold()])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from modules.history import History  # noqa: E402
+from modules.sqlite_store import SqliteStore  # noqa: E402
+from modules.store import JsonStore  # noqa: E402
+
+
+class HistoryRestartTest(unittest.TestCase):
+    """Deshacer y rehacer siguen funcionando después de cerrar y volver a abrir el almacén."""
+
+    def open(self):
+        if self.backend == 'sqlite':
+            store = SqliteStore(db_file=os.path.join(self.directory, 'data.db'))
+        else:
+            store = JsonStore(os.path.join(self.directory, 'data.json'), os.path.join(self.directory, 'data.journal'),
+                              journal=self.backend == 'journal', autosave_delay=3600,
+                              index_file=os.path.join(self.directory, 'index.json'))
+        store.load()
+        history = History(store, store.history_file())
+        history.load()
+        return store, history
+
+    def tree(self, store, folder=None):
+        return [(item['title'], self.tree(store, item) if item.get('is_folder') else store.content(item))
+                for item in store.children(folder)]
+
+    def check(self, backend):
+        self.backend = backend
+        self.directory = tempfile.mkdtemp()
+        store, history = self.open()
+        folder = history.add(None, {'title': 'carpeta', 'is_folder': True, 'contents': []})
+        note = history.add(folder, {'title': 'nota', 'content': 'texto'})
+        history.add(None, {'title': 'suelta', 'content': 'otra'})
+        states = [self.tree(store)]
+        history.update(note, content='texto nuevo')
+        states.append(self.tree(store))
+        history.move(note, None, 0)
+        states.append(self.tree(store))
+        history.delete(store.get(folder['id']))
+        states.append(self.tree(store))
+        store.close()
+
+        # Se deshace todo en una sesión nueva y se rehace en otra
+        store, history = self.open()
+        self.assertEqual(self.tree(store), states[-1])
+        for state in reversed(states[:-1]):
+            self.assertEqual(history.undo()[1], 0)
+            self.assertEqual(self.tree(store), state)
+        store.close()
+
+        store, history = self.open()
+        self.assertEqual(self.tree(store), states[0])
+        self.assertEqual(history.label(undoing=False), "Edit 'nota'")
+        for state in states[1:]:
+            history.redo()
+            self.assertEqual(self.tree(store), state)
+        self.assertIsNone(history.redo())
+        store.close()
+
+    def test_autosave(self):
+        self.check('autosave')
+
+    def test_journal(self):
+        self.check('journal')
+
+    def test_sqlite(self):
+        self.check('sqlite')
+
+
+if __name__ == '__main__':
+    unittest.main()
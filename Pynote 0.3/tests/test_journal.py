@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from modules.journal import read_journal  # noqa: E402
+from modules.store import JsonStore  # noqa: E402
+
+
+class JournalTest(unittest.TestCase):
+    """Los cambios del diario se reproducen al cargar y la compactación los pasa a la instantánea."""
+
+    def open_store(self, snapshot, compact_after=1000):
+        return JsonStore(os.path.join(self.directory, 'data.json'), os.path.join(self.directory, 'data.journal'),
+                         compact_after=compact_after, snapshot=snapshot,
+                         index_file=os.path.join(self.directory, 'index.json'))
+
+    def titles(self, store):
+        return [(item['title'], store.content(item)) for item in store.children(None)]
+
+    def check_replay(self, snapshot):
+        self.directory = tempfile.mkdtemp()
+        store = self.open_store(snapshot)
+        store.load()
+        first = store.add(None, {'title': 'uno', 'content': 'primero'})
+        second = store.add(None, {'title': 'dos', 'content': 'segundo'})
+        store.update(first, content='cambiado')
+        store.move(second, None, 0)
+        store.delete(store.add(None, {'title': 'tres', 'content': 'borrada'}))
+        expected = self.titles(store)
+        # Sin cerrar, como tras un corte: todo está solo en el diario
+        store.journal.file.close()
+        if store.journal.bodies is not None:
+            store.journal.bodies.close()
+        journal_file = os.path.join(self.directory, 'data.journal')
+        self.assertEqual(len(read_journal(journal_file)), 6)
+        with open(journal_file, 'ab') as file:
+            file.write(b'{"op": "update", "id"')
+
+        store = self.open_store(snapshot)
+        store.load()
+        self.assertEqual(self.titles(store), expected)
+        store.close()
+        self.assertEqual(len(read_journal(journal_file)), 6)
+
+    def test_replay_json(self):
+        self.check_replay('json')
+
+    def test_replay_binary(self):
+        self.check_replay('binary')
+
+    def check_compaction(self, snapshot):
+        self.directory = tempfile.mkdtemp()
+        store = self.open_store(snapshot, compact_after=5)
+        store.load()
+        folder = store.add(None, {'title': 'carpeta', 'is_folder': True, 'contents': []})
+        notes = []
+        for i in range(16):
+            if i < 12:
+                notes.append(store.add(folder, {'title': f'nota {i}', 'content': f'texto {i}'}))
+            else:
+                store.update(notes[i - 12], title=f'nota {i - 12} bis')
+            # Una compactación a la vez: cada cinco registros el diario vuelve a empezar
+            store.journal.wait()
+        journal_file = os.path.join(self.directory, 'data.journal')
+        self.assertFalse(os.path.exists(journal_file + '.1'))
+        self.assertEqual(len(read_journal(journal_file)), 2)
+        expected = [(item['title'], store.content(item)) for item in store.children(folder)]
+        store.close()
+
+        # La instantánea compactada tiene todo menos los dos últimos cambios
+        os.remove(journal_file)
+        store = self.open_store(snapshot)
+        store.load()
+        folder = store.children(None)[0]
+        found = [(item['title'], store.content(item)) for item in store.children(folder)]
+        self.assertEqual(found[:2] + found[4:], expected[:2] + expected[4:])
+        self.assertEqual([title for title, content in found[:4]], ['nota 0 bis', 'nota 1 bis', 'nota 2', 'nota 3'])
+        store.close()
+
+    def test_compaction_json(self):
+        self.check_compaction('json')
+
+    def test_compaction_binary(self):
+        self.check_compaction('binary')
+
+
+if __name__ == '__main__':
+    unittest.main()
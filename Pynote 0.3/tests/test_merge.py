@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from modules.store import JsonStore  # noqa: E402
+
+# El otro proceso: carga, avisa, espera la orden y cambia el texto de la nota
+OTHER = '''
+import os, sys
+sys.path.insert(0, sys.argv[1])
+from modules.store import JsonStore
+directory, snapshot = sys.argv[2], sys.argv[3]
+store = JsonStore(os.path.join(directory, 'data.json'), os.path.join(directory, 'data.journal'),
+                  journal=False, autosave_delay=0.01, index_file=os.path.join(directory, 'index.json'),
+                  snapshot=snapshot)
+store.load()
+print('ready', flush=True)
+sys.stdin.readline()
+note = store.children(None)[0]
+store.update(note, content='text from B')
+store.flush()
+store.close()
+'''
+
+
+def open_store(directory, snapshot):
+    return JsonStore(os.path.join(directory, 'data.json'), os.path.join(directory, 'data.journal'),
+                     journal=False, autosave_delay=0.01, index_file=os.path.join(directory, 'index.json'),
+                     snapshot=snapshot)
+
+
+class AutosaveMergeTest(unittest.TestCase):
+    """Dos procesos en modo autoguardado cambian campos distintos de la misma nota."""
+
+    def check(self, snapshot):
+        directory = tempfile.mkdtemp()
+        store = open_store(directory, snapshot)
+        store.load()
+        store.add(None, {'title': 'old title', 'content': 'old text'})
+        store.close()
+
+        store = open_store(directory, snapshot)
+        store.load()
+        other = subprocess.Popen([sys.executable, '-c', OTHER, APP_DIR, directory, snapshot],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        try:
+            self.assertEqual(other.stdout.readline().strip(), 'ready')
+            # A renombra y guarda; después B, que cargó antes, cambia el texto y guarda
+            store.update(store.children(None)[0], title='title from A')
+            store.flush()
+            other.stdin.write('go\n')
+            other.stdin.close()
+            self.assertEqual(other.wait(timeout=60), 0)
+        finally:
+            if other.poll() is None:
+                other.kill()
+            other.stdout.close()
+        store.sync()
+        note = store.children(None)[0]
+        self.assertEqual((note['title'], store.content(note)), ('title from A', 'text from B'))
+        store.close()
+
+        store = open_store(directory, snapshot)
+        store.load()
+        note = store.children(None)[0]
+        self.assertEqual((note['title'], store.content(note)), ('title from A', 'text from B'))
+        store.close()
+
+    def test_json(self):
+        self.check('json')
+
+    def test_binary(self):
+        self.check('binary')
+
+
+if __name__ == '__main__':
+    unittest.main()
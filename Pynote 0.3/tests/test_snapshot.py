@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from modules.metrics import metrics  # noqa: E402
+from modules.snapshot import BodyFile, bodies_file, read_meta, read_snapshot, write_snapshot  # noqa: E402
+from modules.store import JsonStore  # noqa: E402
+
+
+def open_store(directory):
+    return JsonStore(os.path.join(directory, 'data.json'), os.path.join(directory, 'data.journal'),
+                     journal=False, autosave_delay=3600, index_file=os.path.join(directory, 'index.json'))
+
+
+def sample_tree():
+    shared = 'plantilla compartida ' * 40
+    return [{'title': f'Folder {i}', 'is_folder': True, 'id': f'f{i}', 'contents': [
+        {'title': f'Sub {i}', 'is_folder': True, 'id': f's{i}', 'contents': [
+            {'title': f'Note {i}.{j}', 'content': shared if j % 2 else f'texto {i}.{j}', 'id': f'n{i}.{j}'}
+            for j in range(4)]},
+        {'title': f'Top {i}', 'content': 'x' * (i * 1000), 'id': f't{i}'}]} for i in range(6)]
+
+
+def copied():
+    return metrics.snapshot()['counters'].get('fragments_copied', 0)
+
+
+class FragmentCopyTest(unittest.TestCase):
+    """Guardar copiando lo que no cambió deja los mismos ficheros que escribirlo todo."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.directory, 'data.json')
+        with open(self.data_file, 'w') as file:
+            json.dump(sample_tree(), file)
+        store = open_store(self.directory)
+        store.load()
+        store.save_snapshot()
+        store.close()
+
+    def check_files(self):
+        """data.json igual al de una escritura completa y un índice cuyos textos son los de data.json."""
+        notes = read_snapshot(self.data_file)
+        full = os.path.join(tempfile.mkdtemp(), 'data.json')
+        write_snapshot(notes, full)
+        with open(self.data_file) as file, open(full) as expected:
+            self.assertEqual(file.read(), expected.read())
+        meta = read_meta(self.data_file)
+        self.assertIsNotNone(meta)
+        bodies = BodyFile(bodies_file(self.data_file, meta))
+
+        def compare(indexed, items):
+            self.assertEqual(len(indexed), len(items))
+            for entry, item in zip(indexed, items):
+                self.assertEqual(set(entry) - {'body'}, set(item) - {'content'})
+                for key, value in item.items():
+                    if key == 'content':
+                        self.assertEqual(bodies.read(entry['body']), value)
+                    elif key == 'contents':
+                        compare(entry[key], value)
+                    else:
+                        self.assertEqual(entry[key], value)
+
+        compare(meta['notes'], notes)
+        bodies.close()
+        return notes
+
+    def titles(self, store, folder=None):
+        return [(item['title'], store.content(item) if 'contents' not in item else self.titles(store, item))
+                for item in store.children(folder)]
+
+    def test_edits(self):
+        store = open_store(self.directory)
+        store.load()
+        before = copied()
+        store.update(store.get('n2.1'), title='renombrada')
+        store.save_snapshot()
+        self.assertGreater(copied(), before)
+        self.check_files()
+
+        store.update(store.get('t3'), content='texto nuevo')
+        store.move(store.get('s1'), store.get('f4'), 0)
+        store.move(store.get('f5'), None, 0)
+        store.delete(store.get('n0.2'))
+        store.add(store.get('s2'), {'title': 'nueva', 'content': 'plantilla compartida ' * 40}, 1)
+        store.copy(store.get('f3'), store.get('s4'))
+        store.save_snapshot()
+        expected = self.titles(store)
+        store.close()
+        self.check_files()
+
+        store = open_store(self.directory)
+        store.load()
+        self.assertEqual(self.titles(store), expected)
+        store.close()
+
+    def test_restart(self):
+        # Las posiciones se guardan al cerrar: el siguiente proceso también copia
+        store = open_store(self.directory)
+        store.load()
+        store.update(store.get('n4.0'), title='tras reiniciar')
+        before = copied()
+        store.save_snapshot()
+        self.assertGreater(copied(), before)
+        store.close()
+        self.assertEqual(self.check_files()[4]['contents'][0]['contents'][0]['title'], 'tras reiniciar')
+
+    def test_disk_bytes(self):
+        store = open_store(self.directory)
+        store.load()
+        stats = store.stats()
+        store.close()
+        files = [name for name in os.listdir(self.directory) if name.startswith('data.')]
+        self.assertIn('data.json.spans', files)
+        self.assertEqual(stats['disk_bytes'], sum(os.path.getsize(os.path.join(self.directory, name))
+                                                  for name in files))
+        # data.json lleva los textos además de la generación: no se cuenta ningún ahorro
+        self.assertNotIn('text_saved_by_compression', stats)
+
+    def test_external_write(self):
+        # Si otro programa reescribe data.json las posiciones guardadas no valen
+        notes = read_snapshot(self.data_file)
+        notes[0]['title'] = 'cambiado fuera'
+        with open(self.data_file, 'w') as file:
+            json.dump(notes, file, indent=2, default=dict)
+        store = open_store(self.directory)
+        store.load()
+        store.update(store.get('n1.1'), title='cambiado dentro')
+        store.save_snapshot()
+        store.close()
+        notes = self.check_files()
+        self.assertEqual((notes[0]['title'], notes[1]['contents'][0]['contents'][1]['title']),
+                         ('cambiado fuera', 'cambiado dentro'))
+
+
+if __name__ == '__main__':
+    unittest.main()
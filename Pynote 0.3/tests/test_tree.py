@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from modules.sqlite_store import SqliteStore  # noqa: E402
+from modules.store import JsonStore  # noqa: E402
+from modules.tree import TreeIndex  # noqa: E402
+
+
+class RootStatsTest(unittest.TestCase):
+    """La fecha del último cambio en la raíz cuenta los borrados, como la fila de la raíz en SQLite."""
+
+    def test_tree(self):
+        tree = TreeIndex([])
+        tree.add(None, {'title': 'a', 'content': 'x', 'id': 'a', 'modified': 10})
+        tree.add(None, {'title': 'b', 'is_folder': True, 'contents': [], 'id': 'b', 'modified': 20})
+        tree.add('b', {'title': 'c', 'content': 'y', 'id': 'c', 'modified': 30})
+        self.assertEqual(tree.folder_stats(None).modified, 30)
+        tree.delete('a', when=50)
+        self.assertEqual(tree.folder_stats(None), (1, 1, 0, 50))
+        tree.move('c', None, when=60)
+        self.assertEqual((tree.folder_stats(None).modified, tree.folder_stats('b').modified), (60, 60))
+        tree.clear()
+        self.assertEqual(tree.folder_stats(None), (0, 0, 0, 0))
+
+    def open_store(self, directory, kind, journal):
+        if kind == 'sqlite':
+            return SqliteStore(db_file=os.path.join(directory, 'data.db'))
+        return JsonStore(os.path.join(directory, 'data.json'), os.path.join(directory, 'data.journal'),
+                         journal=journal, autosave_delay=3600, snapshot=kind,
+                         index_file=os.path.join(directory, 'index.json'))
+
+    def deleted_at(self, kind, journal):
+        """Borra la única nota de la raíz y devuelve la fecha de la raíz antes y después de reabrir."""
+        directory = tempfile.mkdtemp()
+        store = self.open_store(directory, kind, journal)
+        store.load()
+        store.add(None, {'title': 'nota', 'content': 'texto', 'modified': 1})
+        store.delete(store.children(None)[0])
+        modified = store.folder_stats(None).modified
+        store.close()
+        if os.path.exists(os.path.join(directory, 'data.journal')):
+            # Sin el diario, la fecha solo puede venir de la instantánea
+            store = self.open_store(directory, kind, journal)
+            store.load()
+            store.journal.fold()
+            store.close()
+        store = self.open_store(directory, kind, journal)
+        store.load()
+        reopened = store.folder_stats(None).modified
+        store.close()
+        return modified, reopened, directory
+
+    def test_persisted(self):
+        for kind, journal in (('json', False), ('binary', False), ('json', True), ('binary', True), ('sqlite', True)):
+            modified, reopened, directory = self.deleted_at(kind, journal)
+            self.assertGreater(modified, 1, kind)
+            self.assertEqual(reopened, modified, kind)
+
+    def test_format_change(self):
+        modified, reopened, directory = self.deleted_at('json', False)
+        for kind in ('binary', 'json'):
+            store = self.open_store(directory, kind, False)
+            store.load()
+            self.assertEqual(store.folder_stats(None).modified, modified, kind)
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()